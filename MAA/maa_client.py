@@ -0,0 +1,437 @@
+import argparse
+import base64
+import http.client
+import json
+import queue
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa, utils
+
+DEFAULT_API_VERSION = "2022-08-01"
+DEFAULT_MAX_CONNECTIONS = 8
+DEFAULT_TIMEOUT = 30  # seconds
+DEFAULT_KEYS_TTL = 3600  # seconds
+MIN_REFRESH_INTERVAL = 30  # seconds between refreshes for unknown key IDs
+DEFAULT_LEEWAY = 60  # seconds of clock skew accepted on exp/nbf
+
+# JWS algorithms accepted in MAA tokens
+ALGORITHMS = {
+    'RS256': hashes.SHA256,
+    'RS384': hashes.SHA384,
+    'RS512': hashes.SHA512,
+    'ES256': hashes.SHA256,
+    'ES384': hashes.SHA384,
+}
+
+def b64url_encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+def b64url_decode(data):
+    if isinstance(data, str):
+        data = data.encode()
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+"""
+Build the MAA request of an SEV-SNP VM (as azure-snp-ra-by-maa.sh does)
+@param report: SEV-SNP attestation report in bytes
+@param vcek_cert_chain: VCEK certificate and chain in PEM (from the THIM endpoint)
+@param runtime_claims: Runtime claims JSON in bytes (from the Azure attestation report)
+@param nonce: Nonce string
+@return: Request payload (JSON-serializable)
+"""
+def snp_payload(report, vcek_cert_chain, runtime_claims, nonce):
+    report_json = json.dumps({'SnpReport': b64url_encode(report), 'VcekCertChain': b64url_encode(vcek_cert_chain)})
+    return {
+        'report': b64url_encode(report_json.encode()),
+        'runtimeData': {'data': b64url_encode(runtime_claims), 'dataType': 'JSON'},
+        'nonce': nonce,
+    }
+
+"""
+Build the MAA request of a TDX VM (as azure-tdx-ra-by-maa.sh does)
+@param quote: TD quote in bytes
+@param runtime_claims: Runtime claims JSON in bytes (from the Azure attestation report)
+@param nonce: Nonce string
+@return: Request payload (JSON-serializable)
+"""
+def tdx_payload(quote, runtime_claims, nonce):
+    return {
+        'quote': b64url_encode(quote),
+        'runtimeData': {'data': b64url_encode(runtime_claims), 'dataType': 'JSON'},
+        'nonce': nonce,
+    }
+
+"""
+Pool of keep-alive HTTP(S) connections to one host. Connections are reused across requests
+and threads; a connection the server has closed is replaced and the request retried once.
+@param base_url: Base URL (scheme, host and port)
+@param max_connections: Maximum number of connections
+@param timeout: Socket timeout in seconds
+"""
+class ConnectionPool:
+    def __init__(self, base_url, max_connections=DEFAULT_MAX_CONNECTIONS, timeout=DEFAULT_TIMEOUT):
+        url = urlparse(base_url)
+        if url.scheme not in ("http", "https"):
+            raise Exception(f"Unsupported URL scheme: {url.scheme}")
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            self.connections_opened += 1
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    """
+    Send a request
+    @param method: HTTP method
+    @param path: Path and query
+    @param body: Body in bytes, or None
+    @param headers: Dictionary of headers
+    @return: (status, body in bytes)
+    """
+    def request(self, method, path, body=None, headers=None):
+        with self._slots:
+            try:
+                connection, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                connection, reused = self._connect(), False
+            try:
+                try:
+                    status, data = self._send(connection, method, path, body, headers)
+                except (http.client.RemoteDisconnected, ConnectionError, http.client.CannotSendRequest):
+                    connection.close()
+                    if not reused:
+                        raise
+                    # The server closed an idle connection; retry once on a fresh one
+                    connection = self._connect()
+                    status, data = self._send(connection, method, path, body, headers)
+            except Exception:
+                connection.close()
+                raise
+            self._idle.put(connection)
+            return status, data
+
+    def _send(self, connection, method, path, body, headers):
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        data = response.read()
+        if response.will_close:
+            connection.close()
+        return response.status, data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+"""
+Client of an MAA provider
+@param base_url: MAA provider URI (e.g. https://sharedeus.eus.attest.azure.net)
+@param api_version: API version
+@param max_connections: Maximum number of keep-alive connections
+@param timeout: Socket timeout in seconds
+"""
+class MaaClient:
+    def __init__(self, base_url, api_version=DEFAULT_API_VERSION, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.api_version = api_version
+        self.pool = ConnectionPool(self.base_url, max_connections, timeout)
+
+    """
+    Send evidence to the MAA provider
+    @param tee_type: TEE type of the endpoint (e.g. "SevSnpVm", "TdxVm")
+    @param payload: Request payload (see snp_payload and tdx_payload)
+    @return: Attestation token (JWT)
+    """
+    def attest(self, tee_type, payload):
+        status, data = self.pool.request(
+            "POST", f"/attest/{tee_type}?api-version={self.api_version}",
+            body=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'},
+        )
+        if status != 200:
+            raise Exception(f"MAA attestation failed with HTTP {status}: {data[:200].decode(errors='replace')}")
+        return json.loads(data)['token']
+
+    """
+    Fetch the token signing keys of the MAA provider
+    @return: JWKS (parsed JSON)
+    """
+    def fetch_signing_keys(self):
+        status, data = self.pool.request("GET", "/certs", headers={'Accept': 'application/json'})
+        if status != 200:
+            raise Exception(f"Fetching the MAA signing keys failed with HTTP {status}")
+        return json.loads(data)
+
+    def close(self):
+        self.pool.close()
+
+"""
+Load the public keys of a JWKS. MAA publishes each key as a certificate (x5c).
+@param jwks: JWKS (parsed JSON)
+@return: Dictionary of key ID to public key
+"""
+def load_jwks(jwks):
+    keys = {}
+    for jwk in jwks.get('keys', []):
+        if not jwk.get('x5c'):
+            continue
+        cert = x509.load_der_x509_certificate(base64.b64decode(jwk['x5c'][0]), default_backend())
+        keys[jwk.get('kid')] = cert.public_key()
+    return keys
+
+"""
+Cache of the token signing keys of an MAA provider. Keys are kept for a TTL; after that, the
+stale keys are still served while one background refresh runs. A token signed with an unknown
+key ID triggers a synchronous refresh, at most once per MIN_REFRESH_INTERVAL.
+@param fetch: Function returning the JWKS (e.g. MaaClient.fetch_signing_keys)
+@param ttl: Lifetime of the keys in seconds
+"""
+class SigningKeyCache:
+    def __init__(self, fetch, ttl=DEFAULT_KEYS_TTL):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.refreshes = 0
+        self._keys = {}
+        self._fetched_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    """
+    Get the public key of a key ID
+    @param kid: Key ID from the token header
+    @return: Public key
+    """
+    def get(self, kid):
+        now = time.monotonic()
+        with self._lock:
+            key = self._keys.get(kid)
+            fetched_at = self._fetched_at
+            stale = fetched_at is not None and now - fetched_at > self.ttl
+            if key is not None and stale and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._background_refresh, args=(fetched_at,), daemon=True).start()
+        if key is not None:
+            return key
+
+        # Unknown key ID: the provider may have rotated its keys
+        if fetched_at is None or now - fetched_at > MIN_REFRESH_INTERVAL:
+            self.refresh(fetched_at)
+        with self._lock:
+            key = self._keys.get(kid)
+        if key is None:
+            raise Exception(f"Unknown token signing key: {kid}")
+        return key
+
+    """
+    Fetch the keys, unless another thread did so since the caller saw fetched_at. Concurrent
+    callers, including those finding the cache empty, wait for a single fetch.
+    @param fetched_at: Fetch time the caller saw (None if the keys were never fetched)
+    """
+    def refresh(self, fetched_at):
+        with self._refresh_lock:
+            with self._lock:
+                if self._fetched_at != fetched_at:
+                    return
+            keys = load_jwks(self.fetch())
+            with self._lock:
+                self._keys = keys
+                self._fetched_at = time.monotonic()
+                self.refreshes += 1
+
+    def _background_refresh(self, fetched_at):
+        try:
+            self.refresh(fetched_at)
+        except Exception as e:
+            # Keep serving the stale keys; the next access past the TTL tries again
+            print(f"Refreshing the MAA signing keys failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+"""
+Verify the signature of a JWT
+@param token: JWT
+@param key_cache: SigningKeyCache
+@return: (header, payload) (parsed JSON)
+"""
+def verify_jwt(token, key_cache):
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(b64url_decode(header_b64))
+        payload = json.loads(b64url_decode(payload_b64))
+        signature = b64url_decode(signature_b64)
+    except ValueError as e:
+        raise Exception(f"Malformed token: {e}")
+
+    algorithm = header.get('alg')
+    if algorithm not in ALGORITHMS:
+        raise Exception(f"Unsupported token algorithm: {algorithm}")
+    key = key_cache.get(header.get('kid'))
+    signed = f"{header_b64}.{payload_b64}".encode()
+    digest = ALGORITHMS[algorithm]()
+    try:
+        if algorithm.startswith("RS"):
+            if not isinstance(key, rsa.RSAPublicKey):
+                raise Exception(f"Key {header.get('kid')} is not an RSA key")
+            key.verify(signature, signed, padding.PKCS1v15(), digest)
+        else:
+            if not isinstance(key, ec.EllipticCurvePublicKey):
+                raise Exception(f"Key {header.get('kid')} is not an EC key")
+            half = len(signature) // 2
+            der = utils.encode_dss_signature(int.from_bytes(signature[:half], 'big'), int.from_bytes(signature[half:], 'big'))
+            key.verify(der, signed, ec.ECDSA(digest))
+    except InvalidSignature:
+        raise Exception("Token signature is invalid")
+    return header, payload
+
+"""
+Look up a claim by a dotted path (e.g. "x-ms-isolation-tee.x-ms-attestation-type")
+@param claims: Token payload
+@param path: Dotted claim path
+@return: Claim value, or None if absent
+"""
+def claim_value(claims, path):
+    value = claims
+    for name in path.split("."):
+        if not isinstance(value, dict) or name not in value:
+            return None
+        value = value[name]
+    return value
+
+"""
+Policy on the claims of MAA tokens: each claim path maps to the allowed value or list of
+allowed values (e.g. the accepted launch measurements)
+@param claims: Dictionary of dotted claim path to allowed value(s)
+"""
+class ClaimPolicy:
+    def __init__(self, claims):
+        self.claims = {}
+        for path, allowed in claims.items():
+            allowed = allowed if isinstance(allowed, list) else [allowed]
+            # Measurements are compared case-insensitively
+            self.claims[path] = {value.lower() if isinstance(value, str) else value for value in allowed}
+
+    """
+    Load a policy file: {"claims": {"<claim path>": <value or list of values>, ...}}
+    @param path: Path to the policy file
+    @return: ClaimPolicy
+    """
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as f:
+            return cls(json.load(f).get('claims', {}))
+
+    """
+    Check the claims of a token
+    @param claims: Token payload
+    """
+    def check(self, claims):
+        for path, allowed in self.claims.items():
+            value = claim_value(claims, path)
+            if isinstance(value, str):
+                value = value.lower()
+            if value is None or isinstance(value, (dict, list)) or value not in allowed:
+                raise Exception(f"Claim {path} is {value!r}, not an allowed value")
+
+"""
+Verifier of MAA tokens: signature against the provider's cached signing keys, issuer, validity
+period and claim policy
+@param client: MaaClient of the provider
+@param policy: ClaimPolicy, or None
+@param keys_ttl: Lifetime of the cached signing keys in seconds
+@param leeway: Clock skew accepted on exp and nbf in seconds
+"""
+class MaaVerifier:
+    def __init__(self, client, policy=None, keys_ttl=DEFAULT_KEYS_TTL, leeway=DEFAULT_LEEWAY):
+        self.client = client
+        self.policy = policy
+        self.leeway = leeway
+        self.keys = SigningKeyCache(client.fetch_signing_keys, keys_ttl)
+
+    """
+    Verify a token
+    @param token: JWT
+    @param nonce: Expected nonce (the "nonce" claim, echoed from the request), or None to skip the check
+    @return: Token payload (claims)
+    """
+    def verify(self, token, nonce=None):
+        _, claims = verify_jwt(token, self.keys)
+        now = time.time()
+        if claims.get('iss', '').rstrip("/") != self.client.base_url:
+            raise Exception(f"Token issuer {claims.get('iss')} is not {self.client.base_url}")
+        if 'exp' not in claims:
+            raise Exception("Token has no expiry time (exp)")
+        if now > claims['exp'] + self.leeway:
+            raise Exception("Token has expired")
+        if 'nbf' in claims and now < claims['nbf'] - self.leeway:
+            raise Exception("Token is not valid yet")
+        if nonce is not None and claims.get('nonce') != nonce:
+            raise Exception("Token nonce does not match")
+        if self.policy is not None:
+            self.policy.check(claims)
+        return claims
+
+    """
+    Send evidence to the provider and verify the returned token
+    @param tee_type: TEE type of the endpoint (e.g. "SevSnpVm", "TdxVm")
+    @param payload: Request payload (see snp_payload and tdx_payload)
+    @return: (token, claims)
+    """
+    def attest(self, tee_type, payload):
+        token = self.client.attest(tee_type, payload)
+        return token, self.verify(token, payload.get('nonce'))
+
+def main():
+    parser = argparse.ArgumentParser(description="Send evidence to Microsoft Azure Attestation and verify the token")
+    parser.add_argument("--url", required=True, help="MAA provider URI")
+    parser.add_argument("--api-version", default=DEFAULT_API_VERSION, help="MAA API version")
+    parser.add_argument("--policy", help="Claim policy file (JSON)")
+    parser.add_argument("--tee", default="SevSnpVm", help="TEE type (with --payload)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--payload", help="MAA request payload to send (maa-request-payload.json)")
+    source.add_argument("--token", help="Token to verify (token.txt)")
+    args = parser.parse_args()
+
+    client = MaaClient(args.url, args.api_version)
+    verifier = MaaVerifier(client, ClaimPolicy.from_file(args.policy) if args.policy else None)
+    try:
+        if args.payload:
+            with open(args.payload, 'r') as f:
+                token, claims = verifier.attest(args.tee, json.load(f))
+            with open("token.txt", 'w') as f:
+                f.write(token)
+            print("Token saved to: token.txt")
+        else:
+            with open(args.token, 'r') as f:
+                claims = verifier.verify(f.read().strip())
+    except Exception as e:
+        print(f"❌ Verification failed: {e}")
+        return 1
+    finally:
+        client.close()
+
+    print(json.dumps(claims, indent=2))
+    print("✅ Token verification successful.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import argparse
+import base64
+import datetime
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from maa_client import b64url_decode, b64url_encode
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8788
+TOKEN_LIFETIME = 8 * 3600  # seconds, as MAA tokens
+
+# Claims of the stub's tokens per TEE type, merged with the claims of the request
+DEFAULT_CLAIMS = {
+    'SevSnpVm': {
+        'x-ms-attestation-type': 'sevsnpvm',
+        'x-ms-compliance-status': 'azure-compliant-cvm',
+        'x-ms-sevsnpvm-launchmeasurement': '00' * 48,
+    },
+    'TdxVm': {
+        'x-ms-attestation-type': 'tdxvm',
+        'x-ms-compliance-status': 'azure-compliant-cvm',
+        'tdx_mrtd': '00' * 48,
+    },
+}
+
+"""
+Stand-in for an MAA provider: POST /attest/{tee}?api-version=... returns an RS256 token signed
+with a local key, and GET /certs serves that key as a JWKS. The evidence itself is not checked.
+Connections are kept alive (HTTP/1.1), and requests and connections are counted, so tests can
+check connection reuse and key caching.
+"""
+class MaaRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/certs":
+            self._send(404, {'error': 'Not found'})
+            return
+        with self.server.lock:
+            self.server.certs_requests += 1
+        self._send(200, self.server.jwks())
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "attest":
+            self._send(404, {'error': 'Not found'})
+            return
+        with self.server.lock:
+            self.server.attest_requests += 1
+        try:
+            payload = json.loads(body)
+            self._send(200, {'token': self.server.issue_token(parts[1], payload)})
+        except Exception as e:
+            self._send(400, {'error': str(e)})
+
+    def _send(self, status, document):
+        body = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MaaStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    """
+    Replace the signing key (the previous key is no longer published)
+    """
+    def rotate_key(self):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, self.url)])
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=5))
+            .not_valid_after(now + datetime.timedelta(days=30))
+            .sign(key, hashes.SHA256())
+        )
+        with self.lock:
+            self.kid = b64url_encode(cert.fingerprint(hashes.SHA256()))
+            self.key = key
+            self.cert = cert
+
+    def jwks(self):
+        with self.lock:
+            der = self.cert.public_bytes(serialization.Encoding.DER)
+            return {'keys': [{'kid': self.kid, 'kty': 'RSA', 'x5c': [base64.b64encode(der).decode()]}]}
+
+    """
+    Issue a token for a request
+    @param tee_type: TEE type of the endpoint
+    @param payload: Request payload (parsed JSON)
+    @return: JWT
+    """
+    def issue_token(self, tee_type, payload):
+        if tee_type not in self.claims:
+            raise Exception(f"Unsupported TEE type: {tee_type}")
+        now = int(time.time())
+        claims = {'iss': self.url, 'iat': now, 'nbf': now, 'exp': now + TOKEN_LIFETIME}
+        # The TEE claims appear both at the top level and under x-ms-isolation-tee, as in CVM tokens
+        claims.update(self.claims[tee_type])
+        claims['x-ms-isolation-tee'] = dict(self.claims[tee_type])
+        runtime_data = payload.get('runtimeData', {}).get('data')
+        if runtime_data:
+            claims['x-ms-runtime'] = json.loads(b64url_decode(runtime_data))
+        if 'nonce' in payload:
+            claims['nonce'] = payload['nonce']
+
+        with self.lock:
+            key, kid = self.key, self.kid
+        header = b64url_encode(json.dumps({'alg': 'RS256', 'kid': kid, 'typ': 'JWT', 'jku': f"{self.url}/certs"}).encode())
+        body = b64url_encode(json.dumps(claims).encode())
+        signature = key.sign(f"{header}.{body}".encode(), padding.PKCS1v15(), hashes.SHA256())
+        return f"{header}.{body}.{b64url_encode(signature)}"
+
+"""
+Create a stand-in MAA provider
+@param host: Listen address
+@param port: Listen port (0 for any free port)
+@param claims: Dictionary of TEE type to token claims, or None for DEFAULT_CLAIMS
+@return: Server (call serve_forever to run it; server.url is its provider URI)
+"""
+def create_maa_server(host=DEFAULT_HOST, port=DEFAULT_PORT, claims=None):
+    server = MaaStubServer((host, port), MaaRequestHandler)
+    server.lock = threading.Lock()
+    server.url = f"http://{host}:{server.server_address[1]}"
+    server.claims = claims if claims is not None else DEFAULT_CLAIMS
+    server.connections = 0
+    server.attest_requests = 0
+    server.certs_requests = 0
+    server.rotate_key()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stand-in Microsoft Azure Attestation provider")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Listen address")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Listen port")
+    parser.add_argument("--claims", help="JSON file of TEE type to token claims")
+    args = parser.parse_args()
+
+    claims = None
+    if args.claims:
+        with open(args.claims, 'r') as f:
+            claims = json.load(f)
+    server = create_maa_server(args.host, args.port, claims)
+    print(f"Stand-in MAA provider listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
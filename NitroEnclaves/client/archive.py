@@ -0,0 +1,543 @@
+import argparse
+import base64
+import contextlib
+import datetime
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from document import AttestationDocument
+
+DEFAULT_ARCHIVE_DIR = "evidence-archive"
+DEFAULT_MAX_SEGMENT_SIZE = 64 * 1024 * 1024  # bytes
+MANIFEST_NAME = "archive.json"
+LOCK_NAME = "archive.lock"
+DEFAULT_LOCK_TIMEOUT = 10.0  # seconds a writer waits for another writer's change to finish
+LOCK_POLL_INTERVAL = 0.01  # seconds
+
+# Index record: timestamp (ns), SHA-256 of the document, of the nonce and of PCR0, offset and
+# length of the document in the segment
+INDEX_RECORD = struct.Struct("<Q32s32s32sQI")
+# Nonce index of a sealed segment, sorted by nonce digest: nonce digest, record number
+NONCE_RECORD = struct.Struct("<32sI")
+NO_DIGEST = bytes(32)  # Digest field of a document without a nonce or PCR0
+
+def _digest(value):
+    return hashlib.sha256(value).digest() if value else NO_DIGEST
+
+"""
+Archived attestation document. The document is a memoryview over the memory-mapped segment,
+so reading it copies nothing; use bytes() to keep it beyond the lifetime of the archive.
+"""
+class Evidence:
+    __slots__ = ('timestamp_ns', 'document_digest', 'nonce_digest', 'pcr0_digest', 'document')
+
+    def __init__(self, timestamp_ns, document_digest, nonce_digest, pcr0_digest, document):
+        self.timestamp_ns = timestamp_ns
+        self.document_digest = document_digest
+        self.nonce_digest = nonce_digest
+        self.pcr0_digest = pcr0_digest
+        self.document = document
+
+    @property
+    def timestamp(self):
+        return self.timestamp_ns / 1e9
+
+    """
+    Get the record in a printable form
+    @return: Dictionary of field name to value (hex strings for digests)
+    """
+    def summary(self):
+        return {
+            'timestamp': datetime.datetime.fromtimestamp(self.timestamp, datetime.timezone.utc).isoformat(),
+            'document_sha256': self.document_digest.hex(),
+            'nonce_sha256': self.nonce_digest.hex() if self.nonce_digest != NO_DIGEST else None,
+            'pcr0_sha256': self.pcr0_digest.hex() if self.pcr0_digest != NO_DIGEST else None,
+            'size': len(self.document),
+        }
+
+"""
+One segment of the archive: the documents (segment-N.cbor), their index (segment-N.idx) and,
+once sealed, the nonce index (segment-N.nonces). Files are memory-mapped on demand and
+remapped when they have grown.
+@param directory: Archive directory
+@param segment_id: Segment number
+"""
+class Segment:
+    def __init__(self, directory, segment_id):
+        self.id = segment_id
+        base = os.path.join(directory, f"segment-{segment_id:08d}")
+        self.data_path = base + ".cbor"
+        self.index_path = base + ".idx"
+        self.nonces_path = base + ".nonces"
+        self._maps = {}
+
+    @property
+    def sealed(self):
+        return os.path.exists(self.nonces_path)
+
+    def _map(self, path):
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        cached = self._maps.get(path)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        if size == 0:
+            view = memoryview(b"")
+        else:
+            with open(path, 'rb') as f:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        # The previous mapping is left to the garbage collector: evidence may still reference it
+        self._maps[path] = (size, view)
+        return view
+
+    def index(self):
+        return self._map(self.index_path)
+
+    def data(self):
+        return self._map(self.data_path)
+
+    def nonces(self):
+        return self._map(self.nonces_path)
+
+    def __len__(self):
+        return len(self.index()) // INDEX_RECORD.size
+
+    def timestamp(self, number):
+        return struct.unpack_from("<Q", self.index(), number * INDEX_RECORD.size)[0]
+
+    """
+    Read a record
+    @param number: Record number
+    @return: Evidence
+    """
+    def record(self, number):
+        timestamp_ns, document_digest, nonce_digest, pcr0_digest, offset, length = \
+            INDEX_RECORD.unpack_from(self.index(), number * INDEX_RECORD.size)
+        return Evidence(timestamp_ns, document_digest, nonce_digest, pcr0_digest, self.data()[offset:offset + length])
+
+    """
+    Find the first record at or after a timestamp (binary search; records are in time order)
+    @param timestamp_ns: Timestamp in nanoseconds
+    @return: Record number
+    """
+    def bisect_time(self, timestamp_ns):
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp(middle) < timestamp_ns:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    """
+    Find the records of a nonce digest in the nonce index (binary search)
+    @param nonce_digest: SHA-256 of the nonce
+    @return: Record numbers
+    """
+    def find_nonce(self, nonce_digest):
+        nonces = self.nonces()
+        count = len(nonces) // NONCE_RECORD.size
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if NONCE_RECORD.unpack_from(nonces, middle * NONCE_RECORD.size)[0] < nonce_digest:
+                low = middle + 1
+            else:
+                high = middle
+        numbers = []
+        while low < count:
+            digest, number = NONCE_RECORD.unpack_from(nonces, low * NONCE_RECORD.size)
+            if digest != nonce_digest:
+                break
+            numbers.append(number)
+            low += 1
+        return numbers
+
+    """
+    Write the sorted nonce index, which marks the segment as sealed
+    """
+    def seal(self):
+        index = self.index()
+        entries = sorted(
+            (INDEX_RECORD.unpack_from(index, number * INDEX_RECORD.size)[2], number)
+            for number in range(len(self))
+        )
+        _write_atomic(self.nonces_path, b"".join(NONCE_RECORD.pack(digest, number) for digest, number in entries))
+
+    def remove(self):
+        self._maps.clear()
+        for path in (self.nonces_path, self.index_path, self.data_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+"""
+Append-only archive of raw attestation documents for audit. Documents are appended to segment
+files in CBOR, and each gets a fixed-width index record (timestamp, document, nonce and PCR0
+digests, offset). Index files are memory-mapped: a time range query is a binary search per
+segment, and a nonce query a binary search in each sealed segment's sorted nonce index (the
+active segment is searched in a small in-memory map). Query results point into the mapped
+segments, so unrelated documents are neither read nor decoded. A segment is sealed when it
+reaches max_segment_size; sealed segments can be merged and pruned with compact.
+Several writers (e.g. monitor.py and client.py fetch) may have an archive open: each change is
+made under an exclusive lock on the archive, and a writer that finds the archive changed by
+another one reloads it first. Only writers repair a torn append. Any number of read-only
+instances may read the archive; they never modify a file, so they are safe to open while a
+writer is appending.
+@param directory: Archive directory
+@param max_segment_size: Segment size that triggers a rotation, in bytes
+@param read_only: Whether to open the archive for queries only
+@param lock_timeout: Seconds a writer waits for the lock before giving up
+"""
+class EvidenceArchive:
+    def __init__(self, directory=DEFAULT_ARCHIVE_DIR, max_segment_size=DEFAULT_MAX_SEGMENT_SIZE, read_only=False,
+                 lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.directory = directory
+        self.max_segment_size = max_segment_size
+        self.read_only = read_only
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._data_file = self._index_file = None
+        self._view = None
+        if read_only:
+            if not os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+                raise Exception(f"No evidence archive found in {directory}")
+            self._load_manifest()
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, LOCK_NAME), 'a')
+        try:
+            with self._lock, self._exclusive():
+                self._open_writer()
+        except Exception:
+            self._lock_file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    """
+    Hold the writers' lock on the archive, reloading the archive if another writer changed it
+    """
+    @contextlib.contextmanager
+    def _exclusive(self):
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise Exception(f"The evidence archive {self.directory} is locked by another writer "
+                                    f"(waited {self.lock_timeout:g} seconds)")
+                time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            if self._view is not None and self._current_view() != self._view:
+                self._close_files()
+                self._open_writer()
+            yield
+        finally:
+            self._view = self._current_view()
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _current_view(self):
+        # The manifest is replaced on every change of the segment list, and appends grow the active segment
+        manifest = os.stat(os.path.join(self.directory, MANIFEST_NAME))
+        active = self.segments[-1]
+        return (manifest.st_ino, manifest.st_mtime_ns, os.path.getsize(active.index_path),
+                os.path.getsize(active.data_path))
+
+    def _open_writer(self):
+        self._load_manifest()
+        self._recover()
+        self._active_nonces = {}
+        active = self.segments[-1]
+        index = active.index()
+        for number in range(len(active)):
+            nonce_digest = INDEX_RECORD.unpack_from(index, number * INDEX_RECORD.size)[2]
+            self._active_nonces.setdefault(nonce_digest, []).append(number)
+        self._last_timestamp = active.timestamp(len(active) - 1) if len(active) else 0
+        self._data_file = open(active.data_path, 'ab')
+        self._index_file = open(active.index_path, 'ab')
+
+    def _close_files(self):
+        for f in (self._data_file, self._index_file):
+            if f is not None and not f.closed:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+
+    def _load_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+        else:
+            manifest = {'segments': [1], 'next_segment': 2}
+        self.segments = [Segment(self.directory, segment_id) for segment_id in manifest['segments']]
+        self._next_segment = manifest['next_segment']
+        if not os.path.exists(path) and not self.read_only:
+            self._save_manifest()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise Exception("The evidence archive is open read-only")
+
+    def _save_manifest(self):
+        manifest = {'segments': [segment.id for segment in self.segments], 'next_segment': self._next_segment}
+        _write_atomic(os.path.join(self.directory, MANIFEST_NAME), json.dumps(manifest).encode())
+
+    """
+    Drop a torn write at the end of the active segment (a partial index record, or documents
+    past the last indexed one)
+    """
+    def _recover(self):
+        active = self.segments[-1]
+        for path in (active.data_path, active.index_path):
+            open(path, 'ab').close()
+        index_size = os.path.getsize(active.index_path)
+        if index_size % INDEX_RECORD.size:
+            os.truncate(active.index_path, index_size - index_size % INDEX_RECORD.size)
+        end = 0
+        if len(active):
+            offset, length = INDEX_RECORD.unpack_from(active.index(), (len(active) - 1) * INDEX_RECORD.size)[4:]
+            end = offset + length
+        if os.path.getsize(active.data_path) > end:
+            os.truncate(active.data_path, end)
+
+    """
+    Append an attestation document
+    @param cbor_bytes: Attestation document in CBOR
+    @param document: Parsed document (AttestationDocument), or None to parse it
+    @param timestamp_ns: Timestamp in nanoseconds, or None for now
+    @return: Evidence record (its document is not mapped yet and is the given bytes)
+    """
+    def append(self, cbor_bytes, document=None, timestamp_ns=None):
+        self._check_writable()
+        if document is None:
+            document = AttestationDocument(cbor_bytes)
+        nonce_digest = _digest(document.report.get('nonce'))
+        pcr0_digest = _digest(document.pcrs.get(0))
+        document_digest = hashlib.sha256(cbor_bytes).digest()
+
+        with self._lock, self._exclusive():
+            # Records stay in time order, so time queries can binary search
+            timestamp_ns = max(timestamp_ns or time.time_ns(), self._last_timestamp)
+            if self._data_file.tell() + len(cbor_bytes) > self.max_segment_size and self._index_file.tell():
+                self._rotate()
+            offset = self._data_file.tell()
+            self._data_file.write(cbor_bytes)
+            self._data_file.flush()
+            # The index record is written after its document, so a torn append leaves no dangling record
+            self._index_file.write(INDEX_RECORD.pack(timestamp_ns, document_digest, nonce_digest, pcr0_digest,
+                                                     offset, len(cbor_bytes)))
+            self._index_file.flush()
+            number = self._index_file.tell() // INDEX_RECORD.size - 1
+            self._active_nonces.setdefault(nonce_digest, []).append(number)
+            self._last_timestamp = timestamp_ns
+        return Evidence(timestamp_ns, document_digest, nonce_digest, pcr0_digest, memoryview(cbor_bytes))
+
+    """
+    Seal the active segment and start a new one
+    """
+    def rotate(self):
+        self._check_writable()
+        with self._lock, self._exclusive():
+            if self._index_file.tell():
+                self._rotate()
+
+    def _rotate(self):
+        for f in (self._data_file, self._index_file):
+            os.fsync(f.fileno())
+            f.close()
+        self.segments[-1].seal()
+        segment = Segment(self.directory, self._next_segment)
+        self._next_segment += 1
+        self.segments.append(segment)
+        self._save_manifest()
+        self._data_file = open(segment.data_path, 'ab')
+        self._index_file = open(segment.index_path, 'ab')
+        self._active_nonces = {}
+
+    """
+    Find the documents in a time range
+    @param start: Start UNIX timestamp (inclusive), or None
+    @param end: End UNIX timestamp (exclusive), or None
+    @return: Iterator of Evidence, in time order
+    """
+    def query_time(self, start=None, end=None):
+        start_ns = int(start * 1e9) if start is not None else 0
+        end_ns = int(end * 1e9) if end is not None else 2 ** 64
+        for segment in list(self.segments):
+            count = len(segment)
+            if count == 0 or segment.timestamp(count - 1) < start_ns or segment.timestamp(0) >= end_ns:
+                continue
+            for number in range(segment.bisect_time(start_ns), segment.bisect_time(end_ns)):
+                yield segment.record(number)
+
+    """
+    Find the documents of a nonce
+    @param nonce: Nonce in bytes
+    @return: List of Evidence, in time order
+    """
+    def query_nonce(self, nonce):
+        nonce_digest = _digest(nonce)
+        results = []
+        with self._lock:
+            segments = list(self.segments)
+            if self.read_only:
+                # The writer may be appending to the active segment, so read its index as it is now
+                index = segments[-1].index()
+                active_numbers = [
+                    number for number in range(len(segments[-1]))
+                    if INDEX_RECORD.unpack_from(index, number * INDEX_RECORD.size)[2] == nonce_digest
+                ]
+            else:
+                active_numbers = list(self._active_nonces.get(nonce_digest, ()))
+        for segment in segments[:-1]:
+            results.extend(segment.record(number) for number in segment.find_nonce(nonce_digest))
+        results.extend(segments[-1].record(number) for number in active_numbers)
+        return results
+
+    """
+    Merge the sealed segments into segments of up to max_segment_size, dropping the documents
+    older than a retention cutoff. The new segments replace the old ones in one manifest write.
+    @param before: UNIX timestamp; documents older than this are dropped (None keeps all)
+    @return: Number of documents dropped
+    """
+    def compact(self, before=None):
+        self._check_writable()
+        before_ns = int(before * 1e9) if before is not None else 0
+        with self._lock, self._exclusive():
+            sealed, active = self.segments[:-1], self.segments[-1]
+            outputs = []
+            dropped = 0
+            data_file = index_file = None
+            for segment in sealed:
+                for number in range(len(segment)):
+                    record = INDEX_RECORD.unpack_from(segment.index(), number * INDEX_RECORD.size)
+                    if record[0] < before_ns:
+                        dropped += 1
+                        continue
+                    offset, length = record[4:]
+                    if data_file is None or data_file.tell() + length > self.max_segment_size:
+                        if data_file is not None:
+                            self._close_output(data_file, index_file, outputs[-1])
+                        outputs.append(Segment(self.directory, self._next_segment))
+                        self._next_segment += 1
+                        data_file = open(outputs[-1].data_path, 'wb')
+                        index_file = open(outputs[-1].index_path, 'wb')
+                    index_file.write(INDEX_RECORD.pack(*record[:4], data_file.tell(), length))
+                    data_file.write(segment.data()[offset:offset + length])
+            if data_file is not None:
+                self._close_output(data_file, index_file, outputs[-1])
+
+            self.segments = outputs + [active]
+            self._save_manifest()
+            for segment in sealed:
+                segment.remove()
+        return dropped
+
+    def _close_output(self, data_file, index_file, segment):
+        for f in (data_file, index_file):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        segment.seal()
+
+    """
+    Get archive statistics
+    @return: Dictionary of segment, document and byte counts
+    """
+    def stats(self):
+        with self._lock:
+            segments = list(self.segments)
+        return {
+            'segments': len(segments),
+            'documents': sum(len(segment) for segment in segments),
+            'bytes': sum(os.path.getsize(segment.data_path) for segment in segments if os.path.exists(segment.data_path)),
+        }
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+            if self._lock_file is not None and not self._lock_file.closed:
+                self._lock_file.close()
+
+def _parse_time(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and maintain an archive of attestation documents")
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE_DIR, help="Archive directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="List the documents in a time range")
+    list_parser.add_argument("--since", help="Start time (UNIX timestamp or ISO 8601)")
+    list_parser.add_argument("--until", help="End time (UNIX timestamp or ISO 8601)")
+    find_parser = commands.add_parser("find", help="Find the documents of a nonce")
+    find_parser.add_argument("nonce", help="Nonce in base64")
+    find_parser.add_argument("--export", help="Write the documents to this directory (one .cbor file each)")
+    compact_parser = commands.add_parser("compact", help="Merge sealed segments and drop old documents")
+    compact_parser.add_argument("--retain-days", type=float, help="Drop documents older than this many days")
+    commands.add_parser("rotate", help="Seal the active segment")
+    commands.add_parser("stats", help="Print archive statistics")
+    args = parser.parse_args()
+
+    # Only the commands changing the archive open it for writing
+    try:
+        archive = EvidenceArchive(args.archive, read_only=args.command in ("list", "find", "stats"))
+    except Exception as e:
+        print(f"❌ {e}")
+        return 1
+    with archive:
+        if args.command == "list":
+            for evidence in archive.query_time(_parse_time(args.since), _parse_time(args.until)):
+                print(json.dumps(evidence.summary()))
+        elif args.command == "find":
+            results = archive.query_nonce(base64.b64decode(args.nonce))
+            for evidence in results:
+                print(json.dumps(evidence.summary()))
+                if args.export:
+                    os.makedirs(args.export, exist_ok=True)
+                    path = os.path.join(args.export, f"{evidence.document_digest.hex()}.cbor")
+                    with open(path, 'wb') as f:
+                        f.write(evidence.document)
+            if not results:
+                print("No document found for this nonce")
+                return 1
+        elif args.command == "compact":
+            before = time.time() - args.retain_days * 86400 if args.retain_days is not None else None
+            archive.rotate()
+            dropped = archive.compact(before)
+            print(f"Compacted the archive; dropped {dropped} documents")
+        elif args.command == "rotate":
+            archive.rotate()
+        print(json.dumps(archive.stats()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import asyncio
+import base64
+import json
+import secrets
+import socket
+import time
+
+from client import (
+    VSOCK_PORT,
+    encode_request,
+    parse_response,
+    resolve_address,
+    log,
+    verify_document,
+)
+from document import AttestationDocument
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 10  # seconds per target
+RECV_SIZE = 8192
+
+"""
+Get attestation document from enclave without blocking the event loop
+@param user_data_b64: User data in base64
+@param nonce_b64: Nonce in base64
+@param address: Enclave address (see resolve_address)
+@return: Attestation document in base64
+"""
+async def fetch_attestation_document(user_data_b64, nonce_b64, address):
+    loop = asyncio.get_running_loop()
+    family, sockaddr = resolve_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await loop.sock_connect(sock, sockaddr)
+    except Exception:
+        sock.close()
+        raise
+
+    reader, writer = await asyncio.open_connection(sock=sock)
+    try:
+        writer.write(encode_request(user_data_b64, nonce_b64))
+        await writer.drain()
+
+        # Read until one complete JSON response has arrived
+        decoder = json.JSONDecoder()
+        text = ""
+        while True:
+            data = await reader.read(RECV_SIZE)
+            if not data:
+                raise Exception("No response received from enclave")
+            text += data.decode()
+            try:
+                response_json, _ = decoder.raw_decode(text.lstrip())
+                break
+            except json.JSONDecodeError:
+                continue
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass  # The connection is gone either way
+
+    return parse_response(response_json)
+
+"""
+Verify an attestation document in base64
+@param attestation_document_b64: Attestation document in base64
+@param user_data: User data in bytes
+@param nonce: Nonce in bytes
+@return: True if the attestation document is valid, False otherwise
+"""
+def verify_document_b64(attestation_document_b64, user_data, nonce):
+    try:
+        document = AttestationDocument.from_base64(attestation_document_b64)
+    except Exception as e:
+        log(f"❌ Failed to parse attestation document: {e}")
+        return False
+    return verify_document(document, user_data, nonce)
+
+"""
+Request attestation documents from many enclaves at once, yielding results as they complete.
+Each target is a CID, (CID, port), (CID, port, timeout), or an address string such as
+"tcp://HOST:PORT" (see resolve_address). Verification runs in worker threads,
+so documents are verified while the others are still arriving.
+@param targets: Iterable of targets
+@param user_data: User data in bytes
+@param concurrency: Maximum number of requests in flight
+@param timeout: Default deadline in seconds for each target's request
+@param verify: Whether to verify each document
+@return: Async iterator of result dictionaries
+"""
+async def attest_many(targets, user_data=b'hello', concurrency=DEFAULT_CONCURRENCY,
+                      timeout=DEFAULT_TIMEOUT, verify=True):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    user_data_b64 = base64.b64encode(user_data).decode()
+
+    async def attest(target):
+        if not isinstance(target, tuple):
+            target = (target,)
+        cid = target[0]
+        port = target[1] if len(target) > 1 else VSOCK_PORT
+        deadline = target[2] if len(target) > 2 else timeout
+        address = cid if isinstance(cid, str) else (cid, port)
+
+        nonce = secrets.token_bytes(64)
+        result = {
+            'cid': cid,
+            'port': port,
+            'nonce': nonce,
+            'document': None,
+            'verified': False,
+            'error': None,
+        }
+        start = time.monotonic()
+
+        try:
+            async with semaphore:
+                result['document'] = await asyncio.wait_for(
+                    fetch_attestation_document(user_data_b64, base64.b64encode(nonce).decode(), address),
+                    deadline,
+                )
+            if verify:
+                result['verified'] = await loop.run_in_executor(
+                    None, verify_document_b64, result['document'], user_data, nonce
+                )
+        except asyncio.TimeoutError:
+            result['error'] = f"Deadline of {deadline} seconds exceeded"
+        except Exception as e:
+            result['error'] = str(e)
+
+        result['elapsed'] = time.monotonic() - start
+        return result
+
+    tasks = [asyncio.ensure_future(attest(target)) for target in targets]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
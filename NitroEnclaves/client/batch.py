@@ -0,0 +1,223 @@
+import argparse
+import base64
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import cbor2
+
+from client import AWS_NITRO_ROOT_CERT_PATH, EXPECTED_MEASUREMENTS_PATH
+
+DEFAULT_CHUNK_SIZE = 64
+VERDICTS_PATH = "verdicts.jsonl"
+STATS_PATH = "batch-stats.json"
+
+# Verifier of the worker process, created once by init_worker
+_worker_verifier = None
+
+"""
+Read stored attestation documents from a JSONL file. Each line is an object with
+"document", "user_data" and "nonce" in base64 and an optional "id".
+@param path: Path to the JSONL file
+@return: Iterator of (id, document in CBOR, user data, nonce)
+"""
+def read_jsonl(path):
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield (
+                record.get('id', f"{path}:{line_number}"),
+                base64.b64decode(record['document']),
+                base64.b64decode(record.get('user_data', '')),
+                base64.b64decode(record.get('nonce', '')),
+            )
+
+"""
+Read stored attestation documents from a CBOR sequence. Each item is a map with
+"document", "user_data" and "nonce" as byte strings and an optional "id".
+@param path: Path to the CBOR file
+@return: Iterator of (id, document in CBOR, user data, nonce)
+"""
+def read_cbor_sequence(path):
+    with open(path, 'rb') as f:
+        decoder = cbor2.CBORDecoder(f)
+        index = 0
+        while True:
+            try:
+                record = decoder.decode()
+            except cbor2.CBORDecodeEOF:
+                break
+            yield (
+                record.get('id', f"{path}:{index}"),
+                record['document'],
+                record.get('user_data', b''),
+                record.get('nonce', b''),
+            )
+            index += 1
+
+"""
+Read stored attestation documents from a directory. Each document is a file saved by
+client.py (<name>.dat, base64) or raw CBOR (<name>.cbor), with an optional <name>.json
+holding "user_data" and "nonce" in base64.
+@param path: Path to the directory
+@return: Iterator of (id, document in CBOR, user data, nonce)
+"""
+def read_directory(path):
+    for document_path in sorted(Path(path).iterdir()):
+        if document_path.suffix == '.dat':
+            document = base64.b64decode(document_path.read_text())
+        elif document_path.suffix == '.cbor':
+            document = document_path.read_bytes()
+        else:
+            continue
+
+        user_data, nonce = b'', b''
+        sidecar_path = document_path.with_suffix('.json')
+        if sidecar_path.exists():
+            sidecar = json.loads(sidecar_path.read_text())
+            user_data = base64.b64decode(sidecar.get('user_data', ''))
+            nonce = base64.b64decode(sidecar.get('nonce', ''))
+        yield str(document_path), document, user_data, nonce
+
+"""
+Read stored attestation documents from a directory, a JSONL file or a CBOR sequence
+@param path: Input path
+@return: Iterator of (id, document in CBOR, user data, nonce)
+"""
+def read_records(path):
+    if os.path.isdir(path):
+        return read_directory(path)
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        return read_jsonl(path)
+    return read_cbor_sequence(path)
+
+"""
+Initialize a worker process: load the trust state once and silence the per-step output
+@param root_cert_path: Path to the root certificate in PEM
+@param expected_measurements_path: Path to the expected measurements in JSON
+@param nonce_server: Address of a nonce server checking the nonces for replay, or None
+"""
+def init_worker(root_cert_path, expected_measurements_path, nonce_server=None):
+    global _worker_verifier
+    from client import set_quiet
+    from verifier import NitroVerifier
+
+    set_quiet(True)
+    nonce_manager = None
+    if nonce_server is not None:
+        from nonces import RemoteNonceManager
+        nonce_manager = RemoteNonceManager(nonce_server)
+    _worker_verifier = NitroVerifier(root_cert_path, expected_measurements_path, nonce_manager=nonce_manager)
+
+"""
+Verify a chunk of stored attestation documents in a worker process
+@param chunk: List of (id, document in CBOR, user data, nonce)
+@return: List of verdict dictionaries
+"""
+def verify_chunk(chunk):
+    verdicts = []
+    for record_id, document, user_data, nonce in chunk:
+        start = time.perf_counter()
+        verdict = {'id': record_id, 'valid': False, 'error': None}
+        try:
+            verdict['valid'] = _worker_verifier.verify(document, user_data, nonce)
+        except Exception as e:
+            verdict['error'] = str(e)
+        verdict['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        verdicts.append(verdict)
+    return verdicts
+
+"""
+Verify stored attestation documents across a process pool
+@param records: Iterable of (id, document in CBOR, user data, nonce)
+@param verdicts_file: File to write one JSON verdict per line to
+@param workers: Number of worker processes (default: CPU count)
+@param chunk_size: Number of documents per work item
+@param root_cert_path: Path to the root certificate in PEM
+@param expected_measurements_path: Path to the expected measurements in JSON
+@return: Dictionary of throughput statistics
+"""
+def verify_batch(records, verdicts_file, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 root_cert_path=AWS_NITRO_ROOT_CERT_PATH,
+                 expected_measurements_path=EXPECTED_MEASUREMENTS_PATH):
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    stats = {'documents': 0, 'valid': 0, 'invalid': 0, 'errors': 0}
+    records = iter(records)
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(os.path.abspath(root_cert_path), os.path.abspath(expected_measurements_path)),
+    ) as executor:
+        in_flight = set()
+
+        def collect(done):
+            for future in done:
+                for verdict in future.result():
+                    stats['documents'] += 1
+                    if verdict['error'] is not None:
+                        stats['errors'] += 1
+                    elif verdict['valid']:
+                        stats['valid'] += 1
+                    else:
+                        stats['invalid'] += 1
+                    verdicts_file.write(json.dumps(verdict) + "\n")
+
+        # Keep a bounded number of chunks in flight so the input is streamed, not loaded at once
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            in_flight.add(executor.submit(verify_chunk, chunk))
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+        done, _ = wait(in_flight)
+        collect(done)
+
+    elapsed = time.perf_counter() - start
+    stats['workers'] = workers
+    stats['chunk_size'] = chunk_size
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['documents_per_second'] = round(stats['documents'] / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify stored attestation documents in batch")
+    parser.add_argument("input", help="Directory of .dat/.cbor documents, JSONL file, or CBOR sequence")
+    parser.add_argument("--verdicts", default=VERDICTS_PATH, help="Per-document verdict file (JSONL)")
+    parser.add_argument("--stats", default=STATS_PATH, help="Throughput statistics file (JSON)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Documents per work item")
+    parser.add_argument("--root-cert", default=AWS_NITRO_ROOT_CERT_PATH, help="AWS Nitro root certificate (PEM)")
+    parser.add_argument("--measurements", default=EXPECTED_MEASUREMENTS_PATH, help="Expected measurements (JSON)")
+    args = parser.parse_args()
+
+    print(f"Verifying attestation documents from {args.input}...")
+    with open(args.verdicts, 'w') as verdicts_file:
+        stats = verify_batch(
+            read_records(args.input), verdicts_file,
+            workers=args.workers, chunk_size=args.chunk_size,
+            root_cert_path=args.root_cert, expected_measurements_path=args.measurements,
+        )
+
+    with open(args.stats, 'w') as f:
+        json.dump(stats, f, indent=2)
+
+    print(f"Verified {stats['documents']} documents in {stats['elapsed_seconds']} seconds "
+          f"({stats['documents_per_second']} documents/s)")
+    print(f"   Valid: {stats['valid']}, Invalid: {stats['invalid']}, Errors: {stats['errors']}")
+    print(f"Verdicts saved to: {args.verdicts}")
+    print(f"Statistics saved to: {args.stats}")
+    return 0 if stats['invalid'] == 0 and stats['errors'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
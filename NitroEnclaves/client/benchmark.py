@@ -0,0 +1,215 @@
+import argparse
+import base64
+import json
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+from client import (
+    set_quiet,
+    signature_executor,
+    extract_report_from_cbor,
+    convert_cosedata_to_cosemsg,
+    verify_signature,
+    verify_document_signature,
+    verify_certificate_chain,
+    verify_report_contents,
+    verify_attestation_document,
+)
+from chain_cache import CertificateChainCache
+from document import AttestationDocument
+from fixtures import SyntheticEnclave
+
+DEFAULT_ITERATIONS = 200
+DEFAULT_DEPTHS = [1, 3, 5]
+DEFAULT_USER_DATA_SIZES = [32, 512]
+DEFAULT_THRESHOLD = 1.25  # slowdown ratio reported as a regression
+DEFAULT_STARTUP_RUNS = 10
+DEFAULT_STARTUP_BUDGET_MS = 100.0  # import time of client.py
+# Modules client.py imports only in the code paths needing them
+LAZY_MODULES = ("cbor2", "cryptography", "cose")
+
+"""
+Time a function
+@param func: Function to time (called without arguments)
+@param iterations: Number of calls
+@return: Dictionary of median and p95 in microseconds, and whether every call succeeded
+"""
+def time_function(func, iterations):
+    samples = []
+    ok = True
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+        if result is False:
+            ok = False
+    samples.sort()
+    return {
+        'median_us': round(samples[len(samples) // 2] * 1e6, 1),
+        'p95_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6, 1),
+        'ok': ok,
+    }
+
+"""
+Benchmark every verification stage on one synthetic document
+@param depth: Number of intermediate certificates
+@param user_data_size: Size of user data in bytes
+@param iterations: Number of calls per stage
+@return: Dictionary of stage name to timing
+"""
+def benchmark_document(depth, user_data_size, iterations):
+    enclave = SyntheticEnclave(depth=depth)
+    user_data = secrets.token_bytes(user_data_size)
+    nonce = secrets.token_bytes(64)
+    document_bytes = enclave.attest(user_data, nonce)
+    document_b64 = base64.b64encode(document_bytes).decode()
+
+    document = AttestationDocument(document_bytes)
+    leaf_cert = document.certificate
+    expected_pcrs = enclave.expected_pcrs()
+    chain_cache = CertificateChainCache()
+
+    stages = {
+        'extract_report_from_cbor': lambda: extract_report_from_cbor(document_b64),
+        'AttestationDocument': lambda: AttestationDocument(document_bytes),
+        'verify_signature': lambda: verify_signature(convert_cosedata_to_cosemsg(document_bytes)),
+        'verify_document_signature': lambda: verify_document_signature(AttestationDocument(document_bytes)),
+        'verify_certificate_chain': lambda: verify_certificate_chain(leaf_cert, enclave.root_cert, document.cabundle),
+        'verify_certificate_chain (cached)': lambda: verify_certificate_chain(
+            leaf_cert, enclave.root_cert, document.cabundle, chain_cache),
+        'verify_report_contents': lambda: verify_report_contents(document.report, user_data, nonce, expected_pcrs),
+        'verify_attestation_document': lambda: verify_attestation_document(
+            None, document_bytes, user_data, nonce, root_cert=enclave.root_cert, expected_pcrs=expected_pcrs),
+        'verify_attestation_document (parallel)': lambda: verify_attestation_document(
+            None, document_bytes, user_data, nonce, root_cert=enclave.root_cert, expected_pcrs=expected_pcrs,
+            executor=signature_executor()),
+    }
+
+    results = {'document_bytes': len(document_bytes)}
+    for name, func in stages.items():
+        try:
+            results[name] = time_function(func, iterations)
+        except Exception as e:
+            results[name] = {'median_us': None, 'p95_us': None, 'ok': False, 'error': str(e)}
+    return results
+
+"""
+Measure the import time of client.py in fresh interpreters (python -X importtime), and
+check that the lazily imported modules are not loaded by the import
+@param runs: Number of interpreters started
+@return: Dictionary of median and max import time in milliseconds, and the lazy modules loaded
+"""
+def benchmark_startup(runs):
+    script = (
+        "import json, sys, client; "
+        f"print(json.dumps(sorted({{name.split('.')[0] for name in sys.modules}} & {set(LAZY_MODULES)!r})))"
+    )
+    samples = []
+    loaded = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        )
+        # Lines read "import time: <self us> | <cumulative us> | <module>"
+        for line in result.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == "client":
+                samples.append(int(fields[1]) / 1000)
+        loaded = json.loads(result.stdout)
+    samples.sort()
+    return {
+        'median_ms': round(samples[len(samples) // 2], 1),
+        'max_ms': round(samples[-1], 1),
+        'lazy_modules_loaded': loaded,
+    }
+
+"""
+Compare results against a baseline
+@param results: Benchmark results
+@param baseline: Baseline results (same layout)
+@param threshold: Slowdown ratio reported as a regression
+@return: List of regression descriptions
+"""
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for case, stages in results.items():
+        for name, timing in stages.items():
+            if not isinstance(timing, dict) or timing['median_us'] is None:
+                continue
+            base = baseline.get(case, {}).get(name)
+            if not base or not base.get('median_us'):
+                continue
+            ratio = timing['median_us'] / base['median_us']
+            if ratio > threshold:
+                regressions.append(f"{case} {name}: {base['median_us']} us -> {timing['median_us']} us ({ratio:.2f}x)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Nitro attestation document verification")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Calls per stage")
+    parser.add_argument("--depths", type=int, nargs='+', default=DEFAULT_DEPTHS, help="Intermediate certificate counts")
+    parser.add_argument("--user-data-sizes", type=int, nargs='+', default=DEFAULT_USER_DATA_SIZES, help="User data sizes in bytes")
+    parser.add_argument("--json", help="Save results to a JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --json")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Slowdown ratio reported as a regression")
+    parser.add_argument("--startup", action="store_true", help="Check the import time of client.py against a budget")
+    parser.add_argument("--startup-runs", type=int, default=DEFAULT_STARTUP_RUNS, help="Interpreters started")
+    parser.add_argument("--startup-budget-ms", type=float, default=DEFAULT_STARTUP_BUDGET_MS,
+                        help="Import time budget of client.py in milliseconds")
+    args = parser.parse_args()
+
+    if args.startup:
+        startup = benchmark_startup(args.startup_runs)
+        print(f"client.py import: median {startup['median_ms']} ms, max {startup['max_ms']} ms "
+              f"(budget {args.startup_budget_ms} ms)")
+        if startup['lazy_modules_loaded']:
+            print(f"❌ Modules loaded on import: {', '.join(startup['lazy_modules_loaded'])}")
+            return 1
+        if startup['median_ms'] > args.startup_budget_ms:
+            print("❌ Import time over budget")
+            return 1
+        print("✅ Import time within budget")
+        return 0
+
+    set_quiet(True)
+
+    results = {}
+    for depth in args.depths:
+        for user_data_size in args.user_data_sizes:
+            case = f"depth={depth},user_data={user_data_size}"
+            results[case] = benchmark_document(depth, user_data_size, args.iterations)
+
+            print("=" * 72)
+            print(f"{case} ({results[case]['document_bytes']} bytes)")
+            print("=" * 72)
+            print(f"{'Stage':<40}{'median (us)':>14}{'p95 (us)':>14}")
+            for name, timing in results[case].items():
+                if not isinstance(timing, dict):
+                    continue
+                status = "" if timing['ok'] else "  ❌ " + timing.get('error', "failed")
+                print(f"{name:<40}{str(timing['median_us']):>14}{str(timing['p95_us']):>14}{status}")
+            print()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to: {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) over {args.threshold}x:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print(f"✅ No regression over {args.threshold}x against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 3600  # seconds
+
+"""
+Get the notAfter of a certificate as a UNIX timestamp
+@param cert: Certificate
+@return: notAfter as a UNIX timestamp
+"""
+def certificate_not_after(cert):
+    not_after = getattr(cert, 'not_valid_after_utc', None)
+    if not_after is None:
+        not_after = cert.not_valid_after.replace(tzinfo=timezone.utc)
+    return not_after.timestamp()
+
+"""
+Cache of verified certificate chain links. A link is keyed by the SHA-384 of the
+(issuer DER, subject DER) pair and holds the parsed subject certificate, so a chain
+whose prefix was already verified only needs its new links parsed and checked.
+Entries expire after the TTL or at the notAfter of either certificate, whichever
+comes first, and the least recently used entry is evicted when the cache is full.
+@param max_entries: Maximum number of cached links
+@param ttl: Maximum lifetime of a cached link in seconds
+"""
+class CertificateChainCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    """
+    Compute the cache key of a chain link
+    @param issuer_der: Issuer certificate in DER
+    @param subject_der: Subject certificate in DER
+    @return: SHA-384 digest of the link
+    """
+    @staticmethod
+    def link_key(issuer_der, subject_der):
+        digest = hashlib.sha384()
+        # Length-prefix the issuer so that different splits never collide
+        digest.update(len(issuer_der).to_bytes(4, byteorder='big'))
+        digest.update(issuer_der)
+        digest.update(subject_der)
+        return digest.digest()
+
+    """
+    Look up a verified link
+    @param key: Link key
+    @return: Parsed subject certificate if the link was verified and has not expired, None otherwise
+    """
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            subject_cert, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return subject_cert
+
+    """
+    Record a verified link
+    @param key: Link key
+    @param subject_cert: Parsed subject certificate
+    @param issuer_cert: Parsed issuer certificate
+    """
+    def put(self, key, subject_cert, issuer_cert):
+        expires_at = min(
+            time.time() + self.ttl,
+            certificate_not_after(subject_cert),
+            certificate_not_after(issuer_cert),
+        )
+        with self._lock:
+            self._entries[key] = (subject_cert, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    """
+    Get cache statistics
+    @return: Dictionary of hit, miss, eviction and expiration counters
+    """
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._entries),
+            }
+
+    """
+    Remove all cached links
+    """
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,18 +1,15 @@
-import cbor2
 import base64
 import socket
 import json
 import secrets
-from cryptography import x509
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.backends import default_backend
+import sys
+import threading
 
-from cose.messages import CoseMessage
-from cose.keys import EC2Key
-from cose.keys.keyparam import KpKty, EC2KpX, EC2KpY, EC2KpCurve
-from cose.keys.keytype import KtyEC2
-from cose.keys.curves import P384
+# cbor2, cryptography and cose are imported by the functions using them, so fetching a
+# document (or importing this module for resolve_address) does not pay for loading them
+import metrics
+from stream import ResponseReader, MAX_RESPONSE_SIZE, parse_response
+from wire import encode_binary_request, negotiate_binary, parse_binary_response
 
 CID = 16
 VSOCK_PORT = 5000
@@ -21,40 +18,86 @@ VSOCK_PORT = 5000
 AWS_NITRO_ROOT_CERT_PATH = "root.pem"
 EXPECTED_MEASUREMENTS_PATH = "expected-measurements.json"
 
+# Quiet mode drops the per-step console output (see set_quiet)
+QUIET = False
+
 """
-Get attestation document from enclave
+Enable or disable quiet mode
+@param quiet: True to drop the per-step console output
+"""
+def set_quiet(quiet=True):
+    global QUIET
+    QUIET = quiet
+
+"""
+Print per-step output unless quiet mode is enabled
+"""
+def log(*args, **kwargs):
+    if not QUIET:
+        print(*args, **kwargs)
+
+"""
+Encode an attestation request for the enclave
 @param user_data_b64: User data in base64
 @param nonce_b64: Nonce in base64
-@return: Attestation document in base64
+@return: Request bytes (newline-terminated JSON)
+"""
+def encode_request(user_data_b64, nonce_b64):
+    request = {'user-data': user_data_b64, 'nonce': nonce_b64}
+    return (json.dumps(request) + "\n").encode()
+
+"""
+Resolve an enclave address to a socket family and socket address. Besides the enclave's
+(CID, port) over vsock, a stand-in server can be reached over TCP or a UNIX socket.
+@param address: (CID, port), "vsock://CID:PORT", "tcp://HOST:PORT" or "unix:///PATH"
+@return: (socket family, socket address)
+"""
+def resolve_address(address):
+    if isinstance(address, str):
+        scheme, sep, location = address.partition("://")
+        if not sep:
+            raise Exception(f"Invalid enclave address: {address}")
+        if scheme == "unix":
+            return socket.AF_UNIX, location
+        host, _, port = location.rpartition(":")
+        if scheme == "tcp":
+            return socket.AF_INET, (host, int(port))
+        if scheme == "vsock":
+            return socket.AF_VSOCK, (int(host), int(port))
+        raise Exception(f"Unsupported transport: {scheme}")
+    return socket.AF_VSOCK, tuple(address)
+
+"""
+Connect to the enclave and run one request/response exchange
+@param cid: CID of the enclave
+@param port: vsock port of the enclave
+@param address: Enclave address (see resolve_address); overrides cid and port
+@param exchange: Function sending the request and reading the response, given a ResponseReader and the socket
+@param max_size: Maximum size of the response in bytes
+@return: Result of exchange
 """
-def get_attestation_document(user_data_b64, nonce_b64):
-    print(f"Connecting to enclave CID {CID} on port {VSOCK_PORT}...")
+def request_attestation(cid, port, address, exchange, max_size):
+    if address is None:
+        address = (cid, port)
+        log(f"Connecting to enclave CID {cid} on port {port}...")
+    else:
+        log(f"Connecting to enclave at {address}...")
+    family, sockaddr = resolve_address(address)
     
-    with socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM) as vsock:
+    with socket.socket(family, socket.SOCK_STREAM) as vsock:
         try:
             vsock.settimeout(10)  # 10 second timeout
-            vsock.connect((CID, VSOCK_PORT))
-            print("Connected to enclave successfully")
-            
-            request = {'user-data': user_data_b64, 'nonce': nonce_b64}
-            request_json = json.dumps(request)
-            print("Sending request")
-            
-            vsock.sendall(request_json.encode())
-            print("Request sent, waiting for response...")
-            
-            response_bytes = vsock.recv(8192)
-            if not response_bytes:
-                raise Exception("No response received from enclave")
+            with metrics.span("vsock_round_trip"):
+                vsock.connect(sockaddr)
+                log("Connected to enclave successfully")
                 
-            response_json = json.loads(response_bytes.decode())
-            print("Received response")
+                try:
+                    result = exchange(ResponseReader(max_size), vsock)
+                except ConnectionError:
+                    raise Exception("No response received from enclave")
+            log("Received response")
             
-            if 'error' in response_json:
-                raise Exception(f"Enclave error: {response_json['error']}")
-                
-            document = response_json['document']
-            return document
+            return result
             
         except socket.timeout:
             raise Exception("Connection timeout - enclave may not be running")
@@ -63,20 +106,86 @@ def get_attestation_document(user_data_b64, nonce_b64):
         except Exception as e:
             raise Exception(f"Connection error: {e}")
 
+"""
+Request an attestation document over a connection, in the binary mode if asked for and the
+enclave accepts it, otherwise in JSON
+@param reader: ResponseReader of the connection
+@param sock: Connected socket
+@param user_data_b64: User data in base64
+@param nonce_b64: Nonce in base64
+@param binary: Whether to negotiate the binary mode
+@return: Attestation document in CBOR
+"""
+def exchange_document(reader, sock, user_data_b64, nonce_b64, binary):
+    if binary and negotiate_binary(sock, reader):
+        log("Sending request (binary mode)")
+        sock.sendall(encode_binary_request(base64.b64decode(user_data_b64), base64.b64decode(nonce_b64)))
+        log("Request sent, waiting for response...")
+        return parse_binary_response(reader.read_frame(sock))
+    log("Sending request")
+    sock.sendall(encode_request(user_data_b64, nonce_b64))
+    log("Request sent, waiting for response...")
+    return reader.read_document(sock)
+
+"""
+Get attestation document from enclave
+@param user_data_b64: User data in base64
+@param nonce_b64: Nonce in base64
+@param cid: CID of the enclave
+@param port: vsock port of the enclave
+@param address: Enclave address (see resolve_address); overrides cid and port
+@param max_size: Maximum size of the response in bytes
+@param binary: Whether to use the binary mode (length-prefixed CBOR) if the enclave supports it
+@return: Attestation document in base64
+"""
+def get_attestation_document(user_data_b64, nonce_b64, cid=CID, port=VSOCK_PORT, address=None,
+                             max_size=MAX_RESPONSE_SIZE, binary=False):
+    def exchange(reader, sock):
+        if binary:
+            return base64.b64encode(exchange_document(reader, sock, user_data_b64, nonce_b64, True)).decode()
+        log("Sending request")
+        sock.sendall(encode_request(user_data_b64, nonce_b64))
+        log("Request sent, waiting for response...")
+        return parse_response(reader.read_message(sock))
+    return request_attestation(cid, port, address, exchange, max_size)
+
+"""
+Get attestation document from enclave in CBOR. In JSON the base64 is decoded as the response
+arrives; in the binary mode the document is received as is.
+@param user_data_b64: User data in base64
+@param nonce_b64: Nonce in base64
+@param cid: CID of the enclave
+@param port: vsock port of the enclave
+@param address: Enclave address (see resolve_address); overrides cid and port
+@param max_size: Maximum size of the response in bytes
+@param binary: Whether to use the binary mode (length-prefixed CBOR) if the enclave supports it
+@return: Attestation document in CBOR
+"""
+def get_attestation_document_cbor(user_data_b64, nonce_b64, cid=CID, port=VSOCK_PORT, address=None,
+                                  max_size=MAX_RESPONSE_SIZE, binary=False):
+    return request_attestation(
+        cid, port, address,
+        lambda reader, sock: exchange_document(reader, sock, user_data_b64, nonce_b64, binary),
+        max_size,
+    )
+
 """
 Extract JSON report from CBOR-formatted attestation document
 @param attestation_document_b64: Attestation document in base64
 @return: JSON report
 """
 def extract_report_from_cbor(attestation_document_b64):
+    import cbor2
+
     try:
         # Base64 decode the attestation document into CBOR
         attestation_document_cbor = base64.b64decode(attestation_document_b64)
-        print(f"Decoded CBOR document size: {len(attestation_document_cbor)} bytes")
+        log(f"Decoded CBOR document size: {len(attestation_document_cbor)} bytes")
         
         # CBOR parse the attestation document
-        cbor_data = cbor2.loads(attestation_document_cbor)
-        print(f"CBOR structure: {type(cbor_data)}")
+        with metrics.span("cbor_decode"):
+            cbor_data = cbor2.loads(attestation_document_cbor)
+        log(f"CBOR structure: {type(cbor_data)}")
         
         # COSE Sign1 structure parse the attestation document
         if isinstance(cbor_data, list) and len(cbor_data) >= 4:
@@ -86,28 +195,29 @@ def extract_report_from_cbor(attestation_document_b64):
             payload = cbor_data[2]
             signature = cbor_data[3]
             
-            print(f"Protected header: {protected_header}")
-            print(f"Unprotected header: {unprotected_header}")
-            print(f"Payload type: {type(payload)}")
-            print(f"Signature length: {len(signature) if signature else 0}")
+            log(f"Protected header: {protected_header}")
+            log(f"Unprotected header: {unprotected_header}")
+            log(f"Payload type: {type(payload)}")
+            log(f"Signature length: {len(signature) if signature else 0}")
             
             # Parse payload as CBOR
             if isinstance(payload, bytes):
                 try:
-                    report_data = cbor2.loads(payload)
-                    print(f"Report data type: {type(report_data)}")
+                    with metrics.span("cbor_payload_decode"):
+                        report_data = cbor2.loads(payload)
+                    log(f"Report data type: {type(report_data)}")
                     return report_data, protected_header, signature, attestation_document_cbor
                 except Exception as e:
-                    print(f"Failed to parse payload as CBOR: {e}")
+                    log(f"Failed to parse payload as CBOR: {e}")
                     return payload, protected_header, signature, attestation_document_cbor
             else:
                 return payload, protected_header, signature, attestation_document_cbor
         else:
-            print(f"Unexpected CBOR structure: {cbor_data}")
+            log(f"Unexpected CBOR structure: {cbor_data}")
             return cbor_data, None, None, attestation_document_cbor
             
     except Exception as e:
-        print(f"Error extracting report from CBOR: {e}")
+        log(f"Error extracting report from CBOR: {e}")
         raise Exception(f"Failed to extract report from CBOR: {e}")
 
 """
@@ -116,6 +226,11 @@ Convert an EC public key to a COSE EC2 key
 @return: COSE EC2 key
 """
 def convert_pubkey_to_cosekey(ec_public_key):
+    from cose.keys import EC2Key
+    from cose.keys.curves import P384
+    from cose.keys.keyparam import KpKty, EC2KpX, EC2KpY, EC2KpCurve
+    from cose.keys.keytype import KtyEC2
+
     pt = ec_public_key.public_numbers()
     x = pt.x.to_bytes(48, byteorder='big')
     y = pt.y.to_bytes(48, byteorder='big')
@@ -128,6 +243,9 @@ Convert the COSE data to a COSE message
 @return: COSE message
 """
 def convert_cosedata_to_cosemsg(cose_data):
+    import cbor2
+    from cose.messages import CoseMessage
+
     # Load the COSE data as a list
     cose_list = cbor2.loads(cose_data)
     # Add the COSE Sign1 tag to the COSE list
@@ -143,6 +261,10 @@ Verify the COSE signature
 @return: True if the signature is valid, False otherwise
 """
 def verify_signature(cose_msg):
+    import cbor2
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+
     try:
         # Load the COSE message payload as a dictionary
         att_doc_data = cbor2.loads(cose_msg.payload)
@@ -155,7 +277,7 @@ def verify_signature(cose_msg):
         # Verify the signature
         return cose_msg.verify_signature()
     except Exception as e:
-        print(f"❌ Signature verification failed: {e}")
+        log(f"❌ Signature verification failed: {e}")
         return False
 
 """
@@ -165,6 +287,9 @@ Verify the certificate signature
 @return: True if the signature is valid, False otherwise
 """
 def verify_certificate_signature_ecdsa_sha384(cert_to_verify, signing_cert):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+
     try:
         # Get the public key from the signing certificate
         signing_public_key = signing_cert.public_key()
@@ -179,51 +304,87 @@ def verify_certificate_signature_ecdsa_sha384(cert_to_verify, signing_cert):
         return True
         
     except Exception as e:
-        print(f"❌ Certificate signature verification failed: {e}")
-        print(f"   Error type: {type(e)}")
+        log(f"❌ Certificate signature verification failed: {e}")
+        log(f"   Error type: {type(e)}")
         return False
 
+"""
+Load the certificate chain, looking up the links that were already verified. A cached link holds
+the parsed subject certificate, so it needs neither parsing nor a signature check.
+@param attestation_cert: Attestation certificate
+@param root_cert: Root certificate
+@param cabundle: Cabundle (list of intermediate certificates)
+@param cache: Cache of verified chain links (CertificateChainCache), or None
+@return: (certificate chain from the root to the leaf, cache key of each link or None, cached subject certificate of each link or None)
+"""
+def load_certificate_chain(attestation_cert, root_cert, cabundle, cache=None):
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+
+    cached_certs = [None] * (len(cabundle) + 1)
+    link_keys = None
+    if cache is not None:
+        chain_ders = [root_cert.public_bytes(serialization.Encoding.DER)]
+        chain_ders.extend(cabundle)
+        chain_ders.append(attestation_cert.public_bytes(serialization.Encoding.DER))
+        link_keys = [cache.link_key(chain_ders[i], chain_ders[i + 1]) for i in range(len(chain_ders) - 1)]
+        cached_certs = [cache.get(link_key) for link_key in link_keys]
+
+    # Load all intermediate certificates from the cabundle
+    cert_chain = [root_cert]
+    for i, cert_bytes in enumerate(cabundle):
+        cert = cached_certs[i]
+        if cert is None:
+            # Parse the certificate from the cabundle
+            cert = x509.load_der_x509_certificate(cert_bytes, default_backend())
+        cert_chain.append(cert)
+    cert_chain.append(attestation_cert)
+    return cert_chain, link_keys, cached_certs
+
 """
 Verify the certificate chain
 @param attestation_cert: Attestation certificate
 @param root_cert: Root certificate
 @param cabundle: Cabundle (list of intermediate certificates)
+@param cache: Cache of verified chain links (CertificateChainCache), or None to verify every link
 @return: True if the certificate chain is valid, False otherwise
 """
-def verify_certificate_chain(attestation_cert, root_cert, cabundle):
+def verify_certificate_chain(attestation_cert, root_cert, cabundle, cache=None):
     try:
-        print("Verifying certificate chain...")
+        log("Verifying certificate chain...")
         
-        print("Root certificate (Cert 0):")
-        print(f"   Subject: {root_cert.subject}")
-        print(f"   Issuer: {root_cert.issuer}")
+        # Formatting certificate names is costly, so skip it entirely in quiet mode
+        if not QUIET:
+            log("Root certificate (Cert 0):")
+            log(f"   Subject: {root_cert.subject}")
+            log(f"   Issuer: {root_cert.issuer}")
         
-        print(f"Intermediate certificates: {len(cabundle)} certificates")
-        
-        # Load all intermediate certificates from the cabundle
-        cert_chain = [root_cert]
-        for i, cert_bytes in enumerate(cabundle):
-            # Parse the certificate from the cabundle
-            cert = x509.load_der_x509_certificate(cert_bytes, default_backend())
-            # Add the certificate to the list of intermediate certificates
-            cert_chain.append(cert)
-            print(f"   Cert {i+1}:")
-            print(f"       Subject: {cert.subject}")
-            print(f"       Issuer:  {cert.issuer}")
+        log(f"Intermediate certificates: {len(cabundle)} certificates")
 
-        cert_chain.append(attestation_cert)
+        cert_chain, link_keys, cached_certs = load_certificate_chain(attestation_cert, root_cert, cabundle, cache)
 
-        print(f"Leaf certificate (Cert {len(cabundle) + 1}):")
-        print(f"   Subject: {attestation_cert.subject}")
-        print(f"   Issuer:  {attestation_cert.issuer}")
+        if not QUIET:
+            for i, cert in enumerate(cert_chain[1:-1]):
+                log(f"   Cert {i+1}:")
+                log(f"       Subject: {cert.subject}")
+                log(f"       Issuer:  {cert.issuer}")
+            log(f"Leaf certificate (Cert {len(cabundle) + 1}):")
+            log(f"   Subject: {attestation_cert.subject}")
+            log(f"   Issuer:  {attestation_cert.issuer}")
 
         for i in range(len(cert_chain) - 1):  # Reverse order
             current_cert = cert_chain[i+1]
             signing_cert = cert_chain[i]
+            if cached_certs[i] is not None:
+                log(f"✅ Cert {i} is signed by Cert {i + 1} (cached)")
+                continue
             if verify_certificate_signature_ecdsa_sha384(current_cert, signing_cert):
-                print(f"✅ Cert {i} is signed by Cert {i + 1}")
+                log(f"✅ Cert {i} is signed by Cert {i + 1}")
+                if cache is not None:
+                    cache.put(link_keys[i], current_cert, signing_cert)
             else:
-                print(f"❌ Cert {i} is not signed by Cert {i + 1}")
+                log(f"❌ Cert {i} is not signed by Cert {i + 1}")
                 return False
             
             current_cert = signing_cert
@@ -231,24 +392,55 @@ def verify_certificate_chain(attestation_cert, root_cert, cabundle):
         return True
         
     except Exception as e:
-        print(f"❌ Certificate chain verification failed: {e}")
+        log(f"❌ Certificate chain verification failed: {e}")
         return False
 
+"""
+Load the AWS Nitro root certificate
+@param path: Path to the root certificate in PEM
+@return: Root certificate
+"""
+def load_root_certificate(path=AWS_NITRO_ROOT_CERT_PATH):
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+
+    with open(path, "r") as f:
+        return x509.load_pem_x509_certificate(
+            f.read().encode(),
+            default_backend()
+        )
+
+"""
+Load the expected PCR values
+@param path: Path to the expected measurements in JSON
+@return: Dictionary of PCR index to expected PCR value in bytes
+"""
+def load_expected_measurements(path=EXPECTED_MEASUREMENTS_PATH):
+    with open(path, 'r') as f:
+        expected_measurements = json.load(f)
+
+    expected_pcrs = {}
+    for key, value in expected_measurements['Measurements'].items():
+        if key.startswith("PCR"):
+            expected_pcrs[int(key[3:])] = bytes.fromhex(value)
+    return expected_pcrs
+
 """
 Verify the report contents. This includes verifying the PCR values (specified in expected_measurements.json), user data, and nonce.
 @param report_data: Report data
 @param user_data: User data
 @param nonce: Nonce
+@param expected_pcrs: Expected PCR values (see load_expected_measurements), or None to load them from expected_measurements.json
+@param policy: Measurement policy (MeasurementPolicy) to match the PCR values against instead of expected_pcrs
+@param nonce_manager: Nonce manager (NonceManager) the nonce must have been issued by and not yet used with, or None
 @return: True if the report contents are valid, False otherwise
 """
-def verify_report_contents(report_data, user_data, nonce):
+def verify_report_contents(report_data, user_data, nonce, expected_pcrs=None, policy=None, nonce_manager=None):
     try:
         # expected_measurements.json load
-        with open(EXPECTED_MEASUREMENTS_PATH, 'r') as f:
-            expected_measurements = json.load(f)
-        
-        expected_pcrs = expected_measurements['Measurements']
-        print(f"Expected PCR values loaded from {EXPECTED_MEASUREMENTS_PATH}")
+        if expected_pcrs is None and policy is None:
+            expected_pcrs = load_expected_measurements()
+            log(f"Expected PCR values loaded from {EXPECTED_MEASUREMENTS_PATH}")
         
         # Get PCR values from report
         if 'pcrs' not in report_data:
@@ -256,139 +448,367 @@ def verify_report_contents(report_data, user_data, nonce):
         
         report_pcrs = report_data['pcrs']
         
-        # Verify PCR 0-2 values
-        for pcr_id in [0, 1, 2]:
-            expected_key = f"PCR{pcr_id}"
-            if expected_key not in expected_pcrs:
-                print(f"⚠️  Warning: {expected_key} not found in expected measurements")
-                continue
+        if policy is not None:
+            # Verify the PCR values against the allowlisted images
+            entry = policy.match(report_pcrs)
+            if entry is None:
+                log("❌ PCR values: no matching entry in the measurement policy")
+                return False
+            selected = ", ".join(f"PCR{pcr_id}" for pcr_id in entry.selector)
+            if entry.is_expired():
+                log(f"❌ PCR values: policy entry {entry.label} ({selected}) has expired")
+                return False
+            log(f"✅ PCR values: MATCH policy entry {entry.label} ({selected})")
+        else:
+            # Verify PCR 0-2 values
+            for pcr_id in [0, 1, 2]:
+                if pcr_id not in expected_pcrs:
+                    log(f"⚠️  Warning: PCR{pcr_id} not found in expected measurements")
+                    continue
             
-            expected_hex = expected_pcrs[expected_key]
-            expected_bytes = bytes.fromhex(expected_hex)
+                expected_bytes = expected_pcrs[pcr_id]
+                expected_hex = expected_bytes.hex()
             
-            if pcr_id not in report_pcrs:
-                raise Exception(f"PCR{pcr_id} not found in attestation document")
+                if pcr_id not in report_pcrs:
+                    raise Exception(f"PCR{pcr_id} not found in attestation document")
             
-            actual_bytes = report_pcrs[pcr_id]
+                actual_bytes = report_pcrs[pcr_id]
             
-            if expected_bytes == actual_bytes:
-                print(f"✅ PCR{pcr_id}: MATCH")
-                print(f"   Expected: {expected_hex}")
-                print(f"   Actual:   {actual_bytes.hex()}")
-            else:
-                print(f"❌ PCR{pcr_id}: MISMATCH")
-                print(f"   Expected: {expected_hex}")
-                print(f"   Actual:   {actual_bytes.hex()}")
-                return False
+                if expected_bytes == actual_bytes:
+                    log(f"✅ PCR{pcr_id}: MATCH")
+                    log(f"   Expected: {expected_hex}")
+                    log(f"   Actual:   {actual_bytes.hex()}")
+                else:
+                    log(f"❌ PCR{pcr_id}: MISMATCH")
+                    log(f"   Expected: {expected_hex}")
+                    log(f"   Actual:   {actual_bytes.hex()}")
+                    return False
         
         # Verify user data and nonce
         if 'user_data' in report_data:
             if report_data['user_data'] == user_data:
-                print("✅ User data: MATCH")
-                print(f"   Expected: {user_data}")
-                print(f"   Actual:   {report_data['user_data']}")
+                log("✅ User data: MATCH")
+                log(f"   Expected: {user_data}")
+                log(f"   Actual:   {report_data['user_data']}")
             else:
-                print("❌ User data: MISMATCH")
-                print(f"   Expected: {user_data}")
-                print(f"   Actual:   {report_data['user_data']}")
+                log("❌ User data: MISMATCH")
+                log(f"   Expected: {user_data}")
+                log(f"   Actual:   {report_data['user_data']}")
                 return False
         
         if 'nonce' in report_data:
             if report_data['nonce'] == nonce:
-                print("✅ Nonce: MATCH")
-                print(f"   Expected: {nonce.hex()}")
-                print(f"   Actual:   {report_data['nonce'].hex()}")
+                log("✅ Nonce: MATCH")
+                log(f"   Expected: {nonce.hex()}")
+                log(f"   Actual:   {report_data['nonce'].hex()}")
             else:
-                print("❌ Nonce: MISMATCH")
-                print(f"   Expected: {nonce.hex()}")
-                print(f"   Actual:   {report_data['nonce'].hex()}")
+                log("❌ Nonce: MISMATCH")
+                log(f"   Expected: {nonce.hex()}")
+                log(f"   Actual:   {report_data['nonce'].hex()}")
                 return False
         
+        # Accept each issued nonce once
+        if nonce_manager is not None and not consume_nonce(nonce_manager, report_data.get('nonce')):
+            return False
+        
         return True
         
     except FileNotFoundError:
-        print("Warning: expected-measurements.json not found, skipping PCR verification")
+        log("Warning: expected-measurements.json not found, skipping PCR verification")
         return False
     except Exception as e:
-        print(f"❌ Report contents verification failed: {e}")
+        log(f"❌ Report contents verification failed: {e}")
         return False
 
 """
-Verify the attestation document. This includes verifying the COSE signature, certificate chain, and report contents.
-@param attestation_doc_data: Attestation document data in JSON format
-@param attestation_doc_bytes: Attestation document bytes in CBOR format
+Verify the COSE signature of a parsed attestation document. The Sig_structure is built from the
+original protected header and payload bytes, and checked with the leaf certificate's public key.
+@param document: Parsed attestation document (AttestationDocument)
+@return: True if the signature is valid, False otherwise
+"""
+def verify_document_signature(document):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, utils
+    from document import COSE_ALG_ES384
+
+    try:
+        if document.algorithm != COSE_ALG_ES384:
+            raise Exception(f"Unsupported signature algorithm: {document.algorithm}")
+        if len(document.signature) != 96:
+            raise Exception(f"Unexpected signature length: {len(document.signature)}")
+
+        # COSE carries the ECDSA signature as r || s, cryptography expects DER
+        r = int.from_bytes(document.signature[:48], byteorder='big')
+        s = int.from_bytes(document.signature[48:], byteorder='big')
+        document.certificate.public_key().verify(
+            utils.encode_dss_signature(r, s),
+            document.sig_structure(),
+            ec.ECDSA(hashes.SHA384())
+        )
+        return True
+    except Exception as e:
+        log(f"❌ Signature verification failed: {e}")
+        return False
+
+# Thread pool shared by the low-latency verifications (see signature_executor)
+_signature_executor = None
+_signature_executor_lock = threading.Lock()
+
+"""
+Get the thread pool shared by the low-latency verifications, creating it on first use
+@param max_workers: Number of threads (default: ThreadPoolExecutor's default), used on creation only
+@return: ThreadPoolExecutor
+"""
+def signature_executor(max_workers=None):
+    global _signature_executor
+    with _signature_executor_lock:
+        if _signature_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _signature_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="signature")
+        return _signature_executor
+
+"""
+Verify the COSE signature and every uncached certificate chain link at the same time on a
+thread pool, so the latency is that of the slowest check rather than their sum (the ECDSA
+checks run in OpenSSL). Returns on the first invalid result; the checks not yet started are
+cancelled. Verified links are added to the cache only when all checks pass.
+@param document: Parsed attestation document (AttestationDocument)
+@param root_cert: Root certificate
+@param cache: Cache of verified chain links (CertificateChainCache), or None
+@param executor: Thread pool (e.g. signature_executor())
+@return: True if the signature and the certificate chain are valid, False otherwise
+"""
+def verify_signatures_parallel(document, root_cert, cache, executor):
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    try:
+        cert_chain, link_keys, cached_certs = load_certificate_chain(
+            document.certificate, root_cert, document.cabundle, cache)
+    except Exception as e:
+        log(f"❌ Certificate chain verification failed: {e}")
+        return False
+
+    checks = {executor.submit(verify_document_signature, document): "COSE signature"}
+    for i in range(len(cert_chain) - 1):
+        if cached_certs[i] is None:
+            checks[executor.submit(verify_certificate_signature_ecdsa_sha384, cert_chain[i + 1], cert_chain[i])] = \
+                f"Cert {i} is signed by Cert {i + 1}"
+    log(f"Running {len(checks)} signature checks in parallel ({len(cert_chain) - len(checks)} chain links cached)")
+
+    pending = set(checks)
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if not future.result():
+                    log(f"❌ {checks[future]}: invalid")
+                    return False
+                log(f"✅ {checks[future]}")
+    finally:
+        for future in pending:
+            future.cancel()
+
+    if cache is not None:
+        for i in range(len(cert_chain) - 1):
+            if cached_certs[i] is None:
+                cache.put(link_keys[i], cert_chain[i + 1], cert_chain[i])
+    return True
+
+"""
+Verify a parsed attestation document. This includes verifying the COSE signature, certificate chain, and report contents.
+@param document: Parsed attestation document (AttestationDocument)
 @param user_data: User data in bytes
 @param nonce: Nonce in bytes
+@param chain_cache: Cache of verified chain links (CertificateChainCache), or None
+@param root_cert: Preloaded root certificate, or None to load it from root.pem
+@param expected_pcrs: Preloaded expected PCR values, or None to load them from expected_measurements.json
+@param policy: Measurement policy (MeasurementPolicy) to match the PCR values against instead of expected_pcrs
+@param nonce_manager: Nonce manager (NonceManager) the nonce must have been issued by and not yet used with, or None
+@param executor: Thread pool to run the signature checks on in parallel (see verify_signatures_parallel), or None to run them in turn
 @return: True if the attestation document is valid, False otherwise
 """
-def verify_attestation_document(attestation_doc_data, attestation_doc_bytes, user_data, nonce):
+def verify_document(document, user_data, nonce, chain_cache=None, root_cert=None, expected_pcrs=None, policy=None,
+                    nonce_manager=None, executor=None):
+    with metrics.span("verify_document"):
+        return _verify_document_steps(document, user_data, nonce, chain_cache, root_cert, expected_pcrs, policy,
+                                      nonce_manager, executor)
+
+def _verify_document_steps(document, user_data, nonce, chain_cache, root_cert, expected_pcrs, policy, nonce_manager,
+                           executor):
     try:
-        print("Starting attestation document verification...")
-        print("-" * 50)
+        log("Starting attestation document verification...")
+        log("-" * 50)
         
         # Step 1: Load attestation certificate
-        print("Step 1: Extracting leaf certificate from attestation document...")
-        if 'certificate' not in attestation_doc_data:
-            raise Exception("No certificate found in attestation document")
-        
-        attestation_cert_bytes = attestation_doc_data['certificate']
-        attestation_cert = x509.load_der_x509_certificate(
-            attestation_cert_bytes,
-            default_backend()
-        )
-        print("Leaf certificate extracted")
-        print(f"   Subject: {attestation_cert.subject}")
-        print(f"   Issuer:  {attestation_cert.issuer}")
-        print("-" * 50)
-
-        # Step 2: Verify COSE signature
-        print("Step 2: Verifying COSE signature...")
-        cose_msg = convert_cosedata_to_cosemsg(attestation_doc_bytes)
-        
-        if verify_signature(cose_msg):
-            print("✅ COSE Signature is valid.")
+        log("Step 1: Extracting leaf certificate from attestation document...")
+        with metrics.span("leaf_certificate"):
+            attestation_cert = document.certificate
+        log("Leaf certificate extracted")
+        if not QUIET:
+            log(f"   Subject: {attestation_cert.subject}")
+            log(f"   Issuer:  {attestation_cert.issuer}")
+        log("-" * 50)
+
+        if executor is not None:
+            # Steps 2 and 3 at once: every signature check runs on the thread pool
+            log("Steps 2-3: Verifying COSE signature and certificate chain in parallel...")
+            if root_cert is None:
+                root_cert = load_root_certificate()
+            with metrics.span("parallel_signatures"):
+                signatures_valid = verify_signatures_parallel(document, root_cert, chain_cache, executor)
+            if signatures_valid:
+                log("✅ COSE Signature and certificate chain are valid.")
+            else:
+                log("❌ COSE Signature or certificate chain is invalid.")
+                return False
+            log("-" * 50)
         else:
-            print("❌ COSE Signature is invalid.")
-            return False
-        print("-" * 50)
-        
-        # Step 3: Verify certificate chain
-        print("Step 3: Verifying certificate chain...")
-        with open(AWS_NITRO_ROOT_CERT_PATH, "r") as f:
-            root_cert = x509.load_pem_x509_certificate(
-                f.read().encode(),
-                default_backend()
-            )
+            # Step 2: Verify COSE signature
+            log("Step 2: Verifying COSE signature...")
+            with metrics.span("cose_signature"):
+                signature_valid = verify_document_signature(document)
+            if signature_valid:
+                log("✅ COSE Signature is valid.")
+            else:
+                log("❌ COSE Signature is invalid.")
+                return False
+            log("-" * 50)
         
-        # Get intermediate certificates from cabundle
-        cabundle = attestation_doc_data.get('cabundle', None)
+            # Step 3: Verify certificate chain
+            log("Step 3: Verifying certificate chain...")
+            if root_cert is None:
+                root_cert = load_root_certificate()
 
-        # Verify the certificate chain
-        if verify_certificate_chain(attestation_cert, root_cert, cabundle):
-            print("✅ Certificate chain is valid.")
-        else:
-            print("❌ Certificate chain is invalid.")
-            return False
-        print("-" * 50)
+            # Verify the certificate chain
+            with metrics.span("certificate_chain"):
+                chain_valid = verify_certificate_chain(attestation_cert, root_cert, document.cabundle, chain_cache)
+            if chain_valid:
+                log("✅ Certificate chain is valid.")
+            else:
+                log("❌ Certificate chain is invalid.")
+                return False
+            log("-" * 50)
 
         # Step 4: Verify PCR values, user data, and nonce
-        print("Step 4: Verifying PCR values, user data, and nonce...")
-        if verify_report_contents(attestation_doc_data, user_data, nonce):
-            print("✅ Report contents are valid.")
+        log("Step 4: Verifying PCR values, user data, and nonce...")
+        with metrics.span("report_contents"):
+            report_valid = verify_report_contents(document.report, user_data, nonce, expected_pcrs, policy, nonce_manager)
+        if report_valid:
+            log("✅ Report contents are valid.")
         else:
-            print("❌ Report contents are invalid.")
+            log("❌ Report contents are invalid.")
             return False
-        print("-" * 50)
+        log("-" * 50)
 
         return True
         
     except Exception as e:
-        print(f"❌ Attestation document verification failed: {e}")
+        log(f"❌ Attestation document verification failed: {e}")
         return False
 
-def main():
-    user_data = b'hello'
-    nonce = secrets.token_bytes(64)
+"""
+Verify the attestation document. This includes verifying the COSE signature, certificate chain, and report contents.
+The report is taken from attestation_doc_bytes, which is what the COSE signature covers;
+attestation_doc_data is kept for compatibility.
+@param attestation_doc_data: Attestation document data in JSON format
+@param attestation_doc_bytes: Attestation document bytes in CBOR format
+@param user_data: User data in bytes
+@param nonce: Nonce in bytes
+@param chain_cache: Cache of verified chain links (CertificateChainCache), or None
+@param root_cert: Preloaded root certificate, or None to load it from root.pem
+@param expected_pcrs: Preloaded expected PCR values, or None to load them from expected_measurements.json
+@param verdict_cache: Cache of verdicts (VerdictCache), or None to always verify
+@param policy: Measurement policy (MeasurementPolicy) to match the PCR values against instead of expected_pcrs
+@param nonce_manager: Nonce manager (NonceManager) the nonce must have been issued by and not yet used with, or None
+@param executor: Thread pool to run the signature checks on in parallel (see verify_signatures_parallel), or None to run them in turn
+@return: True if the attestation document is valid, False otherwise
+"""
+def verify_attestation_document(attestation_doc_data, attestation_doc_bytes, user_data, nonce,
+                                chain_cache=None, root_cert=None, expected_pcrs=None, verdict_cache=None,
+                                policy=None, nonce_manager=None, executor=None):
+    from document import AttestationDocument
+
+    if verdict_cache is not None:
+        verdict_key = verdict_cache.key(attestation_doc_bytes, user_data, nonce)
+        verdict = verdict_cache.get(verdict_key)
+        if verdict is not None:
+            log(f"{'✅' if verdict else '❌'} Attestation document verdict found in cache")
+            # A cached document was presented before, so its nonce must still be checked for replay
+            if verdict and nonce_manager is not None:
+                return consume_nonce(nonce_manager, nonce)
+            return verdict
+
+        # A verdict is cached only if it depends on the document alone: failing to load the
+        # trust files is reported without caching it
+        try:
+            if root_cert is None:
+                root_cert = load_root_certificate()
+            if expected_pcrs is None and policy is None:
+                expected_pcrs = load_expected_measurements()
+        except Exception as e:
+            log(f"❌ Failed to load the trust state: {e}")
+            return False
+
+    try:
+        document = AttestationDocument(attestation_doc_bytes)
+    except Exception as e:
+        log(f"❌ Attestation document verification failed: {e}")
+        return False
+    if verdict_cache is None:
+        return verify_document(document, user_data, nonce, chain_cache, root_cert, expected_pcrs, policy,
+                               nonce_manager, executor)
+
+    # The nonce manager is consulted apart from the cached verdict, as a replay or a nonce
+    # server failure is not a property of the document
+    verdict = verify_document(document, user_data, nonce, chain_cache, root_cert, expected_pcrs, policy, None,
+                              executor)
+    if verdict and nonce_manager is not None and document.report.get('nonce') is None:
+        log("❌ Nonce: not found in attestation document")
+        verdict = False
+    verdict_cache.put(verdict_key, verdict, document)
+    if verdict and nonce_manager is not None:
+        return consume_nonce(nonce_manager, nonce)
+    return verdict
+
+"""
+Accept an issued nonce once
+@param nonce_manager: Nonce manager (NonceManager or RemoteNonceManager)
+@param nonce: Nonce in bytes
+@return: True if the nonce was issued and not used before, False otherwise
+"""
+def consume_nonce(nonce_manager, nonce):
+    try:
+        nonce_status = nonce_manager.consume(nonce)
+    except Exception as e:
+        log(f"❌ Nonce check failed: {e}")
+        return False
+    if nonce_status != "valid":
+        log(f"❌ Nonce: {nonce_status.upper()}")
+        return False
+    log("✅ Nonce: issued and not used before")
+    return True
+
+"""
+Read a stored attestation document: raw CBOR, or base64 as saved by earlier versions (.dat)
+@param path: Path to the document
+@return: Attestation document in CBOR
+"""
+def read_document_file(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    # A COSE_Sign1 document is a CBOR array of 4 (0x84), possibly tagged 18 (0xd2)
+    if data[:1] in (b'\x84', b'\xd2'):
+        return data
+    return base64.b64decode(data.strip(), validate=True)
+
+"""
+Request an attestation document and print the request parameters
+@param args: Parsed command line arguments
+@return: (attestation document in CBOR, user data, nonce)
+"""
+def fetch_document(args):
+    user_data = args.user_data.encode()
+    nonce = base64.b64decode(args.nonce) if args.nonce else secrets.token_bytes(64)
     user_data_b64 = base64.b64encode(user_data).decode()
     nonce_b64 = base64.b64encode(nonce).decode()
 
@@ -398,41 +818,146 @@ def main():
 
     print(f"User data: {user_data}")
     print(f"Nonce:     {nonce_b64}")
-    
-    # Get attestation document
-    attestation_document_b64 = get_attestation_document(user_data_b64, nonce_b64)
-    print(f"Attestation document length: {len(attestation_document_b64)} characters")
-    
-    # Save raw attestation document to file
-    document_filename = "attestation-document.dat"
-    with open(document_filename, "w") as f:
-        f.write(attestation_document_b64)
-    print(f"Raw attestation document saved to: {document_filename}")
-    
-    # Parse CBOR document
-    print("\n" + "="*50)
-    print("PARSING ATTESTATION DOCUMENT")
-    print("="*50)
-    print("Extracting report from CBOR document...")
-    attestation_doc_data, protected_header, signature, attestation_doc_bytes = extract_report_from_cbor(attestation_document_b64)
-    
-    # Save parsed JSON data
-    if isinstance(attestation_doc_data, dict):
-        document_filename = "attestation-document-json.json"
-        with open(document_filename, "w") as f:
-            f.write(str(attestation_doc_data))
-        print(f"Attestation document JSON saved to: {document_filename}")
-    
-    # Verify attestation document
+
+    document_bytes = get_attestation_document_cbor(user_data_b64, nonce_b64, args.cid, args.port, args.address,
+                                                   binary=args.binary)
+    print(f"Attestation document size: {len(document_bytes)} bytes")
+    return document_bytes, user_data, nonce
+
+"""
+Save an attestation document to a file, or append it to the evidence archive
+@param args: Parsed command line arguments
+@param document_bytes: Attestation document in CBOR
+@param document: Parsed document (AttestationDocument), or None to parse it when archiving
+"""
+def save_document(args, document_bytes, document=None):
+    if args.out:
+        with open(args.out, 'wb') as f:
+            f.write(document_bytes)
+        print(f"Attestation document saved to: {args.out}")
+        return
+    # Append the raw document to the evidence archive (query it with archive.py)
+    from archive import EvidenceArchive
+
+    with EvidenceArchive(args.archive) as archive:
+        evidence = archive.append(document_bytes, document)
+    print(f"Attestation document archived to: {args.archive} (SHA-256 {evidence.document_digest.hex()})")
+
+"""
+Verify an attestation document against the trust files given on the command line
+@param args: Parsed command line arguments
+@param document: Parsed document (AttestationDocument)
+@param user_data: User data in bytes
+@param nonce: Nonce in bytes
+@return: True if the attestation document is valid, False otherwise
+"""
+def verify_with_args(args, document, user_data, nonce):
+    from policy import MeasurementPolicy
+
     print("\n" + "="*50)
     print("VERIFYING ATTESTATION DOCUMENT")
     print("="*50)
-        
-    if verify_attestation_document(attestation_doc_data, attestation_doc_bytes, user_data, nonce):
+
+    valid = verify_document(document, user_data, nonce, root_cert=load_root_certificate(args.root_cert),
+                            policy=MeasurementPolicy.from_file(args.measurements),
+                            executor=signature_executor() if args.parallel else None)
+    if valid:
         print("\n✅ Attestation verification successful.")
     else:
         print("\n❌ Attestation verification failed.")
     print("-" * 50)
+    return valid
+
+def command_fetch(args):
+    document_bytes, _, _ = fetch_document(args)
+    save_document(args, document_bytes)
+    return 0
+
+def command_verify(args):
+    from document import AttestationDocument
+
+    document = AttestationDocument(read_document_file(args.file))
+    print(f"Attestation document: {args.file} ({len(document.cbor_bytes)} bytes)")
+    return 0 if verify_with_args(args, document, args.user_data.encode(), base64.b64decode(args.nonce)) else 1
+
+def command_fetch_and_verify(args):
+    from document import AttestationDocument
+
+    document_bytes, user_data, nonce = fetch_document(args)
+
+    # Parse CBOR document
+    print("\n" + "="*50)
+    print("PARSING ATTESTATION DOCUMENT")
+    print("="*50)
+    document = AttestationDocument(document_bytes)
+    print(f"Signature length: {len(document.signature)}")
+
+    try:
+        valid = verify_with_args(args, document, user_data, nonce)
+    finally:
+        # The document is kept even if it is invalid, and failing to keep it does not change the verdict
+        try:
+            save_document(args, document_bytes, document)
+        except Exception as e:
+            print(f"⚠️  Warning: Failed to save the attestation document: {e}")
+    return 0 if valid else 1
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Request and verify AWS Nitro Enclaves attestation documents")
+    parser.add_argument("--quiet", action="store_true", help="Print only the results, not every verification step")
+    commands = parser.add_subparsers(dest="command")
+
+    fetch_options = argparse.ArgumentParser(add_help=False)
+    fetch_options.add_argument("--cid", type=int, default=CID, help="CID of the enclave")
+    fetch_options.add_argument("--port", type=int, default=VSOCK_PORT, help="vsock port of the enclave")
+    fetch_options.add_argument("--address", default=None, help="vsock://CID:PORT, tcp://HOST:PORT or unix:///PATH "
+                                                               "(overrides --cid and --port)")
+    fetch_options.add_argument("--binary", action="store_true", help="Use the binary mode if the enclave supports it")
+    fetch_options.add_argument("--nonce", default=None, help="Nonce in base64 (default: 64 random bytes)")
+    fetch_options.add_argument("--out", default=None, help="Save the document (CBOR) to this file instead of the archive")
+    fetch_options.add_argument("--archive", default="evidence-archive", help="Evidence archive directory")
+
+    common_options = argparse.ArgumentParser(add_help=False)
+    common_options.add_argument("--user-data", default="hello", help="User data (text)")
+    # Also accepted after the command; SUPPRESS keeps a --quiet given before it
+    common_options.add_argument("--quiet", action="store_true", default=argparse.SUPPRESS,
+                                help="Print only the results, not every verification step")
+
+    verify_options = argparse.ArgumentParser(add_help=False)
+    verify_options.add_argument("--root-cert", default=AWS_NITRO_ROOT_CERT_PATH, help="AWS Nitro root certificate (PEM)")
+    verify_options.add_argument("--measurements", default=EXPECTED_MEASUREMENTS_PATH, help="Measurement policy (JSON)")
+    verify_options.add_argument("--parallel", action="store_true", help="Run the signature checks in parallel")
+
+    commands.add_parser("fetch", parents=[fetch_options, common_options],
+                        help="Request an attestation document and save it, without verifying it")
+    verify_parser = commands.add_parser("verify", parents=[common_options, verify_options],
+                                        help="Verify a stored attestation document, without contacting the enclave")
+    verify_parser.add_argument("file", help="Attestation document (CBOR, or base64 as in .dat files)")
+    verify_parser.add_argument("--nonce", required=True, help="Nonce the document was requested with, in base64")
+    commands.add_parser("fetch-and-verify", parents=[fetch_options, common_options, verify_options],
+                        help="Request an attestation document, save it and verify it (default)")
+
+    argv = sys.argv[1:]
+    # Without a command, behave as before: fetch and verify
+    position = 0
+    while position < len(argv) and argv[position] == "--quiet":
+        position += 1
+    if position == len(argv) or argv[position] not in ("fetch", "verify", "fetch-and-verify", "-h", "--help"):
+        argv.insert(position, "fetch-and-verify")
+    args = parser.parse_args(argv)
+    set_quiet(args.quiet)
+
+    try:
+        if args.command == "fetch":
+            return command_fetch(args)
+        if args.command == "verify":
+            return command_verify(args)
+        return command_fetch_and_verify(args)
+    except Exception as e:
+        print(f"❌ {e}")
+        return 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,430 @@
+import argparse
+import base64
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from batch import init_worker, verify_chunk
+from client import AWS_NITRO_ROOT_CERT_PATH, EXPECTED_MEASUREMENTS_PATH, resolve_address
+
+DEFAULT_LISTEN = "unix:///tmp/nitro-verifier.sock"
+DEFAULT_QUEUE_TIMEOUT = 1.0  # seconds a request waits for a queue slot before it is rejected
+MAX_BATCH_SIZE = 256  # documents per "documents" request
+PENDING_PER_WORKER = 16  # default queue slots per worker process
+WARM_UP_DELAY = 0.2  # seconds
+OVERLOADED = "Verifier overloaded, retry later"
+
+"""
+Decode one verification request item
+@param item: Object with "document", "user_data" and "nonce" in base64 and an optional "id"
+@return: (id, document in CBOR, user data, nonce)
+"""
+def decode_item(item):
+    return (
+        item.get('id'),
+        base64.b64decode(item['document'], validate=True),
+        base64.b64decode(item.get('user_data', ''), validate=True),
+        base64.b64decode(item.get('nonce', ''), validate=True),
+    )
+
+"""
+Return the process ID of a worker after a short wait, so that each warm-up call is taken by a
+different worker and every worker has run its initializer before the first request
+@param delay: Seconds to wait
+@return: Process ID
+"""
+def worker_pid(delay=WARM_UP_DELAY):
+    time.sleep(delay)
+    return os.getpid()
+
+"""
+Verification service keeping a pool of warm worker processes. Each worker loads the root
+certificate and the measurement policy once (see batch.init_worker) and reloads them only when
+a file changes, so a request costs a verification rather than a process start. The number of
+pending work items is bounded: a request waits up to queue_timeout for a slot and is rejected
+with an "overloaded" verdict otherwise. If a worker dies, the pool cannot be used anymore, so it
+is replaced by a new warm pool; the requests it was running fail and are not retried.
+@param workers: Number of worker processes (default: CPU count)
+@param max_pending: Maximum number of work items queued or in progress
+@param queue_timeout: Seconds a request waits for a queue slot
+@param root_cert_path: Path to the root certificate in PEM
+@param expected_measurements_path: Path to the measurement policy in JSON
+@param nonce_server: Address of a nonce server checking the nonces for replay, or None
+"""
+class VerifierService:
+    def __init__(self, workers=None, max_pending=None, queue_timeout=DEFAULT_QUEUE_TIMEOUT,
+                 root_cert_path=AWS_NITRO_ROOT_CERT_PATH, expected_measurements_path=EXPECTED_MEASUREMENTS_PATH,
+                 nonce_server=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * PENDING_PER_WORKER
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()  # Held while the pool is replaced
+        self._stats = {'requests': 0, 'documents': 0, 'valid': 0, 'invalid': 0, 'errors': 0, 'rejected': 0, 'pending': 0,
+                       'pool_restarts': 0}
+        self._initargs = (os.path.abspath(root_cert_path), os.path.abspath(expected_measurements_path), nonce_server)
+        self._closed = False
+        self._executor = self._create_pool()
+
+    def _create_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=self._initargs)
+
+    def _warm_up_pool(self, executor):
+        futures = [executor.submit(worker_pid) for _ in range(self.workers)]
+        return sorted({future.result() for future in futures})
+
+    """
+    Start every worker process and load its trust state before the first request
+    @return: Process IDs of the workers
+    """
+    def warm_up(self):
+        return self._warm_up_pool(self._executor)
+
+    """
+    Replace a broken pool by a new warm one
+    @param broken: The pool found broken; nothing is done if it was already replaced
+    """
+    def _restart_pool(self, broken):
+        with self._pool_lock:
+            if self._closed or self._executor is not broken:
+                return
+            executor = self._create_pool()
+            try:
+                self._warm_up_pool(executor)
+            except Exception as e:
+                # Serve from the new pool anyway; a worker failing again triggers another restart
+                print(f"⚠️  Warning: Failed to warm up the new worker pool: {e}")
+            self._executor = executor
+            with self._lock:
+                self._stats['pool_restarts'] += 1
+        print("⚠️  Warning: A worker process died; the worker pool was restarted")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, verdicts):
+        with self._lock:
+            self._stats['pending'] -= 1
+            for verdict in verdicts:
+                self._stats['documents'] += 1
+                if verdict['error'] is not None:
+                    self._stats['errors'] += 1
+                elif verdict['valid']:
+                    self._stats['valid'] += 1
+                else:
+                    self._stats['invalid'] += 1
+
+    def _done(self, executor, future):
+        self._slots.release()
+        if not future.cancelled() and future.exception() is None:
+            self._count(future.result())
+            return
+        self._count([])
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool) and self._executor is executor:
+            # Done callbacks run on the broken pool's management thread, which must not wait for the new pool
+            threading.Thread(target=self._restart_pool, args=(executor,), daemon=True).start()
+
+    def _submit(self, chunk):
+        executor = self._executor
+        try:
+            return executor, executor.submit(verify_chunk, chunk)
+        except BrokenProcessPool:
+            self._restart_pool(executor)
+            executor = self._executor
+            return executor, executor.submit(verify_chunk, chunk)
+
+    """
+    Queue documents for verification
+    @param chunk: List of (id, document in CBOR, user data, nonce)
+    @return: Future of the list of verdicts, or None if the queue stayed full for queue_timeout
+    """
+    def submit(self, chunk):
+        with self._lock:
+            self._stats['requests'] += 1
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._stats['rejected'] += 1
+            return None
+        with self._lock:
+            self._stats['pending'] += 1
+        try:
+            executor, future = self._submit(chunk)
+        except Exception:
+            self._slots.release()
+            self._count([])
+            raise
+        future.add_done_callback(lambda done: self._done(executor, done))
+        return future
+
+    """
+    Handle one request
+    @param request: Request (parsed JSON): a document to verify, {"documents": [...]}, or {"op": "stats"}
+    @return: Response, or a Future of the response
+    """
+    def handle(self, request):
+        if request.get('op') == 'stats':
+            return self.stats()
+        try:
+            if 'documents' in request:
+                if len(request['documents']) > MAX_BATCH_SIZE:
+                    raise ValueError(f"more than {MAX_BATCH_SIZE} documents in one request")
+                chunk = [decode_item(item) for item in request['documents']]
+            else:
+                chunk = [decode_item(request)]
+        except Exception as e:
+            return {'id': request.get('id'), 'valid': False, 'error': f"Invalid request: {e}"}
+
+        future = self.submit(chunk)
+        if future is None:
+            verdicts = [{'id': record_id, 'valid': False, 'error': OVERLOADED} for record_id, *_ in chunk]
+            return {'verdicts': verdicts} if 'documents' in request else verdicts[0]
+
+        response = Future()
+
+        def complete(done):
+            try:
+                verdicts = done.result()
+            except Exception as e:
+                # A worker died and the pool is being replaced. The request is not retried, as its
+                # nonce may already have been consumed.
+                verdicts = [{'id': record_id, 'valid': False, 'error': f"Worker failed: {e}"} for record_id, *_ in chunk]
+            response.set_result({'verdicts': verdicts} if 'documents' in request else verdicts[0])
+        future.add_done_callback(complete)
+        return response
+
+    """
+    Get service statistics
+    @return: Dictionary of request, verdict and queue counts, and of worker pool restarts
+    """
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = self.workers
+        stats['max_pending'] = self.max_pending
+        return stats
+
+    def close(self):
+        with self._pool_lock:
+            self._closed = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+"""
+Connection handler of the verifier daemon: newline-terminated JSON requests and responses.
+Requests are read ahead and queued, so a client may pipeline many requests on one connection;
+responses come back in request order.
+"""
+class VerifierRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        responses = queue.Queue()
+        writer = threading.Thread(target=self.write_responses, args=(responses,), daemon=True)
+        writer.start()
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                    responses.put(self.server.service.handle(request))
+                except Exception as e:
+                    responses.put({'error': str(e)})
+        except OSError:
+            pass
+        responses.put(None)
+        writer.join()
+
+    """
+    Write the responses of a connection in request order
+    @param responses: Queue of responses or futures of responses, ended by None
+    """
+    def write_responses(self, responses):
+        failed = False
+        while True:
+            response = responses.get()
+            if response is None:
+                break
+            if isinstance(response, Future):
+                response = response.result()
+            if failed:
+                continue  # Keep draining so the reader is never blocked
+            try:
+                self.wfile.write((json.dumps(response) + "\n").encode())
+                if responses.empty():
+                    self.wfile.flush()
+            except OSError:
+                failed = True
+
+class ThreadingUnixVerifierServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+class ThreadingTCPVerifierServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+"""
+Create a verifier daemon server
+@param address: Listen address, "unix:///PATH" or "tcp://HOST:PORT"
+@param service: VerifierService
+@return: Server (call serve_forever to run it)
+"""
+def create_verifier_server(address, service):
+    _, sockaddr = resolve_address(address)
+    if address.startswith("unix://"):
+        if os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+        server = ThreadingUnixVerifierServer(sockaddr, VerifierRequestHandler)
+        os.chmod(sockaddr, 0o600)
+    elif address.startswith("tcp://"):
+        server = ThreadingTCPVerifierServer(sockaddr, VerifierRequestHandler)
+    else:
+        raise Exception(f"The verifier daemon listens on unix:// or tcp:// only, not {address}")
+    server.service = service
+    return server
+
+"""
+Client of the verifier daemon. Each thread uses its own connection; verify_many pipelines
+requests on it.
+@param address: Address of the verifier daemon (see resolve_address)
+@param timeout: Socket timeout in seconds
+"""
+class VerifierClient:
+    def __init__(self, address=DEFAULT_LISTEN, timeout=30):
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            family, sockaddr = resolve_address(self.address)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(sockaddr)
+            local.pid = os.getpid()
+            local.sock = sock
+            local.file = sock.makefile('rwb')
+        return local
+
+    def _reset(self, local):
+        try:
+            local.file.close()
+            local.sock.close()
+        except OSError:
+            pass
+        local.pid = None
+
+    def _send(self, local, request):
+        local.file.write((json.dumps(request) + "\n").encode())
+
+    def _receive(self, local):
+        line = local.file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by verifier daemon")
+        return json.loads(line)
+
+    def _call(self, request):
+        local = self._connection()
+        try:
+            self._send(local, request)
+            local.file.flush()
+            return self._receive(local)
+        except BaseException:
+            # A late response would otherwise be read as the answer to the next request
+            self._reset(local)
+            raise
+
+    """
+    Verify an attestation document
+    @param document: Attestation document in CBOR
+    @param user_data: User data in bytes
+    @param nonce: Nonce in bytes
+    @param record_id: Identifier echoed in the verdict
+    @return: Verdict dictionary (id, valid, error, elapsed_ms)
+    """
+    def verify(self, document, user_data, nonce, record_id=None):
+        return self._call(encode_item(record_id, document, user_data, nonce))
+
+    """
+    Verify many attestation documents, keeping up to window requests in flight
+    @param records: Iterable of (id, document in CBOR, user data, nonce)
+    @param window: Maximum number of requests sent ahead of their verdicts
+    @return: Iterator of verdict dictionaries, in input order
+    """
+    def verify_many(self, records, window=256):
+        local = self._connection()
+        in_flight = 0
+        try:
+            for record in records:
+                item = encode_item(*record)
+                in_flight += 1
+                self._send(local, item)
+                if in_flight >= window:
+                    local.file.flush()
+                    verdict = self._receive(local)
+                    in_flight -= 1
+                    yield verdict
+            local.file.flush()
+            while in_flight:
+                verdict = self._receive(local)
+                in_flight -= 1
+                yield verdict
+        finally:
+            # Verdicts still owed (an error, or the caller stopped early) would be read by the next request
+            if in_flight:
+                self._reset(local)
+
+    def stats(self):
+        return self._call({'op': 'stats'})
+
+"""
+Encode one verification request item
+@param record_id: Identifier echoed in the verdict, or None
+@param document: Attestation document in CBOR
+@param user_data: User data in bytes
+@param nonce: Nonce in bytes
+@return: Request item (JSON-serializable)
+"""
+def encode_item(record_id, document, user_data, nonce):
+    return {
+        'id': record_id,
+        'document': base64.b64encode(document).decode(),
+        'user_data': base64.b64encode(user_data).decode(),
+        'nonce': base64.b64encode(nonce).decode(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve attestation document verification from a pool of warm workers")
+    parser.add_argument("--listen", default=DEFAULT_LISTEN, help="unix:///PATH or tcp://HOST:PORT")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help=f"Maximum number of queued requests (default: {PENDING_PER_WORKER} per worker)")
+    parser.add_argument("--queue-timeout", type=float, default=DEFAULT_QUEUE_TIMEOUT,
+                        help="Seconds a request waits for a queue slot before it is rejected")
+    parser.add_argument("--root-cert", default=AWS_NITRO_ROOT_CERT_PATH, help="AWS Nitro root certificate (PEM)")
+    parser.add_argument("--measurements", default=EXPECTED_MEASUREMENTS_PATH, help="Measurement policy (JSON)")
+    parser.add_argument("--nonce-server", default=None, help="Address of a nonce server (see nonces.py)")
+    args = parser.parse_args()
+
+    service = VerifierService(args.workers, args.max_pending, args.queue_timeout,
+                              args.root_cert, args.measurements, args.nonce_server)
+    start = time.perf_counter()
+    pids = service.warm_up()
+    print(f"Started {len(pids)} workers in {time.perf_counter() - start:.2f} seconds")
+    server = create_verifier_server(args.listen, service)
+    print(f"Verifier daemon listening on {args.listen}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import base64
+
+import cbor2
+
+import metrics
+
+COSE_SIGN1_TAG = 18
+COSE_HEADER_ALG = 1
+COSE_ALG_ES384 = -35
+
+# CBOR encoding of the constant part of the COSE Sig_structure:
+# array(4), "Signature1", then (after the protected header) an empty external_aad
+SIG_STRUCTURE_PREFIX = b'\x84' + cbor2.dumps("Signature1")
+SIG_STRUCTURE_EXTERNAL_AAD = b'\x40'
+
+"""
+Encode the CBOR header of a byte string
+@param length: Length of the byte string
+@return: CBOR header bytes (major type 2)
+"""
+def cbor_bstr_header(length):
+    if length < 24:
+        return bytes([0x40 | length])
+    if length < 0x100:
+        return bytes([0x58, length])
+    if length < 0x10000:
+        return b'\x59' + length.to_bytes(2, byteorder='big')
+    if length < 0x100000000:
+        return b'\x5a' + length.to_bytes(4, byteorder='big')
+    return b'\x5b' + length.to_bytes(8, byteorder='big')
+
+"""
+Attestation document parsed in a single pass. The COSE_Sign1 structure and the payload
+are each decoded once; the certificates are parsed on first use and then reused.
+@param cbor_bytes: Attestation document in CBOR
+"""
+class AttestationDocument:
+    def __init__(self, cbor_bytes):
+        self.cbor_bytes = cbor_bytes
+
+        with metrics.span("cbor_decode"):
+            cose_obj = cbor2.loads(cbor_bytes)
+        if isinstance(cose_obj, cbor2.CBORTag):
+            if cose_obj.tag != COSE_SIGN1_TAG:
+                raise Exception(f"Unexpected CBOR tag: {cose_obj.tag}")
+            cose_obj = cose_obj.value
+        if not isinstance(cose_obj, (list, tuple)) or len(cose_obj) != 4:
+            raise Exception("Attestation document is not a COSE_Sign1 structure")
+
+        # COSE Sign1 format: [protected, unprotected, payload, signature]
+        self.protected_header, self.unprotected_header, self.payload, self.signature = cose_obj
+        if not isinstance(self.protected_header, bytes) or not isinstance(self.payload, bytes):
+            raise Exception("Malformed COSE_Sign1 structure")
+
+        with metrics.span("cbor_payload_decode"):
+            self.report = cbor2.loads(self.payload)
+        if not isinstance(self.report, dict):
+            raise Exception("Attestation document payload is not a map")
+
+        self._certificate = None
+
+    """
+    Parse an attestation document in base64
+    @param attestation_document_b64: Attestation document in base64
+    @return: AttestationDocument
+    """
+    @classmethod
+    def from_base64(cls, attestation_document_b64):
+        return cls(base64.b64decode(attestation_document_b64))
+
+    """
+    Get the signature algorithm from the protected header
+    @return: COSE algorithm identifier
+    """
+    @property
+    def algorithm(self):
+        protected = cbor2.loads(self.protected_header) if self.protected_header else {}
+        return protected.get(COSE_HEADER_ALG)
+
+    """
+    Get the leaf certificate, parsed once
+    @return: Leaf certificate
+    """
+    @property
+    def certificate(self):
+        if self._certificate is None:
+            # cryptography is loaded on first use, so parsing alone (e.g. to archive) does not load it
+            from cryptography import x509
+            from cryptography.hazmat.backends import default_backend
+
+            if 'certificate' not in self.report:
+                raise Exception("No certificate found in attestation document")
+            self._certificate = x509.load_der_x509_certificate(self.report['certificate'], default_backend())
+        return self._certificate
+
+    """
+    Get the intermediate certificates in DER
+    @return: List of certificates in DER
+    """
+    @property
+    def cabundle(self):
+        return self.report.get('cabundle') or []
+
+    """
+    Get the PCR values
+    @return: Dictionary of PCR index to PCR value in bytes
+    """
+    @property
+    def pcrs(self):
+        return self.report.get('pcrs', {})
+
+    """
+    Build the COSE Sig_structure directly from the original protected header and payload bytes
+    @return: Sig_structure in CBOR
+    """
+    def sig_structure(self):
+        return b''.join((
+            SIG_STRUCTURE_PREFIX,
+            cbor_bstr_header(len(self.protected_header)),
+            self.protected_header,
+            SIG_STRUCTURE_EXTERNAL_AAD,
+            cbor_bstr_header(len(self.payload)),
+            self.payload,
+        ))
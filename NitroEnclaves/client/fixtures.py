@@ -0,0 +1,172 @@
+import argparse
+import base64
+import datetime
+import json
+import os
+import secrets
+import sys
+
+import cbor2
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, utils
+
+from document import COSE_ALG_ES384, COSE_HEADER_ALG
+
+DEFAULT_DEPTH = 3  # intermediates below the root, as in AWS cabundles
+DEFAULT_VALIDITY = datetime.timedelta(days=30)
+NUM_PCRS = 16
+
+"""
+Build a certificate
+@param common_name: Subject common name
+@param public_key: Subject public key
+@param issuer_name: Issuer name
+@param issuer_key: Issuer private key
+@param is_ca: Whether the certificate is a CA certificate
+@param validity: Validity period
+@return: Certificate
+"""
+def make_certificate(common_name, public_key, issuer_name, issuer_key, is_ca, validity=DEFAULT_VALIDITY):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    subject_name = x509.Name([
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Synthetic Nitro Test CA"),
+        x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+    ])
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(subject_name)
+        .issuer_name(issuer_name or subject_name)
+        .public_key(public_key)
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + validity)
+        .add_extension(x509.BasicConstraints(ca=is_ca, path_length=None), critical=True)
+    )
+    return builder.sign(issuer_key, hashes.SHA384())
+
+"""
+Generate a P-384 private key
+@return: EC private key
+"""
+def make_key():
+    return ec.generate_private_key(ec.SECP384R1())
+
+"""
+Synthetic stand-in for the Nitro attestation PKI and NSM. It mints a root CA, a cabundle of
+intermediates and a P-384 leaf certificate, and signs COSE_Sign1 attestation documents
+with the leaf key in the same layout as NSM.
+@param depth: Number of intermediate certificates below the root
+@param pcrs: Dictionary of PCR index to PCR value in bytes (random if None)
+"""
+class SyntheticEnclave:
+    def __init__(self, depth=DEFAULT_DEPTH, pcrs=None):
+        self.root_key = make_key()
+        self.root_cert = make_certificate("root", self.root_key.public_key(), None, self.root_key, True)
+
+        # As in AWS documents, the cabundle starts with the root certificate
+        self.cabundle = [self.root_cert]
+        issuer_key, issuer_cert = self.root_key, self.root_cert
+        for i in range(depth):
+            key = make_key()
+            cert = make_certificate(f"intermediate-{i + 1}", key.public_key(), issuer_cert.subject, issuer_key, True)
+            self.cabundle.append(cert)
+            issuer_key, issuer_cert = key, cert
+
+        self.leaf_key = make_key()
+        self.leaf_cert = make_certificate("i-synthetic-enc0123456789abcdef", self.leaf_key.public_key(),
+                                          issuer_cert.subject, issuer_key, False)
+
+        if pcrs is None:
+            pcrs = {i: secrets.token_bytes(48) for i in range(3)}
+        self.pcrs = {i: pcrs.get(i, bytes(48)) for i in range(NUM_PCRS)}
+
+        self._cabundle_ders = [cert.public_bytes(serialization.Encoding.DER) for cert in self.cabundle]
+        self._leaf_der = self.leaf_cert.public_bytes(serialization.Encoding.DER)
+
+    """
+    Mint an attestation document
+    @param user_data: User data in bytes
+    @param nonce: Nonce in bytes
+    @param public_key: Public key in bytes
+    @return: Attestation document in CBOR
+    """
+    def attest(self, user_data=None, nonce=None, public_key=None):
+        payload = cbor2.dumps({
+            'module_id': "i-synthetic-enc0123456789abcdef",
+            'digest': "SHA384",
+            'timestamp': int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000),
+            'pcrs': self.pcrs,
+            'certificate': self._leaf_der,
+            'cabundle': self._cabundle_ders,
+            'public_key': public_key,
+            'user_data': user_data,
+            'nonce': nonce,
+        })
+        protected_header = cbor2.dumps({COSE_HEADER_ALG: COSE_ALG_ES384})
+        sig_structure = cbor2.dumps(["Signature1", protected_header, b'', payload])
+
+        # COSE carries the ECDSA signature as r || s
+        r, s = utils.decode_dss_signature(self.leaf_key.sign(sig_structure, ec.ECDSA(hashes.SHA384())))
+        signature = r.to_bytes(48, byteorder='big') + s.to_bytes(48, byteorder='big')
+        return cbor2.dumps([protected_header, {}, payload, signature])
+
+    """
+    Get the expected PCR values in the format of load_expected_measurements
+    @return: Dictionary of PCR index to PCR value in bytes
+    """
+    def expected_pcrs(self):
+        return {i: self.pcrs[i] for i in range(3)}
+
+    """
+    Write the root certificate and the expected measurements
+    @param directory: Output directory
+    @return: (root certificate path, expected measurements path)
+    """
+    def write_trust_files(self, directory):
+        root_cert_path = os.path.join(directory, "root.pem")
+        with open(root_cert_path, "wb") as f:
+            f.write(self.root_cert.public_bytes(serialization.Encoding.PEM))
+
+        expected_measurements_path = os.path.join(directory, "expected-measurements.json")
+        measurements = {'HashAlgorithm': "Sha384 { ... }"}
+        for i in range(3):
+            measurements[f"PCR{i}"] = self.pcrs[i].hex()
+        with open(expected_measurements_path, "w") as f:
+            json.dump({'Measurements': measurements}, f, indent=2)
+
+        return root_cert_path, expected_measurements_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Nitro attestation documents")
+    parser.add_argument("--out", default="fixtures", help="Output directory")
+    parser.add_argument("--count", type=int, default=100, help="Number of documents")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="Number of intermediate certificates")
+    parser.add_argument("--user-data-size", type=int, default=32, help="Size of user data in bytes")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    enclave = SyntheticEnclave(depth=args.depth)
+    root_cert_path, expected_measurements_path = enclave.write_trust_files(args.out)
+
+    documents_path = os.path.join(args.out, "documents.jsonl")
+    with open(documents_path, "w") as f:
+        for i in range(args.count):
+            user_data = secrets.token_bytes(args.user_data_size)
+            nonce = secrets.token_bytes(64)
+            record = {
+                'id': i,
+                'document': base64.b64encode(enclave.attest(user_data, nonce)).decode(),
+                'user_data': base64.b64encode(user_data).decode(),
+                'nonce': base64.b64encode(nonce).decode(),
+            }
+            f.write(json.dumps(record) + "\n")
+
+    print(f"Root certificate saved to: {root_cert_path}")
+    print(f"Expected measurements saved to: {expected_measurements_path}")
+    print(f"{args.count} attestation documents saved to: {documents_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import argparse
+import base64
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+
+from client import get_attestation_document, get_attestation_document_cbor, set_quiet
+from session import AttestationSession
+
+DEFAULT_TARGET = "tcp://127.0.0.1:5000"
+DEFAULT_CLIENTS = 8
+DEFAULT_DURATION = 10  # seconds
+
+"""
+Compute a percentile of sorted samples
+@param samples: Sorted samples
+@param percentile: Percentile (0-100)
+@return: Sample at the percentile, or 0.0 if there are no samples
+"""
+def percentile(samples, percentile):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+"""
+Load generator driving concurrent clients against an enclave or a stand-in server
+@param target: Enclave address (see resolve_address)
+@param clients: Number of concurrent clients
+@param reuse: Whether clients keep their connection open across requests
+@param verifier: NitroVerifier used to verify every document, or None
+@param binary: Whether to use the binary mode (length-prefixed CBOR)
+"""
+class LoadGenerator:
+    def __init__(self, target, clients=DEFAULT_CLIENTS, reuse=True, verifier=None, binary=False):
+        self.target = target
+        self.clients = clients
+        self.reuse = reuse
+        self.verifier = verifier
+        self.binary = binary
+        self.latencies = []
+        self.errors = 0
+        self.failed_verifications = 0
+        self._lock = threading.Lock()
+
+    """
+    Run one client until the deadline or the request budget is reached
+    @param deadline: time.monotonic() deadline
+    @param requests: Number of requests, or None for no limit
+    """
+    def _run_client(self, deadline, requests):
+        session = AttestationSession(max_connections=1, binary=self.binary) if self.reuse else None
+        user_data = b'hello'
+        user_data_b64 = base64.b64encode(user_data).decode()
+        latencies = []
+        errors = 0
+        failed_verifications = 0
+
+        sent = 0
+        while time.monotonic() < deadline and (requests is None or sent < requests):
+            sent += 1
+            nonce = secrets.token_bytes(64)
+            nonce_b64 = base64.b64encode(nonce).decode()
+            start = time.perf_counter()
+            try:
+                if self.verifier is None:
+                    if session is not None:
+                        session.get_attestation_document(user_data_b64, nonce_b64, address=self.target)
+                    else:
+                        get_attestation_document(user_data_b64, nonce_b64, address=self.target, binary=self.binary)
+                else:
+                    if session is not None:
+                        document = session.get_attestation_document_cbor(user_data_b64, nonce_b64, address=self.target)
+                    else:
+                        document = get_attestation_document_cbor(
+                            user_data_b64, nonce_b64, address=self.target, binary=self.binary)
+                    if not self.verifier.verify(document, user_data, nonce):
+                        failed_verifications += 1
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+        if session is not None:
+            session.close()
+        with self._lock:
+            self.latencies.extend(latencies)
+            self.errors += errors
+            self.failed_verifications += failed_verifications
+
+    """
+    Run all clients
+    @param duration: Maximum duration in seconds
+    @param requests: Number of requests per client, or None for no limit
+    @return: Dictionary of throughput and latency statistics
+    """
+    def run(self, duration=DEFAULT_DURATION, requests=None):
+        deadline = time.monotonic() + duration
+        threads = [
+            threading.Thread(target=self._run_client, args=(deadline, requests), daemon=True)
+            for _ in range(self.clients)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(self.latencies)
+        return {
+            'target': str(self.target),
+            'clients': self.clients,
+            'reuse_connections': self.reuse,
+            'verify': self.verifier is not None,
+            'binary': self.binary,
+            'requests': len(latencies),
+            'errors': self.errors,
+            'failed_verifications': self.failed_verifications,
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 3),
+                'p95': round(percentile(latencies, 95) * 1000, 3),
+                'p99': round(percentile(latencies, 99) * 1000, 3),
+            },
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent attestation requests and report throughput")
+    parser.add_argument("--target", default=DEFAULT_TARGET, help="tcp://HOST:PORT, unix:///PATH or vsock://CID:PORT")
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="Duration in seconds")
+    parser.add_argument("--requests", type=int, default=None, help="Requests per client (default: until the duration)")
+    parser.add_argument("--no-reuse", action="store_true", help="Open a new connection for every request")
+    parser.add_argument("--verify", action="store_true", help="Verify every document")
+    parser.add_argument("--binary", action="store_true", help="Use the binary mode (length-prefixed CBOR)")
+    parser.add_argument("--trust-dir", default=".", help="Directory with root.pem and expected-measurements.json")
+    parser.add_argument("--json", help="Save the statistics to a JSON file")
+    args = parser.parse_args()
+
+    set_quiet(True)
+
+    verifier = None
+    if args.verify:
+        from verifier import NitroVerifier
+        verifier = NitroVerifier(
+            os.path.join(args.trust_dir, "root.pem"),
+            os.path.join(args.trust_dir, "expected-measurements.json"),
+        )
+
+    print(f"Driving {args.clients} clients against {args.target}...")
+    stats = LoadGenerator(args.target, args.clients, not args.no_reuse, verifier, args.binary).run(args.duration, args.requests)
+
+    print(f"Requests:     {stats['requests']} ({stats['errors']} errors, "
+          f"{stats['failed_verifications']} failed verifications)")
+    print(f"Throughput:   {stats['requests_per_second']} requests/s")
+    print(f"Latency (ms): p50 {stats['latency_ms']['p50']}, p95 {stats['latency_ms']['p95']}, "
+          f"p99 {stats['latency_ms']['p99']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(stats, f, indent=2)
+        print(f"Statistics saved to: {args.json}")
+    return 0 if stats['errors'] == 0 and stats['failed_verifications'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+
+DEFAULT_MAX_SAMPLES = 10000
+QUANTILES = (0.5, 0.95, 0.99)
+PROMETHEUS_METRIC = "nitro_attestation_stage_seconds"
+
+"""
+Timing histogram of one stage. Count and sum cover every observation; the quantiles
+are computed over the most recent max_samples observations to keep memory bounded.
+@param max_samples: Number of recent observations kept for the quantiles
+"""
+class Histogram:
+    def __init__(self, max_samples=DEFAULT_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.count = 0
+        self.sum = 0.0
+        self._samples = []
+        self._next = 0
+
+    """
+    Record an observation
+    @param seconds: Duration in seconds
+    """
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        if len(self._samples) < self.max_samples:
+            self._samples.append(seconds)
+        else:
+            self._samples[self._next] = seconds
+            self._next = (self._next + 1) % self.max_samples
+
+    """
+    Summarize the histogram
+    @return: Dictionary of count, sum and quantiles (p50/p95/p99) in seconds
+    """
+    def summary(self):
+        samples = sorted(self._samples)
+        summary = {'count': self.count, 'sum': self.sum}
+        for quantile in QUANTILES:
+            key = f"p{int(quantile * 100)}"
+            if samples:
+                summary[key] = samples[min(len(samples) - 1, int(quantile * len(samples)))]
+            else:
+                summary[key] = 0.0
+        return summary
+
+"""
+Span timing one stage; records into the registry when the block exits
+@param name: Stage name
+"""
+class Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+"""
+Span used while instrumentation is disabled; does nothing
+"""
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = NullSpan()
+_enabled = False
+_histograms = {}
+_lock = threading.Lock()
+
+"""
+Enable instrumentation
+"""
+def enable():
+    global _enabled
+    _enabled = True
+
+"""
+Disable instrumentation
+"""
+def disable():
+    global _enabled
+    _enabled = False
+
+"""
+Check whether instrumentation is enabled
+@return: True if enabled
+"""
+def is_enabled():
+    return _enabled
+
+"""
+Discard all recorded observations
+"""
+def reset():
+    with _lock:
+        _histograms.clear()
+
+"""
+Time a stage. While instrumentation is disabled this returns a shared no-op span.
+@param name: Stage name
+@return: Context manager
+"""
+def span(name):
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name)
+
+"""
+Record a duration for a stage
+@param name: Stage name
+@param seconds: Duration in seconds
+"""
+def observe(name, seconds):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+"""
+Summarize all stages
+@return: Dictionary of stage name to summary
+"""
+def snapshot():
+    with _lock:
+        return {name: histogram.summary() for name, histogram in sorted(_histograms.items())}
+
+"""
+Dump all stages as JSON
+@return: JSON text
+"""
+def to_json():
+    return json.dumps(snapshot(), indent=2)
+
+"""
+Dump all stages in the Prometheus text exposition format (as a summary metric)
+@return: Prometheus text
+"""
+def to_prometheus():
+    lines = [
+        f"# HELP {PROMETHEUS_METRIC} Duration of attestation stages in seconds",
+        f"# TYPE {PROMETHEUS_METRIC} summary",
+    ]
+    for name, summary in snapshot().items():
+        for quantile in QUANTILES:
+            value = summary[f"p{int(quantile * 100)}"]
+            lines.append(f'{PROMETHEUS_METRIC}{{stage="{name}",quantile="{quantile}"}} {value:.9f}')
+        lines.append(f'{PROMETHEUS_METRIC}_sum{{stage="{name}"}} {summary["sum"]:.9f}')
+        lines.append(f'{PROMETHEUS_METRIC}_count{{stage="{name}"}} {summary["count"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,385 @@
+import argparse
+import base64
+import datetime
+import heapq
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from client import (
+    AWS_NITRO_ROOT_CERT_PATH,
+    EXPECTED_MEASUREMENTS_PATH,
+    VSOCK_PORT,
+    get_attestation_document_cbor,
+    set_quiet,
+)
+from document import AttestationDocument
+from verifier import NitroVerifier
+
+DEFAULT_INTERVAL = 300.0  # seconds between attestations of a target
+DEFAULT_JITTER = 0.1  # fraction of the interval
+DEFAULT_QUEUE_SIZE = 16  # fetched documents waiting for verification
+DEFAULT_EVENTS_PATH = "monitor-events.jsonl"
+DEFAULT_MAX_EVENTS_BYTES = 64 * 1024 * 1024  # size that rolls the event file over
+POLL_INTERVAL = 0.5  # seconds between stop checks of a blocked thread
+
+# Event types
+EVENT_FAILURE = "failure"  # Fetch or verification failed
+EVENT_RECOVERED = "recovered"  # Valid again after failures
+EVENT_DRIFT = "drift"  # Valid, but PCR values differ from the last valid document
+
+"""
+Parse a monitor target
+@param spec: "CID", "CID:PORT", or an address such as "tcp://HOST:PORT" (see resolve_address)
+@return: (name, address)
+"""
+def parse_target(spec):
+    spec = str(spec)
+    if "://" in spec:
+        return spec, spec
+    cid, _, port = spec.partition(":")
+    return spec, f"vsock://{int(cid)}:{int(port) if port else VSOCK_PORT}"
+
+def _now_iso():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+"""
+Event sink appending one JSON object per line. The file is rolled over to <path>.1 when it
+reaches max_bytes, so a long-running monitor keeps at most two files.
+@param path: Path to the JSONL file
+@param max_bytes: Size that rolls the file over, or None to never roll it over
+"""
+class JsonLinesSink:
+    def __init__(self, path=DEFAULT_EVENTS_PATH, max_bytes=DEFAULT_MAX_EVENTS_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def __call__(self, event):
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            if self.max_bytes is not None and self._file.tell() + len(line) > self.max_bytes:
+                self._file.close()
+                os.replace(self.path, f"{self.path}.1")
+                self._file = open(self.path, 'a')
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+"""
+Monitoring state of one enclave. Only the latest values are kept, so the state does not grow
+with the number of attestations.
+@param name: Target name
+@param address: Enclave address
+"""
+class EnclaveState:
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.attempts = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_attempt = None
+        self.last_good = None
+        self.last_good_pcrs = None  # Dictionary of PCR index to value in hex
+        self.last_error = None
+
+    """
+    Get the state in a JSON-serializable form
+    @return: Dictionary of the state
+    """
+    def summary(self):
+        return {
+            'target': self.name,
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_attempt': self.last_attempt,
+            'last_good': self.last_good,
+            'last_good_pcrs': self.last_good_pcrs,
+            'last_error': self.last_error,
+        }
+
+"""
+Compare PCR values
+@param previous: Dictionary of PCR index to value in hex, or None
+@param current: Dictionary of PCR index to value in hex
+@return: Dictionary of changed PCR index to {"previous", "current"}
+"""
+def changed_pcrs(previous, current):
+    if previous is None:
+        return {}
+    return {
+        index: {'previous': previous.get(index), 'current': current.get(index)}
+        for index in sorted(set(previous) | set(current))
+        if previous.get(index) != current.get(index)
+    }
+
+"""
+Re-attests enclaves on a schedule. Fetcher threads request documents from the targets as they
+come due, while a verifier thread checks the previous documents, so a round trip overlaps the
+verification of earlier documents. Each target is attested every interval seconds, give or take
+the jitter; the first attestations are spread over one interval. Failures, recoveries and PCR
+drift are reported as events to on_event. Memory stays bounded: the queue between fetchers and
+verifier is bounded (fetchers wait when it is full), and only the latest state of each target is
+kept.
+@param targets: Target specs (see parse_target)
+@param verifier: NitroVerifier holding the trust state
+@param on_event: Function called with each event (a dictionary), e.g. a JsonLinesSink
+@param interval: Seconds between attestations of a target
+@param jitter: Random variation of the interval, as a fraction of it
+@param fetchers: Number of fetcher threads
+@param queue_size: Maximum number of fetched documents waiting for verification
+@param user_data: User data in bytes
+@param binary: Whether to use the binary mode if the enclave supports it
+@param archive: EvidenceArchive to append every document to, or None
+"""
+class AttestationMonitor:
+    def __init__(self, targets, verifier, on_event=None, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER,
+                 fetchers=1, queue_size=DEFAULT_QUEUE_SIZE, user_data=b'hello', binary=False, archive=None):
+        self.verifier = verifier
+        self.on_event = on_event
+        self.interval = interval
+        self.jitter = jitter
+        self.fetchers = fetchers
+        self.user_data = user_data
+        self.binary = binary
+        self.archive = archive
+        self.states = {}
+        for spec in targets:
+            name, address = parse_target(spec)
+            self.states[name] = EnclaveState(name, address)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._schedule = []
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {'fetched': 0, 'fetch_errors': 0, 'valid': 0, 'invalid': 0, 'events': 0}
+
+    """
+    Get the time between two attestations of a target
+    @return: Seconds
+    """
+    def _next_delay(self):
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    """
+    Start the fetcher and verifier threads
+    """
+    def start(self):
+        now = time.monotonic()
+        with self._condition:
+            self._schedule = [(now + random.uniform(0, self.interval), name) for name in self.states]
+            heapq.heapify(self._schedule)
+        self._threads = [threading.Thread(target=self._fetch_loop, name=f"monitor-fetch-{i}", daemon=True)
+                         for i in range(self.fetchers)]
+        self._threads.append(threading.Thread(target=self._verify_loop, name="monitor-verify", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    """
+    Stop the threads; documents already fetched are verified first
+    """
+    def stop(self):
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    """
+    Run until interrupted
+    """
+    def run_forever(self):
+        self.start()
+        try:
+            while not self._stop.wait(POLL_INTERVAL):
+                pass
+        finally:
+            self.stop()
+
+    """
+    Take the next target when it comes due
+    @return: (due time, target name), or None once stopped
+    """
+    def _next_target(self):
+        with self._condition:
+            while not self._stop.is_set():
+                if self._schedule:
+                    wait_time = self._schedule[0][0] - time.monotonic()
+                    if wait_time <= 0:
+                        return heapq.heappop(self._schedule)
+                else:
+                    wait_time = None
+                self._condition.wait(wait_time)
+        return None
+
+    def _reschedule(self, due, name):
+        # Keep the schedule if the target is on time; otherwise start again from now
+        next_due = max(due + self._next_delay(), time.monotonic())
+        with self._condition:
+            heapq.heappush(self._schedule, (next_due, name))
+            self._condition.notify()
+
+    def _fetch_loop(self):
+        while True:
+            entry = self._next_target()
+            if entry is None:
+                return
+            due, name = entry
+            state = self.states[name]
+            item = {'target': name, 'nonce': None, 'time': _now_iso(), 'document': None, 'error': None}
+            try:
+                nonce = item['nonce'] = self.verifier.issue_nonce()
+                item['document'] = get_attestation_document_cbor(
+                    base64.b64encode(self.user_data).decode(), base64.b64encode(nonce).decode(),
+                    address=state.address, binary=self.binary,
+                )
+            except Exception as e:
+                item['error'] = str(e)
+            with self._lock:
+                self._stats['fetched' if item['error'] is None else 'fetch_errors'] += 1
+            self._reschedule(due, name)
+
+            # Wait while the verifier is behind, so fetched documents do not pile up
+            while True:
+                try:
+                    self._queue.put(item, timeout=POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    if self._stop.is_set():
+                        return
+
+    def _verify_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self._stop.is_set() and all(not thread.is_alive() for thread in self._threads[:-1]):
+                    return
+                continue
+            try:
+                self._check(item)
+            except Exception as e:
+                print(f"⚠️  Warning: Failed to process the document of {item['target']}: {e}")
+
+    """
+    Verify a fetched document and update the target's state
+    @param item: Fetch result (target, nonce, time, document or error)
+    """
+    def _check(self, item):
+        state = self.states[item['target']]
+        state.attempts += 1
+        state.last_attempt = item['time']
+        error = item['error']
+        pcrs = None
+        valid = False
+
+        if error is None:
+            try:
+                document = AttestationDocument(item['document'])
+                if self.archive is not None:
+                    self.archive.append(item['document'], document)
+                valid, pcrs = self.verifier.verify_document(document, self.user_data, item['nonce'])
+                if not valid:
+                    error = "Verification failed"
+            except Exception as e:
+                error = f"Invalid attestation document: {e}"
+            with self._lock:
+                self._stats['valid' if valid else 'invalid'] += 1
+
+        changes = changed_pcrs(state.last_good_pcrs, pcrs) if pcrs is not None else {}
+        if valid:
+            if state.consecutive_failures:
+                self._emit(EVENT_RECOVERED, state, item, after_failures=state.consecutive_failures)
+            if changes:
+                self._emit(EVENT_DRIFT, state, item, changed_pcrs=changes)
+            state.consecutive_failures = 0
+            state.last_good = item['time']
+            state.last_good_pcrs = pcrs
+            state.last_error = None
+        else:
+            state.failures += 1
+            state.consecutive_failures += 1
+            state.last_error = error
+            self._emit(EVENT_FAILURE, state, item, error=error, consecutive_failures=state.consecutive_failures,
+                       changed_pcrs=changes)
+
+    def _emit(self, event_type, state, item, **fields):
+        event = {'type': event_type, 'target': state.name, 'time': item['time'], 'last_good': state.last_good}
+        event.update(fields)
+        with self._lock:
+            self._stats['events'] += 1
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(event)
+        except Exception as e:
+            print(f"⚠️  Warning: Event handler failed: {e}")
+
+    """
+    Get monitor statistics
+    @return: Dictionary of fetch, verdict and event counts, and the queue depth
+    """
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['targets'] = len(self.states)
+        return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-attest Nitro Enclaves on a schedule and report failures and PCR drift")
+    parser.add_argument("targets", nargs="+", help="CID, CID:PORT, or an address such as tcp://HOST:PORT")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between attestations of a target")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER, help="Random variation of the interval (fraction)")
+    parser.add_argument("--fetchers", type=int, default=1, help="Number of fetcher threads")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Fetched documents waiting for verification")
+    parser.add_argument("--events", default=DEFAULT_EVENTS_PATH, help="Event file (JSONL)")
+    parser.add_argument("--max-events-bytes", type=int, default=DEFAULT_MAX_EVENTS_BYTES,
+                        help="Size that rolls the event file over to <events>.1")
+    parser.add_argument("--root-cert", default=AWS_NITRO_ROOT_CERT_PATH, help="AWS Nitro root certificate (PEM)")
+    parser.add_argument("--measurements", default=EXPECTED_MEASUREMENTS_PATH, help="Measurement policy (JSON)")
+    parser.add_argument("--binary", action="store_true", help="Use the binary mode if the enclave supports it")
+    parser.add_argument("--parallel", action="store_true", help="Run the signature checks of a document in parallel")
+    parser.add_argument("--archive", default=None, help="Append every document to this evidence archive")
+    args = parser.parse_args()
+
+    set_quiet(True)
+    sink = JsonLinesSink(args.events, args.max_events_bytes)
+
+    def on_event(event):
+        sink(event)
+        print(f"{event['time']} {event['type']}: {event['target']} {event.get('error') or ''}".rstrip())
+
+    archive = None
+    if args.archive:
+        from archive import EvidenceArchive
+        archive = EvidenceArchive(args.archive)
+
+    verifier = NitroVerifier(args.root_cert, args.measurements, parallel=args.parallel)
+    monitor = AttestationMonitor(args.targets, verifier, on_event, args.interval, args.jitter, args.fetchers,
+                                 args.queue_size, binary=args.binary, archive=archive)
+    print(f"Monitoring {len(monitor.states)} enclaves every {args.interval} seconds; events saved to: {args.events}")
+    try:
+        monitor.run_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        sink.close()
+        if archive is not None:
+            archive.close()
+    print(json.dumps(monitor.stats()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+import argparse
+import base64
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+
+from client import resolve_address
+
+NONCE_SIZE = 64  # bytes
+DEFAULT_POOL_SIZE = 1024
+DEFAULT_TTL = 60  # seconds
+DEFAULT_BUCKETS = 12
+DEFAULT_MAX_ENTRIES = 1000000
+DEFAULT_LISTEN = "unix:///tmp/nitro-nonces.sock"
+
+# Results of consuming a nonce
+NONCE_VALID = "valid"
+NONCE_REPLAYED = "replayed"
+NONCE_UNKNOWN = "unknown"  # Never issued, or expired
+
+"""
+Pool of pre-generated nonces. Nonces are drawn from the OS in blocks rather than one call per
+nonce, and handed out under a lock, so one pool can serve many threads.
+@param size: Number of nonces generated at once
+@param nonce_size: Size of a nonce in bytes
+"""
+class NoncePool:
+    def __init__(self, size=DEFAULT_POOL_SIZE, nonce_size=NONCE_SIZE):
+        self.size = size
+        self.nonce_size = nonce_size
+        self._block = b''
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    """
+    Take a nonce from the pool, refilling it when it is empty
+    @return: Nonce in bytes
+    """
+    def take(self):
+        with self._lock:
+            if self._offset >= len(self._block):
+                self._block = secrets.token_bytes(self.size * self.nonce_size)
+                self._offset = 0
+            nonce = self._block[self._offset:self._offset + self.nonce_size]
+            self._offset += self.nonce_size
+            return nonce
+
+"""
+Set of nonces that forgets entries after a TTL. Entries are grouped into time buckets, so
+expiring them drops whole buckets instead of scanning the entries; lookups are a dictionary
+access. Memory is bounded by max_entries: when it is reached, the oldest bucket is dropped
+early, which can only make a nonce be rejected, never accepted.
+@param ttl: Lifetime of an entry in seconds
+@param buckets: Number of time buckets per TTL
+@param max_entries: Maximum number of entries
+"""
+class ExpiringSet:
+    def __init__(self, ttl=DEFAULT_TTL, buckets=DEFAULT_BUCKETS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.bucket_width = ttl / buckets
+        self.max_entries = max_entries
+        self.evictions = 0  # Buckets dropped before they expired
+        self._entries = {}  # Entry -> bucket number
+        self._buckets = deque()  # (bucket number, {entries}), oldest first
+        self._bucket_sets = {}  # Bucket number -> {entries}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, entry):
+        return entry in self._entries
+
+    """
+    Drop the buckets whose entries have all expired
+    @param now: Time in seconds (time.monotonic())
+    """
+    def expire(self, now):
+        # An entry lives at least ttl seconds; its bucket goes once the whole bucket is older than that
+        oldest = int((now - self.ttl) / self.bucket_width)
+        while self._buckets and self._buckets[0][0] < oldest:
+            self._drop_oldest_bucket()
+
+    def _drop_oldest_bucket(self):
+        number, entries = self._buckets.popleft()
+        del self._bucket_sets[number]
+        for entry in entries:
+            del self._entries[entry]
+
+    """
+    Add an entry
+    @param entry: Entry
+    @param now: Time in seconds (time.monotonic())
+    """
+    def add(self, entry, now):
+        number = int(now / self.bucket_width)
+        if self._buckets and number < self._buckets[-1][0]:
+            # Never go back to an older bucket: the buckets must stay in order and unique
+            number = self._buckets[-1][0]
+        # An entry lives in one bucket only, so the buckets never hold more than max_entries
+        self.discard(entry)
+        if not self._buckets or self._buckets[-1][0] != number:
+            self._buckets.append((number, set()))
+            self._bucket_sets[number] = self._buckets[-1][1]
+        self._buckets[-1][1].add(entry)
+        self._entries[entry] = number
+        while len(self._entries) > self.max_entries:
+            self._drop_oldest_bucket()
+            self.evictions += 1
+
+    """
+    Remove an entry
+    @param entry: Entry
+    @return: True if the entry was present
+    """
+    def discard(self, entry):
+        number = self._entries.pop(entry, None)
+        if number is None:
+            return False
+        self._bucket_sets[number].discard(entry)
+        return True
+
+"""
+Issues nonces and checks them once. Outstanding nonces expire after the TTL, and consumed
+nonces are remembered for the same TTL so that a replay is told apart from an unknown nonce.
+One instance can be shared across threads; the nonce server shares it across processes.
+@param ttl: Lifetime of an issued nonce in seconds
+@param pool_size: Number of nonces generated at once
+@param max_entries: Maximum number of outstanding (and of consumed) nonces kept
+"""
+class NonceManager:
+    def __init__(self, ttl=DEFAULT_TTL, pool_size=DEFAULT_POOL_SIZE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.pool = NoncePool(pool_size)
+        self.outstanding = ExpiringSet(ttl, max_entries=max_entries)
+        self.consumed = ExpiringSet(ttl, max_entries=max_entries)
+        self.issued = 0
+        self.replays = 0
+        self.unknown = 0
+        self._lock = threading.Lock()
+
+    """
+    Issue a nonce
+    @return: Nonce in bytes
+    """
+    def issue(self):
+        nonce = self.pool.take()
+        self.register(nonce)
+        return nonce
+
+    """
+    Register a nonce generated elsewhere as outstanding. A nonce that is outstanding or was
+    consumed cannot be registered again, as that would let its document be replayed.
+    @param nonce: Nonce in bytes
+    """
+    def register(self, nonce):
+        now = time.monotonic()
+        with self._lock:
+            self.outstanding.expire(now)
+            self.consumed.expire(now)
+            if nonce in self.outstanding or nonce in self.consumed:
+                raise Exception("Nonce is already registered or was used")
+            self.outstanding.add(nonce, now)
+            self.issued += 1
+
+    """
+    Check a nonce found in an attestation document and mark it as used
+    @param nonce: Nonce in bytes
+    @return: NONCE_VALID, NONCE_REPLAYED or NONCE_UNKNOWN
+    """
+    def consume(self, nonce):
+        now = time.monotonic()
+        with self._lock:
+            self.outstanding.expire(now)
+            self.consumed.expire(now)
+            if self.outstanding.discard(nonce):
+                self.consumed.add(nonce, now)
+                return NONCE_VALID
+            if nonce in self.consumed:
+                self.replays += 1
+                return NONCE_REPLAYED
+            self.unknown += 1
+            return NONCE_UNKNOWN
+
+    """
+    Get nonce statistics
+    @return: Dictionary of issued, replayed and unknown counters and of the store sizes
+    """
+    def stats(self):
+        with self._lock:
+            return {
+                'issued': self.issued,
+                'replays': self.replays,
+                'unknown': self.unknown,
+                'outstanding': len(self.outstanding),
+                'consumed': len(self.consumed),
+                'evictions': self.outstanding.evictions + self.consumed.evictions,
+            }
+
+"""
+Handle one request to the nonce server
+@param manager: NonceManager
+@param request: Request (parsed JSON)
+@return: Response (JSON-serializable)
+"""
+def handle_nonce_request(manager, request):
+    op = request.get('op')
+    if op == 'issue':
+        count = max(1, min(int(request.get('count', 1)), DEFAULT_POOL_SIZE))
+        return {'nonces': [base64.b64encode(manager.issue()).decode() for _ in range(count)]}
+    if op == 'register':
+        manager.register(base64.b64decode(request['nonce']))
+        return {'status': 'ok'}
+    if op == 'consume':
+        return {'status': manager.consume(base64.b64decode(request['nonce']))}
+    if op == 'stats':
+        return manager.stats()
+    return {'error': f"Unknown operation: {op}"}
+
+"""
+Connection handler of the nonce server: newline-terminated JSON requests and responses
+"""
+class NonceRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = handle_nonce_request(self.server.manager, json.loads(line))
+            except Exception as e:
+                response = {'error': str(e)}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+class ThreadingUnixNonceServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+class ThreadingTCPNonceServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+"""
+Create a nonce server sharing one NonceManager with the verifier processes of a host
+@param address: Listen address, "unix:///PATH" or "tcp://HOST:PORT"
+@param manager: NonceManager
+@return: Server (call serve_forever to run it)
+"""
+def create_nonce_server(address, manager):
+    _, sockaddr = resolve_address(address)
+    if address.startswith("unix://"):
+        if os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+        server = ThreadingUnixNonceServer(sockaddr, NonceRequestHandler)
+        os.chmod(sockaddr, 0o600)
+    elif address.startswith("tcp://"):
+        server = ThreadingTCPNonceServer(sockaddr, NonceRequestHandler)
+    else:
+        raise Exception(f"The nonce server listens on unix:// or tcp:// only, not {address}")
+    server.manager = manager
+    return server
+
+"""
+Client of a nonce server with the interface of NonceManager. Each thread (and each process,
+after a fork) uses its own connection, and issued nonces are fetched in batches.
+@param address: Address of the nonce server (see resolve_address)
+@param batch_size: Number of nonces fetched per request
+@param timeout: Socket timeout in seconds
+"""
+class RemoteNonceManager:
+    def __init__(self, address=DEFAULT_LISTEN, batch_size=64, timeout=10):
+        self.address = address
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            family, sockaddr = resolve_address(self.address)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(sockaddr)
+            local.pid = os.getpid()
+            local.sock = sock
+            local.file = sock.makefile('rwb')
+            local.issued = []
+        return local
+
+    def _reset(self, local):
+        try:
+            local.file.close()
+            local.sock.close()
+        except OSError:
+            pass
+        local.pid = None
+        local.issued = []
+
+    """
+    Send a request to the nonce server
+    @param request: Request (JSON-serializable)
+    @return: Response (parsed JSON)
+    """
+    def _call(self, request):
+        local = self._connection()
+        try:
+            local.file.write((json.dumps(request) + "\n").encode())
+            local.file.flush()
+            line = local.file.readline()
+            if not line:
+                raise ConnectionError("Connection closed by nonce server")
+            response = json.loads(line)
+        except BaseException:
+            # A late response would otherwise be read as the answer to the next request
+            self._reset(local)
+            raise
+        if 'error' in response:
+            raise Exception(f"Nonce server error: {response['error']}")
+        return response
+
+    def issue(self):
+        local = self._connection()
+        if not local.issued:
+            response = self._call({'op': 'issue', 'count': self.batch_size})
+            local.issued = [base64.b64decode(nonce) for nonce in reversed(response['nonces'])]
+        return local.issued.pop()
+
+    def register(self, nonce):
+        self._call({'op': 'register', 'nonce': base64.b64encode(nonce).decode()})
+
+    def consume(self, nonce):
+        return self._call({'op': 'consume', 'nonce': base64.b64encode(nonce).decode()})['status']
+
+    def stats(self):
+        return self._call({'op': 'stats'})
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve nonce issuance and replay detection to local verifier processes")
+    parser.add_argument("--listen", default=DEFAULT_LISTEN, help="unix:///PATH or tcp://HOST:PORT")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="Lifetime of an issued nonce in seconds")
+    parser.add_argument("--max-entries", type=int, default=DEFAULT_MAX_ENTRIES, help="Maximum number of nonces kept")
+    args = parser.parse_args()
+
+    server = create_nonce_server(args.listen, NonceManager(args.ttl, max_entries=args.max_entries))
+    print(f"Nonce server listening on {args.listen}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
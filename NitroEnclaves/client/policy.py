@@ -0,0 +1,221 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+
+DEFAULT_POLICY_PATH = "measurement-policy.json"
+LEGACY_PCRS = (0, 1, 2)
+
+"""
+Parse an expiry given as an ISO 8601 date/time or a UNIX timestamp
+@param value: Expiry, or None
+@return: Expiry as a UNIX timestamp, or None if it never expires
+"""
+def parse_expiry(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    expires = datetime.datetime.fromisoformat(value)
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=datetime.timezone.utc)
+    return expires.timestamp()
+
+"""
+Parse the PCR values of a "Measurements" object (as written by nitro-cli describe-eif)
+@param measurements: Dictionary of "PCR<n>" to PCR value in hex; other keys are ignored
+@return: Dictionary of PCR index to PCR value in bytes
+"""
+def parse_measurements(measurements):
+    pcrs = {}
+    for key, value in measurements.items():
+        if key.startswith("PCR"):
+            pcrs[int(key[3:])] = bytes.fromhex(value)
+    return pcrs
+
+"""
+Compute the digest of the selected PCR values
+@param pcrs: Dictionary of PCR index to PCR value in bytes
+@param selector: Sorted tuple of PCR indexes
+@return: SHA-384 digest, or None if a selected PCR is missing
+"""
+def pcr_digest(pcrs, selector):
+    digest = hashlib.sha384()
+    for pcr_id in selector:
+        value = pcrs.get(pcr_id)
+        if value is None:
+            return None
+        # Prefix each value with its index and length so that different selections never collide
+        digest.update(pcr_id.to_bytes(2, byteorder='big'))
+        digest.update(len(value).to_bytes(2, byteorder='big'))
+        digest.update(value)
+    return digest.digest()
+
+"""
+One allowed enclave image: the PCR values it must match, and its metadata
+@param pcrs: Dictionary of PCR index to PCR value in bytes
+@param label: Version label
+@param expires: Expiry as a UNIX timestamp, or None if it never expires
+@param metadata: Free-form metadata
+"""
+class PolicyEntry:
+    def __init__(self, pcrs, label=None, expires=None, metadata=None):
+        if not pcrs:
+            raise Exception(f"Policy entry {label} has no PCR values")
+        self.pcrs = pcrs
+        self.label = label
+        self.expires = expires
+        self.metadata = metadata or {}
+        self.selector = tuple(sorted(pcrs))
+        self.digest = pcr_digest(pcrs, self.selector)
+
+    """
+    Check whether the entry has expired
+    @param now: UNIX timestamp, or None for the current time
+    @return: True if the entry has expired
+    """
+    def is_expired(self, now=None):
+        if self.expires is None:
+            return False
+        return (time.time() if now is None else now) >= self.expires
+
+"""
+Allowlist of enclave images, indexed by the digest of the PCR values each entry selects.
+Matching a report costs one digest and one dictionary lookup per distinct PCR selection
+(usually one or two), however many images are allowed.
+@param entries: Policy entries (PolicyEntry)
+"""
+class MeasurementPolicy:
+    def __init__(self, entries):
+        self._index = {}
+        self._expiries = []
+        count = 0
+        for entry in entries:
+            by_digest = self._index.setdefault(entry.selector, {})
+            previous = by_digest.get(entry.digest)
+            # Of two entries for the same image, the one expiring last wins
+            if previous is None or not _expires_before(entry, previous):
+                if previous is None:
+                    count += 1
+                by_digest[entry.digest] = entry
+            if entry.expires is not None:
+                self._expiries.append(entry.expires)
+        self._expiries.sort()
+        self._count = count
+        # Selections with more PCRs are tried first, so the most specific entry matches
+        self._selectors = sorted(self._index, key=len, reverse=True)
+
+    def __len__(self):
+        return self._count
+
+    """
+    Load a policy file. A file of the format of expected-measurements.json is accepted as a
+    policy with a single entry for PCR0-2.
+    @param path: Path to the policy in JSON
+    @return: MeasurementPolicy
+    """
+    @classmethod
+    def from_file(cls, path=DEFAULT_POLICY_PATH):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read(), label=os.path.basename(path))
+
+    """
+    Parse the contents of a policy file (see from_file)
+    @param data: Policy in JSON
+    @param label: Label of the single entry of an expected-measurements.json file
+    @return: MeasurementPolicy
+    """
+    @classmethod
+    def from_bytes(cls, data, label=None):
+        document = json.loads(data)
+
+        if 'Policies' not in document:
+            pcrs = parse_measurements(document['Measurements'])
+            return cls([PolicyEntry({i: pcrs[i] for i in LEGACY_PCRS if i in pcrs}, label=label)])
+
+        entries = []
+        for policy in document['Policies']:
+            entries.append(PolicyEntry(
+                parse_measurements(policy['Measurements']),
+                label=policy.get('Label'),
+                expires=parse_expiry(policy.get('Expires')),
+                metadata=policy.get('Metadata'),
+            ))
+        return cls(entries)
+
+    """
+    Find the entry matching the PCR values of a report. The most specific unexpired entry is
+    preferred; an expired entry is returned only if no unexpired entry matches.
+    @param pcrs: Dictionary of PCR index to PCR value in bytes
+    @param now: UNIX timestamp, or None for the current time
+    @return: Matching entry (PolicyEntry), or None if there is none
+    """
+    def match(self, pcrs, now=None):
+        now = time.time() if now is None else now
+        expired = None
+        for selector in self._selectors:
+            digest = pcr_digest(pcrs, selector)
+            if digest is None:
+                continue
+            entry = self._index[selector].get(digest)
+            if entry is None:
+                continue
+            if not entry.is_expired(now):
+                return entry
+            if expired is None:
+                expired = entry
+        return expired
+
+    """
+    Get the first expiry after a point in time
+    @param now: UNIX timestamp
+    @return: Expiry as a UNIX timestamp, or None if no entry expires after now
+    """
+    def next_expiry(self, now):
+        for expires in self._expiries:
+            if expires > now:
+                return expires
+        return None
+
+def _expires_before(entry, other):
+    if entry.expires is None:
+        return False
+    return other.expires is None or entry.expires < other.expires
+
+def main():
+    parser = argparse.ArgumentParser(description="Add an enclave image to a measurement policy")
+    parser.add_argument("measurements", help="expected-measurements.json of the image (nitro-cli describe-eif output)")
+    parser.add_argument("--policy", default=DEFAULT_POLICY_PATH, help="Policy file to update")
+    parser.add_argument("--label", required=True, help="Version label of the image")
+    parser.add_argument("--expires", help="Expiry as an ISO 8601 date/time")
+    parser.add_argument("--pcr", type=int, action="append",
+                        help="PCR to include (repeatable; default: all PCRs in the measurements file)")
+    args = parser.parse_args()
+
+    with open(args.measurements, 'r') as f:
+        measurements = json.load(f)['Measurements']
+    if args.pcr:
+        measurements = {f"PCR{i}": measurements[f"PCR{i}"] for i in args.pcr}
+    else:
+        measurements = {key: value for key, value in measurements.items() if key.startswith("PCR")}
+
+    policy = {'Policies': []}
+    if os.path.exists(args.policy):
+        with open(args.policy, 'r') as f:
+            policy = json.load(f)
+    entry = {'Label': args.label, 'Measurements': measurements}
+    if args.expires:
+        parse_expiry(args.expires)  # Reject a malformed expiry before writing
+        entry['Expires'] = args.expires
+    policy['Policies'].append(entry)
+
+    with open(args.policy, 'w') as f:
+        json.dump(policy, f, indent=2)
+    print(f"Added {args.label} to {args.policy} ({len(policy['Policies'])} entries)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
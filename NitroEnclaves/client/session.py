@@ -0,0 +1,212 @@
+import base64
+import socket
+import threading
+
+from client import CID, VSOCK_PORT, encode_request, parse_response, resolve_address
+from stream import ResponseReader, MAX_RESPONSE_SIZE
+from wire import encode_binary_request, negotiate_binary, parse_binary_response
+
+"""
+Long-lived connection to an enclave. Responses are JSON objects written back to back
+(newline-terminated by the enclave), so several attestations can go over one connection.
+@param address: Enclave address (see resolve_address)
+@param timeout: Socket timeout in seconds
+@param max_size: Maximum size of a response in bytes
+@param binary: Whether to negotiate the binary mode (length-prefixed CBOR) on connect
+"""
+class EnclaveConnection:
+    def __init__(self, address, timeout, max_size=MAX_RESPONSE_SIZE, binary=False):
+        self.address = address
+        family, sockaddr = resolve_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.connect(sockaddr)
+        except Exception:
+            self.sock.close()
+            raise
+        self.reader = ResponseReader(max_size)
+        self.binary = False
+        if binary:
+            try:
+                self.binary = negotiate_binary(self.sock, self.reader)
+            except Exception:
+                self.sock.close()
+                raise
+
+    """
+    Send a request and wait for the matching response
+    @param payload: Request bytes
+    @return: Response (parsed JSON)
+    """
+    def request(self, payload):
+        self.sock.sendall(payload)
+        return self.read_message()
+
+    """
+    Send an attestation request and read the document from the response as it arrives, in the
+    binary mode if it was negotiated
+    @param user_data_b64: User data in base64
+    @param nonce_b64: Nonce in base64
+    @return: Attestation document in CBOR
+    """
+    def request_document(self, user_data_b64, nonce_b64):
+        if self.binary:
+            self.sock.sendall(encode_binary_request(base64.b64decode(user_data_b64), base64.b64decode(nonce_b64)))
+            return parse_binary_response(self.reader.read_frame(self.sock))
+        self.sock.sendall(encode_request(user_data_b64, nonce_b64))
+        return self.reader.read_document(self.sock)
+
+    """
+    Read exactly one JSON message from the connection, keeping any bytes that follow it
+    @return: Response (parsed JSON)
+    """
+    def read_message(self):
+        return self.reader.read_message(self.sock)
+
+    def close(self):
+        self.sock.close()
+
+"""
+Attestation session keeping a pool of long-lived connections per enclave address
+@param max_connections: Maximum number of idle connections kept per address
+@param timeout: Socket timeout in seconds
+@param max_size: Maximum size of a response in bytes
+@param binary: Whether connections negotiate the binary mode (length-prefixed CBOR)
+"""
+class AttestationSession:
+    def __init__(self, max_connections=4, timeout=10, max_size=MAX_RESPONSE_SIZE, binary=False):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_size = max_size
+        self.binary = binary
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    """
+    Take an idle connection from the pool, or open a new one
+    @param address: Enclave address
+    @return: (connection, True if the connection was reused)
+    """
+    def _acquire(self, address):
+        with self._lock:
+            idle = self._idle.get(address)
+            if idle:
+                self.hits += 1
+                return idle.pop(), True
+            self.misses += 1
+        return EnclaveConnection(address, self.timeout, self.max_size, self.binary), False
+
+    """
+    Return a connection to the pool, or close it if the pool is full
+    @param conn: Connection
+    """
+    def _release(self, conn):
+        with self._lock:
+            idle = self._idle.setdefault(conn.address, [])
+            if len(idle) < self.max_connections:
+                idle.append(conn)
+                return
+        conn.close()
+
+    """
+    Send a request over a pooled connection, reconnecting once if a reused connection was closed
+    @param address: Enclave address
+    @param send: Function sending the request over a connection and reading the response
+    @return: Result of send
+    """
+    def _request(self, address, send):
+        try:
+            conn, reused = self._acquire(address)
+            try:
+                result = send(conn)
+            except ConnectionError:
+                conn.close()
+                if not reused:
+                    raise
+                # The enclave may have closed an idle connection since it was last used
+                with self._lock:
+                    self.reconnects += 1
+                conn = EnclaveConnection(address, self.timeout, self.max_size, self.binary)
+                try:
+                    result = send(conn)
+                except Exception:
+                    conn.close()
+                    raise
+            except Exception:
+                conn.close()
+                raise
+        except socket.timeout:
+            raise Exception("Connection timeout - enclave may not be running")
+        except ConnectionRefusedError:
+            raise Exception("Connection refused - check if enclave is running and CID is correct")
+        except Exception as e:
+            raise Exception(f"Connection error: {e}")
+
+        self._release(conn)
+        return result
+
+    """
+    Get attestation document from enclave over a pooled connection
+    @param user_data_b64: User data in base64
+    @param nonce_b64: Nonce in base64
+    @param cid: CID of the enclave
+    @param port: vsock port of the enclave
+    @param address: Enclave address (see resolve_address); overrides cid and port
+    @return: Attestation document in base64
+    """
+    def get_attestation_document(self, user_data_b64, nonce_b64, cid=CID, port=VSOCK_PORT, address=None):
+        if address is None:
+            address = (cid, port)
+        if self.binary:
+            document = self._request(address, lambda conn: conn.request_document(user_data_b64, nonce_b64))
+            return base64.b64encode(document).decode()
+        payload = encode_request(user_data_b64, nonce_b64)
+        return parse_response(self._request(address, lambda conn: conn.request(payload)))
+
+    """
+    Get attestation document from enclave in CBOR over a pooled connection (see
+    get_attestation_document_cbor)
+    @param user_data_b64: User data in base64
+    @param nonce_b64: Nonce in base64
+    @param cid: CID of the enclave
+    @param port: vsock port of the enclave
+    @param address: Enclave address (see resolve_address); overrides cid and port
+    @return: Attestation document in CBOR
+    """
+    def get_attestation_document_cbor(self, user_data_b64, nonce_b64, cid=CID, port=VSOCK_PORT, address=None):
+        if address is None:
+            address = (cid, port)
+        return self._request(address, lambda conn: conn.request_document(user_data_b64, nonce_b64))
+
+    """
+    Get pool statistics
+    @return: Dictionary of pool hit, miss and reconnect counters
+    """
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reconnects': self.reconnects,
+                'idle': sum(len(idle) for idle in self._idle.values()),
+            }
+
+    """
+    Close all idle connections
+    """
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
@@ -0,0 +1,175 @@
+import base64
+import binascii
+import json
+
+RECV_SIZE = 8192
+MAX_RESPONSE_SIZE = 1024 * 1024  # bytes
+
+# Prefix of the enclave's successful response, {"document":"<base64>"}
+DOCUMENT_PREFIX = b'{"document":"'
+WHITESPACE = b' \t\r\n'
+FRAME_HEADER_SIZE = 4  # Big-endian length of a binary frame
+
+"""
+Extract the attestation document from an enclave response
+@param response_json: Response from the enclave (parsed JSON)
+@return: Attestation document in base64
+"""
+def parse_response(response_json):
+    if 'error' in response_json:
+        raise Exception(f"Enclave error: {response_json['error']}")
+    return response_json['document']
+
+"""
+Incremental reader of enclave responses. Bytes are received straight into a preallocated,
+reusable buffer (grown up to max_size), and a response is read until it is complete instead
+of from a single recv. Bytes following a response are kept for the next one, so the reader
+can be used for many responses on one connection.
+@param max_size: Maximum size of a response in bytes
+@param chunk_size: Initial buffer size and receive size in bytes
+"""
+class ResponseReader:
+    def __init__(self, max_size=MAX_RESPONSE_SIZE, chunk_size=RECV_SIZE):
+        self.max_size = max_size
+        self._buffer = bytearray(min(chunk_size, max_size))
+        self._length = 0
+        self._scanned = 0
+
+    """
+    Receive more bytes from the socket into the buffer
+    @param sock: Socket
+    """
+    def _recv(self, sock):
+        if self._length == len(self._buffer):
+            if len(self._buffer) >= self.max_size:
+                raise Exception(f"Response exceeds {self.max_size} bytes")
+            self._buffer.extend(bytes(min(len(self._buffer), self.max_size - len(self._buffer))))
+        with memoryview(self._buffer) as view:
+            n = sock.recv_into(view[self._length:])
+        if n == 0:
+            raise ConnectionError("Connection closed by enclave")
+        self._length += n
+
+    """
+    Drop the first bytes of the buffer, keeping the bytes that follow
+    @param end: Number of bytes to drop
+    """
+    def _consume(self, end):
+        remaining = self._length - end
+        if remaining:
+            self._buffer[:remaining] = self._buffer[end:self._length]
+        self._length = remaining
+        self._scanned = 0
+
+    """
+    Drop whitespace (such as the newline terminating the previous response) at the start of the buffer
+    """
+    def _skip_whitespace(self):
+        start = 0
+        while start < self._length and self._buffer[start] in WHITESPACE:
+            start += 1
+        if start:
+            self._consume(start)
+
+    """
+    Find the end of a complete JSON response in the buffer. Responses are newline-terminated;
+    a response from a server that does not terminate them is accepted once it parses.
+    @return: End offset of the response, or None if it is incomplete
+    """
+    def _find_message_end(self):
+        newline = self._buffer.find(b'\n', self._scanned, self._length)
+        if newline >= 0:
+            return newline + 1
+        self._scanned = self._length
+        if self._length and self._buffer[self._length - 1] == ord('}'):
+            try:
+                json.loads(self._buffer[:self._length])
+                return self._length
+            except ValueError:
+                pass
+        return None
+
+    """
+    Read one complete JSON response
+    @param sock: Socket
+    @return: Response (parsed JSON)
+    """
+    def read_message(self, sock):
+        self._skip_whitespace()
+        while True:
+            end = self._find_message_end()
+            if end is not None:
+                message = json.loads(self._buffer[:end])
+                self._consume(end)
+                return message
+            self._recv(sock)
+            self._skip_whitespace()
+
+    """
+    Read one response and return the attestation document in CBOR. The base64 text is decoded
+    as it arrives, in 4-character blocks, so decoding overlaps with the network read and the
+    document never exists as a JSON or Python string.
+    @param sock: Socket
+    @return: Attestation document in CBOR (bytearray)
+    """
+    def read_document(self, sock):
+        document = bytearray()
+        pos = None  # Offset of the first base64 character not yet decoded
+        while True:
+            if pos is None:
+                self._skip_whitespace()
+                # A response shorter than the prefix, such as an error, is told apart as soon as it diverges
+                if not DOCUMENT_PREFIX.startswith(self._buffer[:min(self._length, len(DOCUMENT_PREFIX))]):
+                    # Error or differently formatted response
+                    return base64.b64decode(parse_response(self.read_message(sock)))
+                if self._length >= len(DOCUMENT_PREFIX):
+                    pos = len(DOCUMENT_PREFIX)
+
+            if pos is not None:
+                quote = self._buffer.find(b'"', pos, self._length)
+                stop = quote if quote >= 0 else pos + (self._length - pos) // 4 * 4
+                if stop > pos:
+                    with memoryview(self._buffer) as view:
+                        document += binascii.a2b_base64(view[pos:stop])
+                    pos = stop
+                if quote >= 0:
+                    close = self._buffer.find(b'}', quote, self._length)
+                    if close >= 0:
+                        self._consume(close + 1)
+                        return document
+
+            self._recv(sock)
+
+    """
+    Look at the next bytes without consuming them
+    @param sock: Socket
+    @param size: Number of bytes
+    @return: Next bytes
+    """
+    def peek(self, sock, size):
+        while self._length < size:
+            self._recv(sock)
+        return bytes(self._buffer[:size])
+
+    """
+    Drop the next bytes (see peek)
+    @param size: Number of bytes
+    """
+    def skip(self, size):
+        self._consume(size)
+
+    """
+    Read one length-prefixed binary frame
+    @param sock: Socket
+    @return: Frame payload
+    """
+    def read_frame(self, sock):
+        size = int.from_bytes(self.peek(sock, FRAME_HEADER_SIZE), byteorder='big')
+        end = FRAME_HEADER_SIZE + size
+        if end > self.max_size:
+            raise Exception(f"Response exceeds {self.max_size} bytes")
+        while self._length < end:
+            self._recv(sock)
+        frame = bytes(self._buffer[FRAME_HEADER_SIZE:end])
+        self._consume(end)
+        return frame
@@ -0,0 +1,198 @@
+import argparse
+import base64
+import cbor2
+import json
+import os
+import socketserver
+import sys
+
+from client import resolve_address
+from fixtures import SyntheticEnclave, DEFAULT_DEPTH
+from stream import FRAME_HEADER_SIZE
+from wire import WIRE_MAGIC, WIRE_VERSION, WIRE_DECLINED, MAX_REQUEST_FRAME_SIZE, encode_frame
+
+DEFAULT_LISTEN = "tcp://127.0.0.1:5000"
+DEFAULT_TRUST_DIR = "stub"
+RECV_SIZE = 8192
+MAX_REQUEST_SIZE = 65536
+
+"""
+Build an error response in the format of the enclave server
+@param error: Error summary
+@param message: Error details
+@return: Response (JSON-serializable)
+"""
+def error_response(error, message):
+    return {'error': error, 'message': message}
+
+"""
+Handle one attestation request as the enclave server does, signing with the synthetic enclave
+@param enclave: SyntheticEnclave
+@param request: Request (parsed JSON)
+@return: Response (JSON-serializable)
+"""
+def handle_request(enclave, request):
+    try:
+        user_data = base64.b64decode(request['user-data'], validate=True)
+    except Exception as e:
+        return error_response("Invalid report-data encoding", str(e))
+    try:
+        nonce = base64.b64decode(request['nonce'], validate=True)
+    except Exception as e:
+        return error_response("Invalid nonce encoding", str(e))
+    document = enclave.attest(user_data, nonce)
+    return {'document': base64.b64encode(document).decode()}
+
+"""
+Handle one binary mode attestation request
+@param enclave: SyntheticEnclave
+@param frame: Request frame payload (CBOR map of user-data and nonce)
+@return: Response frame payload (raw CBOR document, or a CBOR error map)
+"""
+def handle_binary_request(enclave, frame):
+    try:
+        request = cbor2.loads(frame)
+        user_data, nonce = request['user-data'], request['nonce']
+        if not isinstance(user_data, bytes) or not isinstance(nonce, bytes):
+            raise ValueError("`user-data` and `nonce` must be byte strings")
+    except Exception as e:
+        return cbor2.dumps(error_response("Invalid CBOR request", str(e)))
+    return enclave.attest(user_data, nonce)
+
+"""
+Connection handler speaking the enclave's protocol: self-delimiting JSON requests,
+newline-terminated JSON responses, many requests per connection. A connection opening with
+the binary mode handshake continues with length-prefixed CBOR frames instead.
+"""
+class AttestationRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data = self.request.recv(RECV_SIZE)
+        if data[:1] == bytes([WIRE_MAGIC]):
+            while len(data) < 2:
+                more = self.request.recv(RECV_SIZE)
+                if not more:
+                    return
+                data += more
+            version = min(data[1], WIRE_VERSION)
+            self.request.sendall(bytes([WIRE_MAGIC, version]))
+            data = data[2:]
+            if version != WIRE_DECLINED:
+                self.handle_binary(data)
+                return
+        self.handle_json(data)
+
+    """
+    Serve length-prefixed CBOR requests
+    @param data: Bytes received after the handshake
+    """
+    def handle_binary(self, data):
+        buffer = data
+        while True:
+            while len(buffer) >= FRAME_HEADER_SIZE:
+                size = int.from_bytes(buffer[:FRAME_HEADER_SIZE], byteorder='big')
+                if size > MAX_REQUEST_FRAME_SIZE:
+                    # The stream cannot be resynchronized, so report the error and close
+                    response = cbor2.dumps(error_response("Invalid CBOR request", f"frame of {size} bytes is too large"))
+                    self.request.sendall(encode_frame(response))
+                    return
+                end = FRAME_HEADER_SIZE + size
+                if len(buffer) < end:
+                    break  # Incomplete frame, read more
+                response = handle_binary_request(self.server.enclave, buffer[FRAME_HEADER_SIZE:end])
+                buffer = buffer[end:]
+                self.request.sendall(encode_frame(response))
+
+            data = self.request.recv(RECV_SIZE)
+            if not data:
+                break
+            buffer += data
+
+    """
+    Serve JSON requests
+    @param data: Bytes received so far
+    """
+    def handle_json(self, data):
+        decoder = json.JSONDecoder()
+        buffer = ""
+        while True:
+            if not data:
+                break
+            buffer += data.decode(errors='replace')
+
+            while True:
+                buffer = buffer.lstrip()
+                if not buffer:
+                    break
+                try:
+                    request, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError as e:
+                    # Clients terminate requests with a newline, so a newline (or an oversized
+                    # buffer) means the request is malformed rather than incomplete
+                    newline = buffer.find("\n")
+                    if newline < 0 and len(buffer) <= MAX_REQUEST_SIZE:
+                        break  # Incomplete request, read more
+                    buffer = buffer[newline + 1:] if newline >= 0 else ""
+                    response = error_response("Invalid JSON request", str(e))
+                    self.request.sendall((json.dumps(response) + "\n").encode())
+                    continue
+                buffer = buffer[end:]
+
+                if isinstance(request, dict) and 'user-data' in request and 'nonce' in request:
+                    response = handle_request(self.server.enclave, request)
+                else:
+                    response = error_response("Invalid JSON request", "missing field `user-data` or `nonce`")
+                self.request.sendall((json.dumps(response) + "\n").encode())
+
+            data = self.request.recv(RECV_SIZE)
+
+class ThreadingTCPAttestationServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class ThreadingUnixAttestationServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+"""
+Create a stand-in enclave server
+@param address: Listen address, "tcp://HOST:PORT" or "unix:///PATH"
+@param enclave: SyntheticEnclave used to sign documents
+@return: Server (call serve_forever to run it)
+"""
+def create_server(address, enclave):
+    _, sockaddr = resolve_address(address)
+    if address.startswith("unix://"):
+        if os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+        server = ThreadingUnixAttestationServer(sockaddr, AttestationRequestHandler)
+    elif address.startswith("tcp://"):
+        server = ThreadingTCPAttestationServer(sockaddr, AttestationRequestHandler)
+    else:
+        raise Exception(f"The stand-in server listens on tcp:// or unix:// only, not {address}")
+    server.enclave = enclave
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in enclave server signing synthetic attestation documents")
+    parser.add_argument("--listen", default=DEFAULT_LISTEN, help="tcp://HOST:PORT or unix:///PATH")
+    parser.add_argument("--trust-dir", default=DEFAULT_TRUST_DIR, help="Directory for root.pem and expected-measurements.json")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="Number of intermediate certificates")
+    args = parser.parse_args()
+
+    enclave = SyntheticEnclave(depth=args.depth)
+    os.makedirs(args.trust_dir, exist_ok=True)
+    root_cert_path, expected_measurements_path = enclave.write_trust_files(args.trust_dir)
+    print(f"Test root certificate saved to: {root_cert_path}")
+    print(f"Expected measurements saved to: {expected_measurements_path}")
+
+    server = create_server(args.listen, enclave)
+    print(f"Stand-in enclave server listening on {args.listen}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
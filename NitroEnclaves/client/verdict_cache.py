@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+from chain_cache import certificate_not_after
+
+DEFAULT_MAX_ENTRIES = 65536
+DEFAULT_TTL = 300  # seconds
+
+"""
+Get the earliest notAfter of the certificates in an attestation document
+@param document: Parsed attestation document (AttestationDocument)
+@return: Earliest notAfter as a UNIX timestamp
+"""
+def document_not_after(document):
+    not_after = certificate_not_after(document.certificate)
+    for cert_bytes in document.cabundle:
+        cert = x509.load_der_x509_certificate(cert_bytes, default_backend())
+        not_after = min(not_after, certificate_not_after(cert))
+    return not_after
+
+"""
+Compute the fingerprint of a trust state, which the cached verdicts depend on
+@param root_cert: Root certificate
+@param policy_bytes: Contents of the measurement policy (or expected measurements) file
+@return: Fingerprint (hex SHA-384)
+"""
+def trust_fingerprint(root_cert, policy_bytes):
+    from cryptography.hazmat.primitives.serialization import Encoding
+
+    digest = hashlib.sha384()
+    digest.update(hashlib.sha384(root_cert.public_bytes(Encoding.DER)).digest())
+    digest.update(hashlib.sha384(policy_bytes).digest())
+    return digest.hexdigest()
+
+"""
+Cache of verification verdicts, keyed by the SHA-384 of the raw CBOR document together with
+the expected user data and nonce. Entries expire after the TTL or at the earliest notAfter in
+the document's certificate chain, and the least recently used entry is evicted when the cache
+is full. If a path is given, the cache is loaded from and saved to that file; the file decides
+which documents are accepted, so it is written with owner-only permissions. The verdicts are
+tied to the fingerprint of the trust state that produced them (see set_trust).
+@param max_entries: Maximum number of cached verdicts
+@param ttl: Maximum lifetime of a verdict in seconds
+@param path: File to persist the cache to, or None to keep it in memory only
+@param trust: Fingerprint of the current trust state, or None if it is set later
+"""
+class VerdictCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, path=None, trust=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.trust = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load()
+        if trust is not None:
+            self.set_trust(trust)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    """
+    Compute the cache key of a verification
+    @param document_bytes: Attestation document in CBOR
+    @param user_data: Expected user data in bytes
+    @param nonce: Expected nonce in bytes
+    @return: SHA-384 digest
+    """
+    @staticmethod
+    def key(document_bytes, user_data, nonce):
+        digest = hashlib.sha384()
+        # Length-prefix each field so that different splits never collide
+        for field in (document_bytes, user_data or b'', nonce or b''):
+            digest.update(len(field).to_bytes(8, byteorder='big'))
+            digest.update(field)
+        return digest.digest()
+
+    """
+    Look up a verdict
+    @param key: Cache key
+    @return: Cached verdict (True/False), or None if there is none
+    """
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            verdict, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    """
+    Record a verdict
+    @param key: Cache key
+    @param verdict: Verdict (True/False)
+    @param document: Parsed attestation document, whose certificates bound the lifetime of the entry
+    """
+    def put(self, key, verdict, document=None):
+        expires_at = time.time() + self.ttl
+        if document is not None:
+            try:
+                expires_at = min(expires_at, document_not_after(document))
+            except Exception:
+                return  # Without a notAfter bound the verdict is not cached
+        with self._lock:
+            self._insert(key, verdict, expires_at)
+
+    def _insert(self, key, verdict, expires_at):
+        self._entries[key] = (verdict, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    """
+    Get cache statistics
+    @return: Dictionary of hit, miss, eviction and expiration counters
+    """
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._entries),
+            }
+
+    """
+    Remove all cached verdicts (e.g. when the trust state changes)
+    """
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    """
+    Set the fingerprint of the trust state (see trust_fingerprint). The cached verdicts are
+    dropped if they were reached under another trust state.
+    @param trust: Fingerprint
+    """
+    def set_trust(self, trust):
+        with self._lock:
+            if self.trust != trust:
+                self._entries.clear()
+                self.trust = trust
+
+    """
+    Load unexpired verdicts from the cache file, with the fingerprint of their trust state
+    """
+    def load(self):
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('trust') is None:
+            return  # Saved without a trust state, so the verdicts cannot be trusted
+        now = time.time()
+        with self._lock:
+            self._entries.clear()
+            self.trust = data['trust']
+            for key_hex, verdict, expires_at in data['entries']:
+                if expires_at > now:
+                    self._insert(bytes.fromhex(key_hex), verdict, expires_at)
+
+    """
+    Save unexpired verdicts to the cache file (written to a temporary file, then renamed)
+    """
+    def save(self):
+        if self.path is None:
+            return
+        now = time.time()
+        with self._lock:
+            trust = self.trust
+            entries = [
+                [key.hex(), verdict, expires_at]
+                for key, (verdict, expires_at) in self._entries.items()
+                if expires_at > now and trust is not None
+            ]
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'trust': trust, 'entries': entries}, f)
+        os.replace(tmp_path, self.path)
+
+    """
+    Save the cache if it is persisted
+    """
+    def close(self):
+        self.save()
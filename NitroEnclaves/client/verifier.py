@@ -0,0 +1,148 @@
+import os
+import secrets
+import threading
+import time
+
+from client import (
+    AWS_NITRO_ROOT_CERT_PATH,
+    EXPECTED_MEASUREMENTS_PATH,
+    load_root_certificate,
+    signature_executor,
+    verify_attestation_document,
+    verify_document,
+)
+from chain_cache import CertificateChainCache
+from policy import MeasurementPolicy
+from verdict_cache import trust_fingerprint
+
+DEFAULT_CHECK_INTERVAL = 1.0  # seconds between mtime checks
+
+"""
+Long-lived verifier holding the root certificate and the measurement policy in memory.
+The files are reloaded only when their mtime changes, and one instance can be shared
+across threads: each verification works on an immutable snapshot of the trust state.
+@param root_cert_path: Path to the root certificate in PEM
+@param expected_measurements_path: Path to the measurement policy, or to the expected measurements, in JSON
+@param chain_cache: Cache of verified chain links, or None to create one
+@param check_interval: Minimum interval in seconds between mtime checks
+@param verdict_cache: Cache of verdicts (VerdictCache), or None to verify every document
+@param nonce_manager: Nonce manager (NonceManager or RemoteNonceManager) rejecting unissued and replayed nonces, or None
+@param parallel: Whether to run the signature checks of a document in parallel on the shared thread pool (see signature_executor)
+"""
+class NitroVerifier:
+    def __init__(self, root_cert_path=AWS_NITRO_ROOT_CERT_PATH,
+                 expected_measurements_path=EXPECTED_MEASUREMENTS_PATH,
+                 chain_cache=None, check_interval=DEFAULT_CHECK_INTERVAL, verdict_cache=None, nonce_manager=None,
+                 parallel=False):
+        self.root_cert_path = root_cert_path
+        self.expected_measurements_path = expected_measurements_path
+        self.chain_cache = chain_cache if chain_cache is not None else CertificateChainCache()
+        self.check_interval = check_interval
+        self.verdict_cache = verdict_cache
+        self.nonce_manager = nonce_manager
+        self.executor = signature_executor() if parallel else None
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._state = None
+        self._mtimes = None
+        self._checked_at = 0.0
+        self._next_expiry = None
+        self.reload()
+
+    """
+    Get the mtimes of the trust files
+    @return: (root certificate mtime, expected measurements mtime) in nanoseconds
+    """
+    def _stat(self):
+        return (
+            os.stat(self.root_cert_path).st_mtime_ns,
+            os.stat(self.expected_measurements_path).st_mtime_ns,
+        )
+
+    """
+    Load the root certificate and the measurement policy from their files
+    """
+    def reload(self):
+        with self._lock:
+            mtimes = self._stat()
+            root_cert = load_root_certificate(self.root_cert_path)
+            with open(self.expected_measurements_path, 'rb') as f:
+                policy_bytes = f.read()
+            policy = MeasurementPolicy.from_bytes(policy_bytes, label=os.path.basename(self.expected_measurements_path))
+            # Changing the root certificate invalidates every verified link
+            if self._state is not None and self._state[0] != root_cert:
+                self.chain_cache.clear()
+            # Verdicts reached under another trust state, including those loaded from a file, are dropped
+            if self.verdict_cache is not None:
+                self.verdict_cache.set_trust(trust_fingerprint(root_cert, policy_bytes))
+            self._state = (root_cert, policy)
+            self._next_expiry = policy.next_expiry(time.time())
+            self._mtimes = mtimes
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+
+    """
+    Get the current trust state, reloading it if a file has changed
+    @return: (root certificate, measurement policy)
+    """
+    def trust_state(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._expire_verdicts()
+            try:
+                if self._stat() != self._mtimes:
+                    self.reload()
+            except Exception as e:
+                # A file may be in the middle of being replaced; keep verifying with the previous state
+                print(f"⚠️  Warning: Failed to reload trust state, keeping the previous one: {e}")
+        return self._state
+
+    """
+    Drop cached verdicts once a policy entry has expired, as they may rely on it
+    """
+    def _expire_verdicts(self):
+        if self._next_expiry is None or time.time() < self._next_expiry:
+            return
+        with self._lock:
+            if self.verdict_cache is not None:
+                self.verdict_cache.clear()
+            self._next_expiry = self._state[1].next_expiry(time.time())
+
+    """
+    Verify an attestation document
+    @param document_bytes: Attestation document in CBOR
+    @param user_data: User data in bytes
+    @param nonce: Nonce in bytes
+    @return: True if the attestation document is valid, False otherwise
+    """
+    def verify(self, document_bytes, user_data, nonce):
+        root_cert, policy = self.trust_state()
+        return verify_attestation_document(
+            None, document_bytes, user_data, nonce,
+            chain_cache=self.chain_cache, root_cert=root_cert, verdict_cache=self.verdict_cache,
+            policy=policy, nonce_manager=self.nonce_manager, executor=self.executor,
+        )
+
+    """
+    Verify a parsed attestation document and report its PCR values
+    @param document: Parsed attestation document (AttestationDocument)
+    @param user_data: User data in bytes
+    @param nonce: Nonce in bytes (see issue_nonce)
+    @return: (True if the attestation document is valid, PCR values as {index: hex string})
+    """
+    def verify_document(self, document, user_data, nonce):
+        root_cert, policy = self.trust_state()
+        valid = verify_document(document, user_data, nonce, self.chain_cache, root_cert, policy=policy,
+                                nonce_manager=self.nonce_manager, executor=self.executor)
+        pcrs = {index: value.hex() for index, value in document.pcrs.items()}
+        return valid, pcrs
+
+    """
+    Issue a nonce for a new attestation document. With a nonce manager, only its nonces are accepted.
+    @return: Nonce in bytes
+    """
+    def issue_nonce(self):
+        if self.nonce_manager is not None:
+            return self.nonce_manager.issue()
+        return secrets.token_bytes(64)
@@ -0,0 +1,67 @@
+from stream import FRAME_HEADER_SIZE
+
+# Binary mode handshake: the client sends WIRE_MAGIC and the highest version it speaks as its
+# first two bytes (a JSON request never starts with WIRE_MAGIC). The enclave answers with
+# WIRE_MAGIC and the version it accepts, or with version 0 to stay with JSON.
+WIRE_MAGIC = 0xB1
+WIRE_VERSION = 1
+WIRE_DECLINED = 0
+MAX_REQUEST_FRAME_SIZE = 65536
+
+# CBOR major type of a map, which marks an error response (a document is a COSE_Sign1 array)
+CBOR_MAJOR_MAP = 5
+
+"""
+Prefix a payload with its length
+@param payload: Payload bytes
+@return: Frame bytes
+"""
+def encode_frame(payload):
+    return len(payload).to_bytes(FRAME_HEADER_SIZE, byteorder='big') + payload
+
+"""
+Encode an attestation request for the binary mode
+@param user_data: User data in bytes
+@param nonce: Nonce in bytes
+@return: Request frame bytes
+"""
+def encode_binary_request(user_data, nonce):
+    import cbor2
+
+    return encode_frame(cbor2.dumps({'user-data': user_data, 'nonce': nonce}))
+
+"""
+Extract the attestation document from a binary mode response
+@param frame: Response frame payload (raw CBOR document, or a CBOR map on error)
+@return: Attestation document in CBOR
+"""
+def parse_binary_response(frame):
+    if not frame:
+        raise Exception("Empty response received from enclave")
+    if frame[0] >> 5 == CBOR_MAJOR_MAP:
+        import cbor2
+
+        response = cbor2.loads(frame)
+        raise Exception(f"Enclave error: {response.get('error')}")
+    return frame
+
+"""
+Negotiate the binary mode on a new connection. An enclave that predates the binary mode
+answers the handshake with a JSON error response, which is discarded; the connection then
+continues in JSON.
+@param sock: Connected socket
+@param reader: ResponseReader of the connection
+@return: True if the binary mode was accepted, False to use JSON
+"""
+def negotiate_binary(sock, reader):
+    sock.sendall(bytes([WIRE_MAGIC, WIRE_VERSION]))
+    if reader.peek(sock, 1)[0] != WIRE_MAGIC:
+        reader.read_message(sock)
+        return False
+    version = reader.peek(sock, 2)[1]
+    reader.skip(2)
+    if version == WIRE_DECLINED:
+        return False
+    if version > WIRE_VERSION:
+        raise Exception(f"Enclave selected unsupported wire version {version}")
+    return True
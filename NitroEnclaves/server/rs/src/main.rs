@@ -2,7 +2,9 @@ use anyhow::{Result, anyhow};
 use base64::{Engine as _, engine::general_purpose};
 use serde::{Deserialize, Serialize};
 use serde_json;
+use std::collections::BTreeMap;
 use std::io::{Read, Write};
+use std::thread;
 use vsock::{VsockAddr, VsockStream};
 
 use aws_nitro_enclaves_nsm_api::{
@@ -12,6 +14,15 @@ use aws_nitro_enclaves_nsm_api::{
 
 const VSOCK_PORT: u32 = 5000;
 
+// Binary mode handshake: a client opening a connection with WIRE_MAGIC and its highest version
+// (a JSON request never starts with WIRE_MAGIC) is answered with WIRE_MAGIC and the accepted
+// version; the connection then carries length-prefixed CBOR frames instead of JSON
+const WIRE_MAGIC: u8 = 0xB1;
+const WIRE_VERSION: u8 = 1;
+const WIRE_DECLINED: u8 = 0;
+const FRAME_HEADER_SIZE: usize = 4;
+const MAX_REQUEST_FRAME_SIZE: usize = 65536;
+
 #[derive(Deserialize)]
 struct AttestationRequest {
     #[serde(rename = "user-data")]
@@ -25,6 +36,21 @@ struct AttestationResponse {
     document: String,
 }
 
+#[derive(Deserialize)]
+struct BinaryAttestationRequest {
+    #[serde(rename = "user-data", with = "serde_bytes")]
+    user_data: Vec<u8>,
+    #[serde(rename = "nonce", with = "serde_bytes")]
+    nonce: Vec<u8>,
+}
+
+#[derive(Clone, Copy, PartialEq)]
+enum WireMode {
+    Unknown,
+    Json,
+    Binary,
+}
+
 fn main() -> Result<()> {
     println!("Enclave: Starting Nitro Enclave...");
     println!("Enclave: Starting vsock server on port {}...", VSOCK_PORT);
@@ -35,9 +61,15 @@ fn main() -> Result<()> {
 
     for stream in listener.incoming() {
         match stream {
-            Ok(mut stream) => {
+            Ok(stream) => {
                 println!("Enclave: Accepted connection from parent VM");
-                handle_connection(&mut stream)?;
+                // Serve each connection on its own thread so that a client keeping
+                // several long-lived connections open does not block the others
+                thread::spawn(move || {
+                    if let Err(e) = handle_connection(stream) {
+                        eprintln!("Enclave: Connection handler failed: {}", e);
+                    }
+                });
             }
             Err(e) => {
                 eprintln!("Enclave: Error accepting connection: {}", e);
@@ -48,8 +80,10 @@ fn main() -> Result<()> {
     Ok(())
 }
 
-fn handle_connection(stream: &mut vsock::VsockStream) -> Result<()> {
+fn handle_connection(mut stream: VsockStream) -> Result<()> {
     let mut buffer = [0; 8192];
+    let mut pending: Vec<u8> = Vec::new();
+    let mut mode = WireMode::Unknown;
     loop {
         match stream.read(&mut buffer) {
             Ok(0) => {
@@ -58,105 +92,39 @@ fn handle_connection(stream: &mut vsock::VsockStream) -> Result<()> {
             }
             Ok(n) => {
                 println!("Enclave: Received {} bytes from parent", n);
+                pending.extend_from_slice(&buffer[..n]);
 
-                // Parse the received data as an attestation request
-                let request_data = String::from_utf8_lossy(&buffer[..n]);
-                println!("Enclave: Received request: {}", request_data);
-
-                // Parse JSON request
-                match serde_json::from_str::<AttestationRequest>(&request_data) {
-                    Ok(attestation_request) => {
-                        println!("Enclave: Parsed attestation request successfully");
-
-                        // Decode the base64 encoded data
-                        let user_data = match general_purpose::STANDARD
-                            .decode(&attestation_request.user_data)
-                        {
-                            Ok(data) => {
-                                println!(
-                                    "Enclave: Successfully decoded report-data ({} bytes)",
-                                    data.len()
-                                );
-                                data
-                            }
-                            Err(e) => {
-                                println!("Enclave: Failed to decode report-data: {:?}", e);
-                                let error_response = serde_json::json!({
-                                    "error": "Invalid report-data encoding",
-                                    "message": e.to_string()
-                                });
-                                if let Ok(error_json) = serde_json::to_string(&error_response) {
-                                    let _ = stream.write_all(error_json.as_bytes());
-                                }
-                                continue;
-                            }
-                        };
-
-                        let nonce =
-                            match general_purpose::STANDARD.decode(&attestation_request.nonce) {
-                                Ok(data) => {
-                                    println!(
-                                        "Enclave: Successfully decoded nonce ({} bytes)",
-                                        data.len()
-                                    );
-                                    data
-                                }
-                                Err(e) => {
-                                    println!("Enclave: Failed to decode nonce: {:?}", e);
-                                    let error_response = serde_json::json!({
-                                        "error": "Invalid nonce encoding",
-                                        "message": e.to_string()
-                                    });
-                                    if let Ok(error_json) = serde_json::to_string(&error_response) {
-                                        let _ = stream.write_all(error_json.as_bytes());
-                                    }
-                                    continue;
-                                }
-                            };
-
-                        // Fetch attestation document from NSM
-                        match fetch_document_from_nsm(user_data, nonce) {
-                            Ok(doc) => {
-                                let encoded_doc = general_purpose::STANDARD.encode(doc);
-                                let response = AttestationResponse {
-                                    document: encoded_doc,
-                                };
-
-                                if let Ok(response_json) = serde_json::to_string(&response) {
-                                    println!(
-                                        "Enclave: Sending attestation response ({} bytes)",
-                                        response_json.len()
-                                    );
-                                    if let Err(e) = stream.write_all(response_json.as_bytes()) {
-                                        eprintln!("Enclave: Error writing response: {}", e);
-                                        break;
-                                    }
-                                } else {
-                                    eprintln!("Enclave: Failed to serialize response");
-                                }
-                            }
-                            Err(e) => {
-                                eprintln!("Enclave: Failed to get attestation document: {:?}", e);
-                                let error_response = serde_json::json!({
-                                    "error": "NSM device not available",
-                                    "message": e.to_string(),
-                                    "status": "NSM_UNAVAILABLE"
-                                });
-                                if let Ok(error_json) = serde_json::to_string(&error_response) {
-                                    let _ = stream.write_all(error_json.as_bytes());
-                                }
-                            }
+                if mode == WireMode::Unknown {
+                    if pending[0] != WIRE_MAGIC {
+                        mode = WireMode::Json;
+                    } else if pending.len() < 2 {
+                        continue;
+                    } else {
+                        let version = pending[1].min(WIRE_VERSION);
+                        pending.drain(..2);
+                        if let Err(e) = stream.write_all(&[WIRE_MAGIC, version]) {
+                            eprintln!("Enclave: Error writing handshake: {}", e);
+                            return Ok(());
                         }
+                        mode = if version == WIRE_DECLINED {
+                            WireMode::Json
+                        } else {
+                            WireMode::Binary
+                        };
+                        println!("Enclave: Negotiated wire version {}", version);
                     }
+                }
+
+                let served = match mode {
+                    WireMode::Binary => serve_binary(&mut stream, &mut pending),
+                    _ => serve_json(&mut stream, &mut pending).map(|_| true),
+                };
+                match served {
+                    Ok(true) => {}
+                    Ok(false) => return Ok(()),
                     Err(e) => {
-                        println!("Enclave: Failed to parse JSON request: {:?}", e);
-                        let error_response = serde_json::json!({
-                            "error": "Invalid JSON request",
-                            "message": e.to_string()
-                        });
-                        if let Ok(error_json) = serde_json::to_string(&error_response) {
-                            let _ = stream.write_all(error_json.as_bytes());
-                        }
+                        eprintln!("Enclave: Error writing response: {}", e);
+                        return Ok(());
                     }
                 }
             }
@@ -170,6 +138,210 @@ fn handle_connection(stream: &mut vsock::VsockStream) -> Result<()> {
     Ok(())
 }
 
+fn serve_json(stream: &mut VsockStream, pending: &mut Vec<u8>) -> std::io::Result<()> {
+    // Requests are self-delimiting JSON objects, so one read may carry several
+    // requests and one request may span several reads
+    let (requests, consumed) = split_requests(pending);
+    pending.drain(..consumed);
+
+    for request in requests {
+        let response_json = handle_request(request);
+        println!(
+            "Enclave: Sending attestation response ({} bytes)",
+            response_json.len()
+        );
+        // Terminate each response with a newline so that the parent can frame it
+        stream.write_all(format!("{}\n", response_json).as_bytes())?;
+    }
+    Ok(())
+}
+
+// Returns false when the connection must be closed
+fn serve_binary(stream: &mut VsockStream, pending: &mut Vec<u8>) -> std::io::Result<bool> {
+    // Each request is a 4-byte big-endian length followed by that many bytes of CBOR
+    while pending.len() >= FRAME_HEADER_SIZE {
+        let mut header = [0u8; FRAME_HEADER_SIZE];
+        header.copy_from_slice(&pending[..FRAME_HEADER_SIZE]);
+        let size = u32::from_be_bytes(header) as usize;
+        if size > MAX_REQUEST_FRAME_SIZE {
+            // The stream cannot be resynchronized, so report the error and close
+            println!("Enclave: Request frame of {} bytes is too large", size);
+            let response = binary_error_response(
+                "Invalid CBOR request",
+                &format!("frame of {} bytes is too large", size),
+                None,
+            );
+            stream.write_all(&encode_frame(&response))?;
+            return Ok(false);
+        }
+        let end = FRAME_HEADER_SIZE + size;
+        if pending.len() < end {
+            break; // Incomplete frame: keep the bytes until the next read
+        }
+
+        let response = handle_binary_request(&pending[FRAME_HEADER_SIZE..end]);
+        pending.drain(..end);
+        println!(
+            "Enclave: Sending binary attestation response ({} bytes)",
+            response.len()
+        );
+        stream.write_all(&encode_frame(&response))?;
+    }
+    Ok(true)
+}
+
+fn encode_frame(payload: &[u8]) -> Vec<u8> {
+    let mut frame = Vec::with_capacity(FRAME_HEADER_SIZE + payload.len());
+    frame.extend_from_slice(&(payload.len() as u32).to_be_bytes());
+    frame.extend_from_slice(payload);
+    frame
+}
+
+fn split_requests(
+    pending: &[u8],
+) -> (Vec<serde_json::Result<AttestationRequest>>, usize) {
+    let mut requests = Vec::new();
+    let mut consumed = 0;
+    let mut stream = serde_json::Deserializer::from_slice(pending).into_iter::<AttestationRequest>();
+    loop {
+        match stream.next() {
+            Some(Ok(request)) => {
+                consumed = stream.byte_offset();
+                requests.push(Ok(request));
+            }
+            // Incomplete request: keep the remaining bytes until the next read
+            Some(Err(e)) if e.is_eof() => break,
+            Some(Err(e)) => {
+                // Malformed request: report it and discard the buffered bytes
+                consumed = pending.len();
+                requests.push(Err(e));
+                break;
+            }
+            None => {
+                consumed = pending.len();
+                break;
+            }
+        }
+    }
+    (requests, consumed)
+}
+
+fn handle_request(request: serde_json::Result<AttestationRequest>) -> String {
+    let attestation_request = match request {
+        Ok(attestation_request) => {
+            println!("Enclave: Parsed attestation request successfully");
+            attestation_request
+        }
+        Err(e) => {
+            println!("Enclave: Failed to parse JSON request: {:?}", e);
+            return error_response("Invalid JSON request", &e.to_string(), None);
+        }
+    };
+
+    // Decode the base64 encoded data
+    let user_data = match general_purpose::STANDARD.decode(&attestation_request.user_data) {
+        Ok(data) => {
+            println!(
+                "Enclave: Successfully decoded report-data ({} bytes)",
+                data.len()
+            );
+            data
+        }
+        Err(e) => {
+            println!("Enclave: Failed to decode report-data: {:?}", e);
+            return error_response("Invalid report-data encoding", &e.to_string(), None);
+        }
+    };
+
+    let nonce = match general_purpose::STANDARD.decode(&attestation_request.nonce) {
+        Ok(data) => {
+            println!("Enclave: Successfully decoded nonce ({} bytes)", data.len());
+            data
+        }
+        Err(e) => {
+            println!("Enclave: Failed to decode nonce: {:?}", e);
+            return error_response("Invalid nonce encoding", &e.to_string(), None);
+        }
+    };
+
+    // Fetch attestation document from NSM
+    match fetch_document_from_nsm(user_data, nonce) {
+        Ok(doc) => {
+            let encoded_doc = general_purpose::STANDARD.encode(doc);
+            let response = AttestationResponse {
+                document: encoded_doc,
+            };
+            match serde_json::to_string(&response) {
+                Ok(response_json) => response_json,
+                Err(e) => {
+                    eprintln!("Enclave: Failed to serialize response");
+                    error_response("Failed to serialize response", &e.to_string(), None)
+                }
+            }
+        }
+        Err(e) => {
+            eprintln!("Enclave: Failed to get attestation document: {:?}", e);
+            error_response(
+                "NSM device not available",
+                &e.to_string(),
+                Some("NSM_UNAVAILABLE"),
+            )
+        }
+    }
+}
+
+fn handle_binary_request(frame: &[u8]) -> Vec<u8> {
+    let request: BinaryAttestationRequest = match ciborium::from_reader(frame) {
+        Ok(request) => {
+            println!("Enclave: Parsed binary attestation request successfully");
+            request
+        }
+        Err(e) => {
+            println!("Enclave: Failed to parse CBOR request: {:?}", e);
+            return binary_error_response("Invalid CBOR request", &e.to_string(), None);
+        }
+    };
+
+    // The document is returned as is: no base64, no JSON
+    match fetch_document_from_nsm(request.user_data, request.nonce) {
+        Ok(doc) => doc,
+        Err(e) => {
+            eprintln!("Enclave: Failed to get attestation document: {:?}", e);
+            binary_error_response(
+                "NSM device not available",
+                &e.to_string(),
+                Some("NSM_UNAVAILABLE"),
+            )
+        }
+    }
+}
+
+// Errors are CBOR maps, while a document is a COSE_Sign1 array, so the parent can tell them apart
+fn binary_error_response(error: &str, message: &str, status: Option<&str>) -> Vec<u8> {
+    let mut error_response = BTreeMap::new();
+    error_response.insert("error", error);
+    error_response.insert("message", message);
+    if let Some(status) = status {
+        error_response.insert("status", status);
+    }
+    let mut encoded = Vec::new();
+    match ciborium::into_writer(&error_response, &mut encoded) {
+        Ok(()) => encoded,
+        Err(_) => Vec::new(),
+    }
+}
+
+fn error_response(error: &str, message: &str, status: Option<&str>) -> String {
+    let mut error_response = serde_json::json!({
+        "error": error,
+        "message": message
+    });
+    if let Some(status) = status {
+        error_response["status"] = serde_json::Value::from(status);
+    }
+    error_response.to_string()
+}
+
 fn fetch_document_from_nsm(user_data: Vec<u8>, nonce: Vec<u8>) -> Result<Vec<u8>> {
     let nsm_fd = driver::nsm_init();
 
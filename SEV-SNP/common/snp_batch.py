@@ -0,0 +1,196 @@
+import argparse
+import base64
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+DEFAULT_CHUNK_SIZE = 64
+DEFAULT_CERTS_DIR = "certs"
+VERDICTS_PATH = "snp-verdicts.jsonl"
+STATS_PATH = "snp-batch-stats.json"
+
+# Verifier of the worker process, created once by init_worker
+_worker_verifier = None
+_worker_cache = None
+_worker_measurement = None
+
+"""
+Read stored attestation reports from a JSONL file. Each line is an object with "report" and
+optionally "report_data" in base64, and an optional "id".
+@param path: Path to the JSONL file
+@return: Iterator of (id, report in bytes, expected REPORT_DATA or None)
+"""
+def read_jsonl(path):
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            report_data = record.get('report_data')
+            yield (
+                record.get('id', f"{path}:{line_number}"),
+                base64.b64decode(record['report']),
+                base64.b64decode(report_data) if report_data is not None else None,
+            )
+
+"""
+Read stored attestation reports from a directory. Each report is a raw <name>.bin file, with
+an optional <name>.req holding the expected REPORT_DATA (e.g. request-file.bin, renamed).
+@param path: Path to the directory
+@return: Iterator of (id, report in bytes, expected REPORT_DATA or None)
+"""
+def read_directory(path):
+    for report_path in sorted(Path(path).iterdir()):
+        if report_path.suffix != '.bin':
+            continue
+        request_path = report_path.with_suffix('.req')
+        report_data = request_path.read_bytes() if request_path.exists() else None
+        yield str(report_path), report_path.read_bytes(), report_data
+
+"""
+Read stored attestation reports from a directory or a JSONL file
+@param path: Input path
+@return: Iterator of (id, report in bytes, expected REPORT_DATA or None)
+"""
+def read_records(path):
+    if os.path.isdir(path):
+        return read_directory(path)
+    return read_jsonl(path)
+
+"""
+Initialize a worker process: load and check the certificates once, or open the certificate cache
+@param certs_dir: Directory with ark.pem, ask.pem and the VCEKs (ignored if cache_dir is given)
+@param measurement: Expected MEASUREMENT in bytes, or None
+@param cache_dir: Certificate cache directory, or None
+@param kds_url: KDS base URL of the certificate cache
+"""
+def init_worker(certs_dir, measurement, cache_dir=None, kds_url=None):
+    global _worker_verifier, _worker_cache, _worker_measurement
+    from snp_report import SnpVerifier
+
+    if cache_dir is not None:
+        from snp_certs import KDS_URL, CertificateCache, KdsFetcher
+        _worker_cache = CertificateCache(cache_dir, KdsFetcher(kds_url or KDS_URL))
+    else:
+        _worker_verifier = SnpVerifier.from_directory(certs_dir)
+    _worker_measurement = measurement
+
+"""
+Verify a chunk of stored attestation reports in a worker process
+@param chunk: List of (id, report in bytes, expected REPORT_DATA or None)
+@return: List of verdict dictionaries
+"""
+def verify_chunk(chunk):
+    from snp_report import SnpReport
+
+    verdicts = []
+    for record_id, report_bytes, report_data in chunk:
+        start = time.perf_counter()
+        verdict = {'id': record_id, 'valid': False, 'error': None}
+        try:
+            report = SnpReport(report_bytes)
+            verifier = _worker_cache.verifier(report) if _worker_cache is not None else _worker_verifier
+            verifier.check(report, report_data, _worker_measurement)
+            verdict['valid'] = True
+        except Exception as e:
+            verdict['error'] = str(e)
+        verdict['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        verdicts.append(verdict)
+    return verdicts
+
+"""
+Verify stored attestation reports across a process pool
+@param records: Iterable of (id, report in bytes, expected REPORT_DATA or None)
+@param verdicts_file: File to write one JSON verdict per line to
+@param workers: Number of worker processes (default: CPU count)
+@param chunk_size: Number of reports per work item
+@param certs_dir: Directory with ark.pem, ask.pem and the VCEKs
+@param measurement: Expected MEASUREMENT in bytes, or None to skip the check
+@param cache_dir: Certificate cache directory to fetch the VCEKs through, or None to use certs_dir
+@param kds_url: KDS base URL of the certificate cache
+@return: Dictionary of throughput statistics
+"""
+def verify_batch(records, verdicts_file, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 certs_dir=DEFAULT_CERTS_DIR, measurement=None, cache_dir=None, kds_url=None):
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    stats = {'reports': 0, 'valid': 0, 'invalid': 0}
+    records = iter(records)
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(os.path.abspath(certs_dir), measurement,
+                  os.path.abspath(cache_dir) if cache_dir else None, kds_url),
+    ) as executor:
+        in_flight = set()
+
+        def collect(done):
+            for future in done:
+                for verdict in future.result():
+                    stats['reports'] += 1
+                    if verdict['valid']:
+                        stats['valid'] += 1
+                    else:
+                        stats['invalid'] += 1
+                    verdicts_file.write(json.dumps(verdict) + "\n")
+
+        # Keep a bounded number of chunks in flight so the input is streamed, not loaded at once
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            in_flight.add(executor.submit(verify_chunk, chunk))
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+        done, _ = wait(in_flight)
+        collect(done)
+
+    elapsed = time.perf_counter() - start
+    stats['workers'] = workers
+    stats['chunk_size'] = chunk_size
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['reports_per_second'] = round(stats['reports'] / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify stored SEV-SNP attestation reports in batch")
+    parser.add_argument("input", help="Directory of .bin reports (with optional .req REPORT_DATA), or JSONL file")
+    parser.add_argument("--certs", default=DEFAULT_CERTS_DIR, help="Directory with ark.pem, ask.pem and the VCEKs")
+    parser.add_argument("--cache-dir", help="Fetch the certificates through this certificate cache instead of --certs")
+    parser.add_argument("--kds-url", help="KDS base URL of the certificate cache (default: AMD KDS)")
+    parser.add_argument("--measurement", help="Expected MEASUREMENT in hex")
+    parser.add_argument("--verdicts", default=VERDICTS_PATH, help="Per-report verdict file (JSONL)")
+    parser.add_argument("--stats", default=STATS_PATH, help="Throughput statistics file (JSON)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Reports per work item")
+    args = parser.parse_args()
+
+    measurement = bytes.fromhex(args.measurement) if args.measurement else None
+    print(f"Verifying attestation reports from {args.input}...")
+    with open(args.verdicts, 'w') as verdicts_file:
+        stats = verify_batch(
+            read_records(args.input), verdicts_file,
+            workers=args.workers, chunk_size=args.chunk_size,
+            certs_dir=args.certs, measurement=measurement,
+            cache_dir=args.cache_dir, kds_url=args.kds_url,
+        )
+
+    with open(args.stats, 'w') as f:
+        json.dump(stats, f, indent=2)
+
+    print(f"Verified {stats['reports']} reports in {stats['elapsed_seconds']} seconds "
+          f"({stats['reports_per_second']} reports/s)")
+    print(f"   Valid: {stats['valid']}, Invalid: {stats['invalid']}")
+    print(f"Verdicts saved to: {args.verdicts}")
+    print(f"Statistics saved to: {args.stats}")
+    return 0 if stats['invalid'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
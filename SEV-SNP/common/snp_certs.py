@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import threading
+import urllib.request
+from collections import OrderedDict
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+
+from snp_report import (
+    TURIN_FAMILY,
+    TURIN_HW_ID_SIZE,
+    SnpVerifier,
+    tcb_parts,
+    vcek_chip_id,
+    vcek_tcb,
+    verify_certificate_signature,
+)
+
+KDS_URL = "https://kdsintf.amd.com"
+THIM_URL = "http://169.254.169.254/metadata/THIM/amd/certification"
+DEFAULT_CACHE_DIR = "snp-cert-cache"
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_PRODUCT = "Milan"
+DEFAULT_TIMEOUT = 30  # seconds
+
+# KDS query parameters of the TCB components
+KDS_TCB_PARAMS = {'bootloader': 'blSPL', 'tee': 'teeSPL', 'snp': 'snpSPL', 'microcode': 'ucodeSPL', 'fmc': 'fmcSPL'}
+
+"""
+Get the KDS product name of the processor that issued a report
+@param report: SnpReport
+@param default: Product name for reports that do not carry the CPUID (version 2)
+@return: "Milan", "Genoa" or "Turin"
+"""
+def product_name(report, default=DEFAULT_PRODUCT):
+    family = report.cpuid_family
+    if family is None:
+        return default
+    if family == TURIN_FAMILY:
+        return "Turin"
+    return "Milan" if report.cpuid_model < 0x10 else "Genoa"
+
+"""
+Load the certificates of a PEM bundle
+@param data: PEM bytes
+@return: List of certificates, in file order
+"""
+def load_pem_chain(data):
+    return x509.load_pem_x509_certificates(data)
+
+def _load_certificate(data):
+    if data.lstrip().startswith(b'-----BEGIN'):
+        return x509.load_pem_x509_certificate(data, default_backend())
+    return x509.load_der_x509_certificate(data, default_backend())
+
+def _get(url, headers=None, timeout=DEFAULT_TIMEOUT):
+    request = urllib.request.Request(url, headers=headers or {})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+"""
+Certificate fetcher for the AMD Key Distribution Service (or a stand-in with the same paths)
+@param base_url: KDS base URL
+@param timeout: HTTP timeout in seconds
+"""
+class KdsFetcher:
+    def __init__(self, base_url=KDS_URL, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    """
+    Build the VCEK URL of a chip and TCB
+    @param product: Product name
+    @param chip_id: Chip ID in bytes
+    @param reported_tcb: Reported TCB as an integer
+    @return: URL
+    """
+    def vcek_url(self, product, chip_id, reported_tcb):
+        turin = product == "Turin"
+        hw_id = bytes(chip_id[:TURIN_HW_ID_SIZE] if turin else chip_id).hex()
+        query = "&".join(f"{KDS_TCB_PARAMS[name]}={spl:02}" for name, spl in tcb_parts(reported_tcb, turin).items())
+        return f"{self.base_url}/vcek/v1/{product}/{hw_id}?{query}"
+
+    """
+    Fetch the VCEK of a chip and TCB
+    @param product: Product name
+    @param chip_id: Chip ID in bytes
+    @param reported_tcb: Reported TCB as an integer
+    @return: VCEK certificate
+    """
+    def fetch_vcek(self, product, chip_id, reported_tcb):
+        return _load_certificate(_get(self.vcek_url(product, chip_id, reported_tcb), timeout=self.timeout))
+
+    """
+    Fetch the ASK and the ARK of a product
+    @param product: Product name
+    @return: (ASK certificate, ARK certificate)
+    """
+    def fetch_ca_chain(self, product):
+        ask, ark = load_pem_chain(_get(f"{self.base_url}/vcek/v1/{product}/cert_chain", timeout=self.timeout))
+        return ask, ark
+
+"""
+Certificate fetcher for the Azure IMDS THIM endpoint, which serves the certificates of the
+CVM it is called from (whatever chip and TCB are asked for)
+@param url: THIM URL
+@param timeout: HTTP timeout in seconds
+"""
+class ThimFetcher:
+    def __init__(self, url=THIM_URL, timeout=DEFAULT_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def _certification(self):
+        return json.loads(_get(self.url, headers={'Metadata': 'true'}, timeout=self.timeout))
+
+    def fetch_vcek(self, product, chip_id, reported_tcb):
+        return _load_certificate(self._certification()['vcekCert'].encode())
+
+    def fetch_ca_chain(self, product):
+        ask, ark = load_pem_chain(self._certification()['certificateChain'].encode())
+        return ask, ark
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+"""
+Certificate cache keyed by (product, chip ID, reported TCB). VCEKs and CA chains are kept on
+disk, so they survive restarts and are shared by processes, with an in-memory LRU of ready
+verifiers in front. A chain is verified once, when fetched; the result is stored next to the
+certificate, bound to the ARK it was verified against. Concurrent requests for the same key
+wait for a single fetch.
+@param directory: Cache directory
+@param fetcher: Certificate fetcher (KdsFetcher, ThimFetcher or a stand-in), or None for the AMD KDS
+@param max_entries: Maximum number of verifiers kept in memory
+"""
+class CertificateCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, fetcher=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.directory = directory
+        self.fetcher = fetcher if fetcher is not None else KdsFetcher()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.fetches = 0
+        self.collapsed = 0
+        self._entries = OrderedDict()
+        self._ca_chains = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._ca_lock = threading.Lock()  # CA chains are loaded one at a time, so each is fetched once
+
+    """
+    Get the verifier for a report
+    @param report: SnpReport
+    @param product: Product name, or None to derive it from the report
+    @return: SnpVerifier holding the report's VCEK
+    """
+    def verifier(self, report, product=None):
+        return self.get(product or product_name(report), report.chip_id, report.reported_tcb)
+
+    """
+    Get the verifier for a chip and TCB, from memory, from disk or by fetching the certificates
+    @param product: Product name
+    @param chip_id: Chip ID in bytes
+    @param reported_tcb: Reported TCB as an integer
+    @return: SnpVerifier holding the VCEK
+    """
+    def get(self, product, chip_id, reported_tcb):
+        key = (product, bytes(chip_id), reported_tcb)
+        with self._lock:
+            verifier = self._entries.get(key)
+            if verifier is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return verifier
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._load(key)
+            with self._lock:
+                self._entries[key] = flight.result
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    """
+    Get cache statistics
+    @return: Dictionary of memory hit, disk hit, fetch and collapsed request counters
+    """
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'fetches': self.fetches,
+                'collapsed': self.collapsed,
+                'size': len(self._entries),
+            }
+
+    def _product_dir(self, product):
+        path = os.path.join(self.directory, product)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    """
+    Get the verified ASK and ARK of a product
+    @param product: Product name
+    @return: (ASK certificate, ARK certificate)
+    """
+    def _ca_chain(self, product):
+        with self._ca_lock:
+            chain = self._ca_chains.get(product)
+            if chain is None:
+                chain = self._ca_chains[product] = self._load_ca_chain(product)
+            return chain
+
+    def _load_ca_chain(self, product):
+        path = os.path.join(self._product_dir(product), "cert_chain.pem")
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                ask, ark = load_pem_chain(f.read())
+        else:
+            ask, ark = self.fetcher.fetch_ca_chain(product)
+            if not (verify_certificate_signature(ark, ark) and verify_certificate_signature(ask, ark)):
+                raise Exception(f"ARK -> ASK certificate chain of {product} is invalid")
+            _write_atomic(path, b"".join(cert.public_bytes(serialization.Encoding.PEM) for cert in (ask, ark)))
+        return ask, ark
+
+    """
+    Load the verifier of a key from disk, or fetch and verify its VCEK
+    @param key: (product, chip ID, reported TCB)
+    @return: SnpVerifier
+    """
+    def _load(self, key):
+        product, chip_id, reported_tcb = key
+        ask, ark = self._ca_chain(product)
+        ark_fingerprint = hashlib.sha256(ark.public_bytes(serialization.Encoding.DER)).hexdigest()
+
+        name = f"vcek-{chip_id.hex()}-{reported_tcb:016x}"
+        vcek_path = os.path.join(self._product_dir(product), f"{name}.pem")
+        status_path = os.path.join(self._product_dir(product), f"{name}.json")
+        if os.path.exists(vcek_path) and os.path.exists(status_path):
+            with open(status_path, 'r') as f:
+                status = json.load(f)
+            # The stored status only counts for the ARK it was verified against
+            if status.get('verified') and status.get('ark_sha256') == ark_fingerprint:
+                with open(vcek_path, 'rb') as f:
+                    vcek = _load_certificate(f.read())
+                with self._lock:
+                    self.disk_hits += 1
+                return SnpVerifier(ark, ask, [vcek], chain_verified=True)
+
+        with self._lock:
+            self.fetches += 1
+        vcek = self.fetcher.fetch_vcek(product, chip_id, reported_tcb)
+        verifier = SnpVerifier(ark, ask, [vcek])  # Verifies ARK -> ASK -> VCEK
+        _check_vcek_identity(vcek, product, chip_id, reported_tcb)
+
+        _write_atomic(vcek_path, vcek.public_bytes(serialization.Encoding.PEM))
+        _write_atomic(status_path, json.dumps({'verified': True, 'ark_sha256': ark_fingerprint}).encode())
+        return verifier
+
+def _check_vcek_identity(vcek, product, chip_id, reported_tcb):
+    # A VCEK fetched for one chip and TCB must not be cached under another
+    vcek_chip = vcek_chip_id(vcek)
+    if vcek_chip is not None and bytes(vcek_chip) not in (chip_id, chip_id[:TURIN_HW_ID_SIZE]):
+        raise Exception("Fetched VCEK was issued for another chip")
+    expected = tcb_parts(reported_tcb, product == "Turin")
+    for name, spl in vcek_tcb(vcek).items():
+        if name in expected and expected[name] != spl:
+            raise Exception(f"Fetched VCEK was issued for another TCB ({name} SPL {spl})")
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,195 @@
+import argparse
+import base64
+import datetime
+import json
+import os
+import secrets
+import struct
+import sys
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa, utils
+
+from snp_report import (
+    CHIP_ID,
+    COMMITTED_TCB_OFFSET,
+    CPUID_OFFSET,
+    HEADER_FORMAT,
+    LAUNCH_TCB_OFFSET,
+    MEASUREMENT,
+    OID_BL_SPL,
+    OID_HW_ID,
+    OID_SNP_SPL,
+    OID_TEE_SPL,
+    OID_UCODE_SPL,
+    REPORT_DATA,
+    REPORT_SIZE,
+    REPORTED_TCB_OFFSET,
+    SIGNATURE_ALGO_ECDSA_P384_SHA384,
+    SIGNATURE_COMPONENT_SIZE,
+    SIGNATURE_OFFSET,
+    SIGNED_SIZE,
+    TCB_LAYOUT,
+)
+
+DEFAULT_VALIDITY = datetime.timedelta(days=30)
+DEFAULT_RSA_KEY_SIZE = 4096  # As AMD's ARK and ASK
+DEFAULT_POLICY = 0x30000
+DEFAULT_TCB = {'bootloader': 4, 'tee': 0, 'snp': 22, 'microcode': 213}
+MILAN_FAMILY = 0x19
+
+# AMD signs its certificates with RSASSA-PSS, SHA-384, salt length 48
+PSS_PADDING = padding.PSS(mgf=padding.MGF1(hashes.SHA384()), salt_length=48)
+
+"""
+Build a certificate signed with RSASSA-PSS
+@param common_name: Subject common name
+@param public_key: Subject public key
+@param issuer_name: Issuer name
+@param issuer_key: Issuer private key (RSA)
+@param is_ca: Whether the certificate is a CA certificate
+@param extensions: List of extra extensions (x509.UnrecognizedExtension)
+@return: Certificate
+"""
+def make_certificate(common_name, public_key, issuer_name, issuer_key, is_ca, extensions=()):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    subject_name = x509.Name([
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Synthetic SEV-SNP Test CA"),
+        x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+    ])
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(subject_name)
+        .issuer_name(issuer_name or subject_name)
+        .public_key(public_key)
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + DEFAULT_VALIDITY)
+        .add_extension(x509.BasicConstraints(ca=is_ca, path_length=None), critical=True)
+    )
+    for extension in extensions:
+        builder = builder.add_extension(extension, critical=False)
+    return builder.sign(issuer_key, hashes.SHA384(), rsa_padding=PSS_PADDING)
+
+"""
+Encode a TCB as a TCB_VERSION
+@param tcb: Dictionary of component name to SPL
+@return: TCB_VERSION as an integer
+"""
+def encode_tcb(tcb):
+    value = 0
+    for name, offset in TCB_LAYOUT.items():
+        value |= (tcb.get(name, 0) & 0xFF) << (8 * offset)
+    return value
+
+def _der_integer(value):
+    body = value.to_bytes(max(1, (value.bit_length() + 8) // 8), 'big')
+    return bytes([0x02, len(body)]) + body
+
+"""
+Synthetic stand-in for the AMD key hierarchy and the AMD-SP. It mints an ARK, an ASK and one
+VCEK per chip, with the hwID and TCB extensions of AMD's VCEKs, and signs attestation reports.
+Reports signed by it only verify against its own certificates.
+@param chips: Number of chips (one VCEK each)
+@param tcb: Dictionary of component name to SPL of the VCEKs and reports
+@param rsa_key_size: Size of the ARK and ASK keys
+"""
+class SyntheticSnpPlatform:
+    def __init__(self, chips=1, tcb=None, rsa_key_size=DEFAULT_RSA_KEY_SIZE):
+        self.tcb = dict(DEFAULT_TCB if tcb is None else tcb)
+        self.ark_key = rsa.generate_private_key(public_exponent=65537, key_size=rsa_key_size)
+        self.ark = make_certificate("ARK-Synthetic", self.ark_key.public_key(), None, self.ark_key, True)
+        self.ask_key = rsa.generate_private_key(public_exponent=65537, key_size=rsa_key_size)
+        self.ask = make_certificate("SEV-Synthetic", self.ask_key.public_key(), self.ark.subject, self.ark_key, True)
+
+        self.chips = []  # (chip ID, VCEK private key, VCEK certificate)
+        for _ in range(chips):
+            chip_id = secrets.token_bytes(CHIP_ID[1])
+            key = ec.generate_private_key(ec.SECP384R1())
+            extensions = [
+                x509.UnrecognizedExtension(x509.ObjectIdentifier(OID_HW_ID), chip_id),
+                x509.UnrecognizedExtension(x509.ObjectIdentifier(OID_BL_SPL), _der_integer(self.tcb['bootloader'])),
+                x509.UnrecognizedExtension(x509.ObjectIdentifier(OID_TEE_SPL), _der_integer(self.tcb['tee'])),
+                x509.UnrecognizedExtension(x509.ObjectIdentifier(OID_SNP_SPL), _der_integer(self.tcb['snp'])),
+                x509.UnrecognizedExtension(x509.ObjectIdentifier(OID_UCODE_SPL), _der_integer(self.tcb['microcode'])),
+            ]
+            vcek = make_certificate("SEV-VCEK", key.public_key(), self.ask.subject, self.ask_key, False, extensions)
+            self.chips.append((chip_id, key, vcek))
+
+    """
+    Issue an attestation report (version 3, signed by a chip's VCEK)
+    @param report_data: REPORT_DATA in bytes (up to 64)
+    @param measurement: MEASUREMENT in bytes (random if None)
+    @param chip: Index of the chip
+    @param policy: Guest policy
+    @return: Report in bytes
+    """
+    def report(self, report_data, measurement=None, chip=0, policy=DEFAULT_POLICY):
+        chip_id, key, _ = self.chips[chip]
+        if measurement is None:
+            measurement = secrets.token_bytes(MEASUREMENT[1])
+        tcb = encode_tcb(self.tcb)
+
+        report = bytearray(REPORT_SIZE)
+        HEADER_FORMAT.pack_into(report, 0, 3, 0, policy, bytes(16), bytes(16), 0,
+                                SIGNATURE_ALGO_ECDSA_P384_SHA384, tcb, 0, 0)
+        report[REPORT_DATA[0]:REPORT_DATA[0] + len(report_data)] = report_data
+        report[MEASUREMENT[0]:MEASUREMENT[0] + MEASUREMENT[1]] = measurement
+        report[CHIP_ID[0]:CHIP_ID[0] + CHIP_ID[1]] = chip_id
+        report[CPUID_OFFSET] = MILAN_FAMILY
+        for offset in (REPORTED_TCB_OFFSET, COMMITTED_TCB_OFFSET, LAUNCH_TCB_OFFSET):
+            struct.pack_into("<Q", report, offset, tcb)
+
+        r, s = utils.decode_dss_signature(key.sign(bytes(report[:SIGNED_SIZE]), ec.ECDSA(hashes.SHA384())))
+        report[SIGNATURE_OFFSET:SIGNATURE_OFFSET + SIGNATURE_COMPONENT_SIZE] = r.to_bytes(SIGNATURE_COMPONENT_SIZE, 'little')
+        s_offset = SIGNATURE_OFFSET + SIGNATURE_COMPONENT_SIZE
+        report[s_offset:s_offset + SIGNATURE_COMPONENT_SIZE] = s.to_bytes(SIGNATURE_COMPONENT_SIZE, 'little')
+        return bytes(report)
+
+    """
+    Write the certificates as snpguest does (ark.pem, ask.pem, vcek.pem), with one VCEK file per chip
+    @param directory: Output directory
+    """
+    def write_certs(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name, cert in (("ark.pem", self.ark), ("ask.pem", self.ask)):
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(cert.public_bytes(serialization.Encoding.PEM))
+        for i, (_, _, vcek) in enumerate(self.chips):
+            name = "vcek.pem" if i == 0 else f"vcek-{i}.pem"
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(vcek.public_bytes(serialization.Encoding.PEM))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic SEV-SNP attestation reports")
+    parser.add_argument("--out", default="snp-fixtures", help="Output directory")
+    parser.add_argument("--count", type=int, default=100, help="Number of reports")
+    parser.add_argument("--chips", type=int, default=1, help="Number of chips")
+    parser.add_argument("--rsa-key-size", type=int, default=DEFAULT_RSA_KEY_SIZE, help="Size of the ARK and ASK keys")
+    args = parser.parse_args()
+
+    platform = SyntheticSnpPlatform(args.chips, rsa_key_size=args.rsa_key_size)
+    certs_dir = os.path.join(args.out, "certs")
+    platform.write_certs(certs_dir)
+
+    reports_path = os.path.join(args.out, "reports.jsonl")
+    measurement = secrets.token_bytes(MEASUREMENT[1])
+    with open(reports_path, "w") as f:
+        for i in range(args.count):
+            report_data = secrets.token_bytes(REPORT_DATA[1])
+            record = {
+                'id': i,
+                'report': base64.b64encode(platform.report(report_data, measurement, i % args.chips)).decode(),
+                'report_data': base64.b64encode(report_data).decode(),
+            }
+            f.write(json.dumps(record) + "\n")
+
+    print(f"Certificates saved to: {certs_dir}")
+    print(f"Measurement: {measurement.hex()}")
+    print(f"{args.count} attestation reports saved to: {reports_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
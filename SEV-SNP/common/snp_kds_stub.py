@@ -0,0 +1,126 @@
+import argparse
+import base64
+import json
+import os
+import secrets
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from cryptography.hazmat.primitives import serialization
+
+from snp_fixtures import DEFAULT_RSA_KEY_SIZE, SyntheticSnpPlatform
+from snp_report import MEASUREMENT, REPORT_DATA
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8787
+
+"""
+Stand-in for the AMD Key Distribution Service, serving the certificates of a synthetic platform
+on the KDS paths: /vcek/v1/{product}/cert_chain (PEM, ASK then ARK) and
+/vcek/v1/{product}/{hwid}?blSPL=..&teeSPL=..&snpSPL=..&ucodeSPL=.. (DER). Requests are counted,
+so tests can check how often a cache went to the network.
+"""
+class KdsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 4 or parts[:2] != ["vcek", "v1"]:
+            self.send_error(404)
+            return
+
+        with server.lock:
+            server.requests += 1
+        platform = server.platform
+        if parts[3] == "cert_chain":
+            body = b"".join(cert.public_bytes(serialization.Encoding.PEM) for cert in (platform.ask, platform.ark))
+            self._send(body, "application/x-pem-file")
+            return
+
+        vcek = self._find_vcek(parts[3], parse_qs(url.query))
+        if vcek is None:
+            self.send_error(404)
+            return
+        self._send(vcek.public_bytes(serialization.Encoding.DER), "application/octet-stream")
+
+    def _find_vcek(self, hw_id, query):
+        platform = self.server.platform
+        try:
+            hw_id = bytes.fromhex(hw_id)
+            spls = {name: int(query[param][0]) for name, param in
+                    (('bootloader', 'blSPL'), ('tee', 'teeSPL'), ('snp', 'snpSPL'), ('microcode', 'ucodeSPL'))}
+        except (KeyError, ValueError):
+            return None
+        if any(platform.tcb[name] != spl for name, spl in spls.items()):
+            return None
+        for chip_id, _, vcek in platform.chips:
+            if chip_id == hw_id:
+                return vcek
+        return None
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class KdsStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+"""
+Create a stand-in KDS server
+@param platform: SyntheticSnpPlatform whose certificates are served
+@param host: Listen address
+@param port: Listen port (0 for any free port)
+@return: Server (call serve_forever to run it; server.url is its base URL)
+"""
+def create_kds_server(platform, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    server = KdsStubServer((host, port), KdsRequestHandler)
+    server.platform = platform
+    server.requests = 0
+    server.lock = threading.Lock()
+    server.url = f"http://{host}:{server.server_address[1]}"
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the certificates of a synthetic SEV-SNP platform on the AMD KDS paths")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Listen address")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Listen port")
+    parser.add_argument("--chips", type=int, default=1, help="Number of chips")
+    parser.add_argument("--rsa-key-size", type=int, default=DEFAULT_RSA_KEY_SIZE, help="Size of the ARK and ASK keys")
+    parser.add_argument("--reports", help="Also write this many reports per chip to snp-kds-reports.jsonl", type=int, default=0)
+    args = parser.parse_args()
+
+    platform = SyntheticSnpPlatform(args.chips, rsa_key_size=args.rsa_key_size)
+    if args.reports:
+        measurement = secrets.token_bytes(MEASUREMENT[1])
+        with open("snp-kds-reports.jsonl", "w") as f:
+            for i in range(args.reports * args.chips):
+                report_data = secrets.token_bytes(REPORT_DATA[1])
+                record = {
+                    'id': i,
+                    'report': base64.b64encode(platform.report(report_data, measurement, i % args.chips)).decode(),
+                    'report_data': base64.b64encode(report_data).decode(),
+                }
+                f.write(json.dumps(record) + "\n")
+        print(f"Reports saved to: {os.path.abspath('snp-kds-reports.jsonl')}")
+
+    server = create_kds_server(platform, args.host, args.port)
+    print(f"Stand-in KDS listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+import argparse
+import glob
+import os
+import struct
+import sys
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, rsa, utils
+
+# Attestation report layout (SEV-SNP Firmware ABI Specification, Table "ATTESTATION_REPORT Structure")
+REPORT_SIZE = 0x4A0
+SIGNED_SIZE = 0x2A0  # The signature covers bytes 0x000-0x29F
+SIGNATURE_OFFSET = 0x2A0
+SIGNATURE_COMPONENT_SIZE = 72  # R and S, little-endian, zero-padded
+SIGNATURE_ALGO_ECDSA_P384_SHA384 = 1
+
+# (offset, size) of the byte fields
+REPORT_DATA = (0x50, 64)
+MEASUREMENT = (0x90, 48)
+HOST_DATA = (0xC0, 32)
+ID_KEY_DIGEST = (0xE0, 48)
+AUTHOR_KEY_DIGEST = (0x110, 48)
+REPORT_ID = (0x140, 32)
+REPORT_ID_MA = (0x160, 32)
+CHIP_ID = (0x1A0, 64)
+
+# Header up to the flags: version, guest_svn, policy, family_id, image_id, vmpl, signature_algo,
+# current_tcb, platform_info, flags
+HEADER_FORMAT = struct.Struct("<IIQ16s16sIIQQI")
+REPORTED_TCB_OFFSET = 0x180
+CPUID_OFFSET = 0x188  # Family, model and stepping (report version 3 and later)
+COMMITTED_TCB_OFFSET = 0x1E0
+LAUNCH_TCB_OFFSET = 0x1F0
+
+TURIN_FAMILY = 0x1A
+TURIN_HW_ID_SIZE = 8
+
+# Byte offsets of the security patch levels in a TCB_VERSION
+TCB_LAYOUT = {'bootloader': 0, 'tee': 1, 'snp': 6, 'microcode': 7}
+TURIN_TCB_LAYOUT = {'fmc': 0, 'bootloader': 1, 'tee': 2, 'snp': 3, 'microcode': 7}
+
+# VCEK certificate extensions (AMD KDS specification)
+OID_BL_SPL = "1.3.6.1.4.1.3704.1.3.1"
+OID_TEE_SPL = "1.3.6.1.4.1.3704.1.3.2"
+OID_SNP_SPL = "1.3.6.1.4.1.3704.1.3.3"
+OID_UCODE_SPL = "1.3.6.1.4.1.3704.1.3.8"
+OID_FMC_SPL = "1.3.6.1.4.1.3704.1.3.9"
+OID_HW_ID = "1.3.6.1.4.1.3704.1.4"
+VCEK_TCB_OIDS = {
+    'bootloader': OID_BL_SPL,
+    'tee': OID_TEE_SPL,
+    'snp': OID_SNP_SPL,
+    'microcode': OID_UCODE_SPL,
+    'fmc': OID_FMC_SPL,
+}
+
+"""
+SEV-SNP attestation report. Fields are read on access from a memoryview over the report
+bytes; byte fields are returned as memoryview slices, so nothing is copied (use bytes() to
+keep a field beyond the lifetime of the buffer).
+@param data: Report in bytes (report.bin)
+"""
+class SnpReport:
+    def __init__(self, data):
+        self.view = memoryview(data)
+        if len(self.view) < REPORT_SIZE:
+            raise Exception(f"Attestation report is {len(self.view)} bytes, expected {REPORT_SIZE}")
+        (self.version, self.guest_svn, self.policy, _, _, self.vmpl, self.signature_algo,
+         self.current_tcb, self.platform_info, self.flags) = HEADER_FORMAT.unpack_from(self.view, 0)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def _field(self, field):
+        offset, size = field
+        return self.view[offset:offset + size]
+
+    def _u64(self, offset):
+        return struct.unpack_from("<Q", self.view, offset)[0]
+
+    @property
+    def family_id(self):
+        return self.view[0x10:0x20]
+
+    @property
+    def image_id(self):
+        return self.view[0x20:0x30]
+
+    @property
+    def report_data(self):
+        return self._field(REPORT_DATA)
+
+    @property
+    def measurement(self):
+        return self._field(MEASUREMENT)
+
+    @property
+    def host_data(self):
+        return self._field(HOST_DATA)
+
+    @property
+    def id_key_digest(self):
+        return self._field(ID_KEY_DIGEST)
+
+    @property
+    def report_id(self):
+        return self._field(REPORT_ID)
+
+    @property
+    def chip_id(self):
+        return self._field(CHIP_ID)
+
+    @property
+    def reported_tcb(self):
+        return self._u64(REPORTED_TCB_OFFSET)
+
+    @property
+    def committed_tcb(self):
+        return self._u64(COMMITTED_TCB_OFFSET)
+
+    @property
+    def launch_tcb(self):
+        return self._u64(LAUNCH_TCB_OFFSET)
+
+    @property
+    def cpuid_family(self):
+        if self.version < 3:
+            return None
+        return self.view[CPUID_OFFSET]
+
+    @property
+    def cpuid_model(self):
+        if self.version < 3:
+            return None
+        return self.view[CPUID_OFFSET + 1]
+
+    @property
+    def signing_key(self):
+        # 0: VCEK, 1: VLEK, 7: none
+        return (self.flags >> 2) & 0x7
+
+    @property
+    def signed_bytes(self):
+        return self.view[:SIGNED_SIZE]
+
+    """
+    Get the signature as (r, s) integers
+    @return: (r, s)
+    """
+    def signature(self):
+        r = int.from_bytes(self.view[SIGNATURE_OFFSET:SIGNATURE_OFFSET + SIGNATURE_COMPONENT_SIZE], 'little')
+        s_offset = SIGNATURE_OFFSET + SIGNATURE_COMPONENT_SIZE
+        s = int.from_bytes(self.view[s_offset:s_offset + SIGNATURE_COMPONENT_SIZE], 'little')
+        return r, s
+
+    """
+    Split the reported TCB into its security patch levels
+    @return: Dictionary of component name to SPL
+    """
+    def reported_tcb_parts(self):
+        return tcb_parts(self.reported_tcb, self.cpuid_family == TURIN_FAMILY)
+
+    """
+    Get the main fields in a printable form
+    @return: Dictionary of field name to value (hex strings for byte fields)
+    """
+    def summary(self):
+        return {
+            'version': self.version,
+            'guest_svn': self.guest_svn,
+            'policy': hex(self.policy),
+            'vmpl': self.vmpl,
+            'measurement': self.measurement.hex(),
+            'report_data': self.report_data.hex(),
+            'host_data': self.host_data.hex(),
+            'chip_id': self.chip_id.hex(),
+            'reported_tcb': self.reported_tcb_parts(),
+            'signing_key': self.signing_key,
+        }
+
+"""
+Split a TCB_VERSION into its security patch levels
+@param tcb: TCB_VERSION as an integer
+@param turin: Whether the report is from a Turin (family 1Ah) processor
+@return: Dictionary of component name to SPL
+"""
+def tcb_parts(tcb, turin=False):
+    layout = TURIN_TCB_LAYOUT if turin else TCB_LAYOUT
+    return {name: (tcb >> (8 * offset)) & 0xFF for name, offset in layout.items()}
+
+"""
+Load a certificate in PEM or DER
+@param path: Path to the certificate
+@return: Certificate
+"""
+def load_certificate(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data.lstrip().startswith(b'-----BEGIN'):
+        return x509.load_pem_x509_certificate(data, default_backend())
+    return x509.load_der_x509_certificate(data, default_backend())
+
+"""
+Verify that a certificate is signed by an issuer. AMD signs the ARK, ASK and VCEK certificates
+with RSASSA-PSS; the parameters are taken from the certificate.
+@param cert: Certificate
+@param issuer: Issuer certificate
+@return: True if the signature is valid, False otherwise
+"""
+def verify_certificate_signature(cert, issuer):
+    public_key = issuer.public_key()
+    try:
+        if isinstance(public_key, rsa.RSAPublicKey):
+            public_key.verify(cert.signature, cert.tbs_certificate_bytes,
+                              cert.signature_algorithm_parameters, cert.signature_hash_algorithm)
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            public_key.verify(cert.signature, cert.tbs_certificate_bytes, ec.ECDSA(cert.signature_hash_algorithm))
+        else:
+            return False
+        return True
+    except InvalidSignature:
+        return False
+
+"""
+Verify the chain of trust ARK -> ASK -> VCEK
+@param vcek: VCEK (or VLEK) certificate
+@param ask: ASK (or ASVK) certificate
+@param ark: ARK certificate
+@return: True if the chain is valid, False otherwise
+"""
+def verify_certificate_chain(vcek, ask, ark):
+    return (verify_certificate_signature(ark, ark)
+            and verify_certificate_signature(ask, ark)
+            and verify_certificate_signature(vcek, ask))
+
+"""
+Verify the report signature with the VCEK
+@param report: SnpReport
+@param vcek: VCEK (or VLEK) certificate
+@return: True if the signature is valid, False otherwise
+"""
+def verify_report_signature(report, vcek):
+    if report.signature_algo != SIGNATURE_ALGO_ECDSA_P384_SHA384:
+        return False
+    r, s = report.signature()
+    try:
+        vcek.public_key().verify(utils.encode_dss_signature(r, s), report.signed_bytes, ec.ECDSA(hashes.SHA384()))
+        return True
+    except InvalidSignature:
+        return False
+
+def _extension_value(cert, oid):
+    try:
+        value = cert.extensions.get_extension_for_oid(x509.ObjectIdentifier(oid)).value.value
+    except x509.ExtensionNotFound:
+        return None
+    return value
+
+def _der_integer(value):
+    # SPL extensions hold a DER INTEGER
+    if len(value) < 2 or value[0] != 0x02 or value[1] != len(value) - 2:
+        raise Exception("Malformed VCEK TCB extension")
+    return int.from_bytes(value[2:], 'big')
+
+"""
+Get the chip ID a VCEK was issued for
+@param vcek: VCEK certificate
+@return: Chip ID in bytes, or None if the certificate has no hwID extension (e.g. a VLEK)
+"""
+def vcek_chip_id(vcek):
+    value = _extension_value(vcek, OID_HW_ID)
+    if value is None:
+        return None
+    # The hwID is either the raw 64 bytes or a DER OCTET STRING of them
+    if len(value) == 66 and value[0] == 0x04 and value[1] == 64:
+        return value[2:]
+    return value
+
+"""
+Get the TCB a VCEK was issued for
+@param vcek: VCEK certificate
+@return: Dictionary of component name to SPL (components without an extension are left out)
+"""
+def vcek_tcb(vcek):
+    tcb = {}
+    for name, oid in VCEK_TCB_OIDS.items():
+        value = _extension_value(vcek, oid)
+        if value is not None:
+            tcb[name] = _der_integer(value)
+    return tcb
+
+"""
+Verifier of SEV-SNP attestation reports against a set of AMD certificates. The ARK -> ASK
+chain and each VCEK are checked once when loaded; VCEKs are indexed by chip ID, so one
+verifier serves reports from many chips.
+@param ark: ARK certificate
+@param ask: ASK (or ASVK) certificate
+@param veks: VCEK (or VLEK) certificates
+@param chain_verified: Whether the certificates were already checked (e.g. by a certificate cache)
+"""
+class SnpVerifier:
+    def __init__(self, ark, ask, veks, chain_verified=False):
+        if not chain_verified and not (verify_certificate_signature(ark, ark) and verify_certificate_signature(ask, ark)):
+            raise Exception("ARK -> ASK certificate chain is invalid")
+        self.ark = ark
+        self.ask = ask
+        self.veks = list(veks)
+        self._by_chip = {}
+        self._unindexed = []
+        for vek in self.veks:
+            if not chain_verified and not verify_certificate_signature(vek, ask):
+                raise Exception(f"{vek.subject} is not signed by the ASK")
+            chip_id = vcek_chip_id(vek)
+            if chip_id is None:
+                self._unindexed.append(vek)
+            else:
+                self._by_chip.setdefault(bytes(chip_id), []).append(vek)
+
+    """
+    Load the certificates of a directory: ark.pem, ask.pem (or asvk.pem) and every other
+    certificate as a VCEK/VLEK (vcek.pem as written by snpguest, or one per chip)
+    @param certs_dir: Certificate directory
+    @return: SnpVerifier
+    """
+    @classmethod
+    def from_directory(cls, certs_dir):
+        ark = load_certificate(os.path.join(certs_dir, "ark.pem"))
+        ask_path = os.path.join(certs_dir, "ask.pem")
+        if not os.path.exists(ask_path):
+            ask_path = os.path.join(certs_dir, "asvk.pem")
+        ask = load_certificate(ask_path)
+        veks = []
+        for path in sorted(glob.glob(os.path.join(certs_dir, "*.pem")) + glob.glob(os.path.join(certs_dir, "*.der"))):
+            if os.path.basename(path) not in ("ark.pem", "ask.pem", "asvk.pem"):
+                veks.append(load_certificate(path))
+        if not veks:
+            raise Exception(f"No VCEK or VLEK certificate found in {certs_dir}")
+        return cls(ark, ask, veks)
+
+    """
+    Find the VCEKs that may have signed a report
+    @param report: SnpReport
+    @return: Candidate certificates
+    """
+    def candidates(self, report):
+        chip_id = bytes(report.chip_id)
+        # Turin VCEKs carry only the first 8 bytes of the chip ID
+        vcek = self._by_chip.get(chip_id) or self._by_chip.get(chip_id[:TURIN_HW_ID_SIZE], [])
+        return vcek + self._unindexed
+
+    """
+    Check a report, raising an exception that names the first failed check
+    @param report: SnpReport
+    @param report_data: Expected REPORT_DATA in bytes, or None to skip the check
+    @param measurement: Expected MEASUREMENT in bytes, or None to skip the check
+    """
+    def check(self, report, report_data=None, measurement=None):
+        for vek in self.candidates(report):
+            if verify_report_signature(report, vek):
+                break
+        else:
+            raise Exception("Report signature does not verify with any VCEK/VLEK")
+
+        expected_tcb = vcek_tcb(vek)
+        if expected_tcb:
+            reported_tcb = report.reported_tcb_parts()
+            for name, spl in expected_tcb.items():
+                if name in reported_tcb and reported_tcb[name] != spl:
+                    raise Exception(f"Reported TCB {name} SPL {reported_tcb[name]} does not match the VCEK ({spl})")
+
+        if report_data is not None and report.report_data != report_data:
+            raise Exception("REPORT_DATA does not match")
+        if measurement is not None and report.measurement != measurement:
+            raise Exception("MEASUREMENT does not match")
+
+    """
+    Verify a report
+    @param report_bytes: Report in bytes
+    @param report_data: Expected REPORT_DATA in bytes, or None to skip the check
+    @param measurement: Expected MEASUREMENT in bytes, or None to skip the check
+    @return: True if the report is valid, False otherwise
+    """
+    def verify(self, report_bytes, report_data=None, measurement=None):
+        try:
+            self.check(SnpReport(report_bytes), report_data, measurement)
+            return True
+        except Exception:
+            return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse and verify an SEV-SNP attestation report")
+    parser.add_argument("report", help="Attestation report (report.bin)")
+    parser.add_argument("--certs", default="certs", help="Directory with ark.pem, ask.pem and vcek.pem")
+    parser.add_argument("--report-data", help="File with the expected REPORT_DATA (e.g. request-file.bin)")
+    parser.add_argument("--measurement", help="Expected MEASUREMENT in hex")
+    args = parser.parse_args()
+
+    report = SnpReport.from_file(args.report)
+    for name, value in report.summary().items():
+        print(f"{name}: {value}")
+
+    report_data = None
+    if args.report_data:
+        with open(args.report_data, 'rb') as f:
+            report_data = f.read()
+    measurement = bytes.fromhex(args.measurement) if args.measurement else None
+
+    try:
+        SnpVerifier.from_directory(args.certs).check(report, report_data, measurement)
+    except Exception as e:
+        print(f"❌ Verification failed: {e}")
+        return 1
+    print("✅ Verification successful.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
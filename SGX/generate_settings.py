@@ -1,17 +1,39 @@
 #!/usr/bin/env python3
 """
-Interactive script to generate settings_client.ini with user input
+Interactive script to generate settings_client.ini with user input,
+or with --batch, settings files for a directory of signed enclaves
 """
 
+import argparse
+import hashlib
+import mmap
+import os
+import struct
 import sys
 import subprocess
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Get the project root
 PROJECT_ROOT = Path(__file__).parent
 SETTINGS_FILE = PROJECT_ROOT / "settings_client.ini"
 MREXTRACT_PATH = PROJECT_ROOT / "subtools" / "mr-extract" / "mr-extract"
+ENCLAVE_FILE = PROJECT_ROOT / "enclave.signed.so"
+SIGNED_ENCLAVE_SUFFIX = ".signed.so"
+DEFAULT_MAA_API_VERSION = "2025-06-01"
+
+# Signed enclave metadata (SGX SDK metadata.h): the ".note.sgxmeta" ELF note "sgx_metadata"
+# holds metadata_t, whose enclave_css field is the SIGSTRUCT
+METADATA_SECTION = b".note.sgxmeta"
+METADATA_MAGIC = struct.pack("<Q", 0x86A80294635D0E4C)
+METADATA_CSS_OFFSET = 64
+SIGSTRUCT_SIZE = 1808
+SIGSTRUCT_HEADER = bytes.fromhex("06000000e100000000000100")
+SIGSTRUCT_MODULUS = (128, 384)  # Little-endian RSA-3072 modulus
+SIGSTRUCT_ENCLAVE_HASH = (960, 32)  # MRENCLAVE
+SIGSTRUCT_ISV_PROD_ID_OFFSET = 1024
+SIGSTRUCT_ISV_SVN_OFFSET = 1026
 
 
 def get_user_input(prompt, required=False, default=None):
@@ -36,6 +58,14 @@ def get_user_input(prompt, required=False, default=None):
 
 def try_extract_measurements():
     """Try to extract MRENCLAVE and MRSIGNER from signed enclave image"""
+    if ENCLAVE_FILE.exists():
+        try:
+            measurements = read_sigstruct(ENCLAVE_FILE)
+            return measurements['mrenclave'], measurements['mrsigner']
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Could not read the SIGSTRUCT of {ENCLAVE_FILE}: {e}", file=sys.stderr)
+
+    # Fall back to mr-extract (SGX SDK's sgx_sign)
     if not MREXTRACT_PATH.exists():
         return None, None
     
@@ -73,6 +103,79 @@ def try_extract_measurements():
     return None, None
 
 
+def find_metadata(image):
+    """Find the offset of metadata_t in a signed enclave image (ELF64)"""
+    if image[:4] != b"\x7fELF":
+        raise ValueError("not an ELF file")
+    try:
+        return find_metadata_section(image)
+    except struct.error as e:
+        # A header or section table points past the end of the file
+        raise ValueError(f"truncated or corrupt ELF file ({e})") from e
+
+
+def find_metadata_section(image):
+    """Find the offset of metadata_t from the ELF section headers, or by its magic number"""
+    shoff, = struct.unpack_from("<Q", image, 0x28)
+    shentsize, shnum, shstrndx = struct.unpack_from("<HHH", image, 0x3A)
+    if shoff and shstrndx < shnum:
+        strtab_offset, = struct.unpack_from("<Q", image, shoff + shstrndx * shentsize + 24)
+        for i in range(shnum):
+            header = shoff + i * shentsize
+            name_offset, = struct.unpack_from("<I", image, header)
+            name_start = strtab_offset + name_offset
+            if image[name_start:name_start + len(METADATA_SECTION) + 1] != METADATA_SECTION + b"\0":
+                continue
+            section_offset, = struct.unpack_from("<Q", image, header + 24)
+            # ELF note: namesz, descsz, type, name (4-byte aligned), desc
+            name_size, = struct.unpack_from("<I", image, section_offset)
+            return section_offset + 12 + (name_size + 3) // 4 * 4
+
+    # No section headers: look for the metadata magic number instead
+    offset = image.find(METADATA_MAGIC)
+    if offset < 0:
+        raise ValueError("no SGX metadata found (is the enclave signed?)")
+    return offset
+
+
+def read_sigstruct(enclave_path):
+    """Read MRENCLAVE, MRSIGNER, ISVPRODID and ISVSVN from the SIGSTRUCT of a signed enclave"""
+    with open(enclave_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            css = find_metadata(image) + METADATA_CSS_OFFSET
+            sigstruct = image[css:css + SIGSTRUCT_SIZE]
+
+    if len(sigstruct) != SIGSTRUCT_SIZE or sigstruct[:len(SIGSTRUCT_HEADER)] != SIGSTRUCT_HEADER:
+        raise ValueError("invalid SIGSTRUCT header")
+    offset, size = SIGSTRUCT_ENCLAVE_HASH
+    mrenclave = sigstruct[offset:offset + size].hex()
+    offset, size = SIGSTRUCT_MODULUS
+    mrsigner = hashlib.sha256(sigstruct[offset:offset + size]).hexdigest()
+    isv_prod_id, = struct.unpack_from("<H", sigstruct, SIGSTRUCT_ISV_PROD_ID_OFFSET)
+    isv_svn, = struct.unpack_from("<H", sigstruct, SIGSTRUCT_ISV_SVN_OFFSET)
+    return {
+        'mrenclave': mrenclave,
+        'mrsigner': mrsigner,
+        'isv_prod_id': isv_prod_id,
+        'isv_svn': isv_svn,
+    }
+
+
+def render_settings(maa_url, maa_api_version, client_id, minimum_isvsvn, required_isv_prod_id,
+                    mrenclave, mrsigner, skip_mrenclave_check):
+    """Render the content of settings_client.ini"""
+    return f"""[client]
+MAA_URL = {maa_url}
+MAA_API_VERSION = {maa_api_version}
+CLIENT_ID = {client_id}
+MINIMUM_ISVSVN = {minimum_isvsvn}
+REQUIRED_ISV_PROD_ID = {required_isv_prod_id}
+REQUIRED_MRENCLAVE = {mrenclave}
+REQUIRED_MRSIGNER = {mrsigner}
+SKIP_MRENCLAVE_CHECK = {skip_mrenclave_check}
+"""
+
+
 def generate_settings_file():
     """Generate settings_client.ini interactively"""
     print("=" * 60)
@@ -86,7 +189,7 @@ def generate_settings_file():
     maa_url = get_user_input("MAA_URL (required)", required=True)
     
     # Get MAA_API_VERSION (default: 2025-06-01)
-    maa_api_version = get_user_input("MAA_API_VERSION", default="2025-06-01")
+    maa_api_version = get_user_input("MAA_API_VERSION", default=DEFAULT_MAA_API_VERSION)
     
     # Get CLIENT_ID (default: 0)
     client_id = get_user_input("CLIENT_ID", default="0")
@@ -131,16 +234,8 @@ def generate_settings_file():
             print("WARNING: MRSIGNER should be 64 hexadecimal characters", file=sys.stderr)
     
     # Generate the settings file content
-    settings_content = f"""[client]
-MAA_URL = {maa_url}
-MAA_API_VERSION = {maa_api_version}
-CLIENT_ID = {client_id}
-MINIMUM_ISVSVN = {minimum_isvsvn}
-REQUIRED_ISV_PROD_ID = {required_isv_prod_id}
-REQUIRED_MRENCLAVE = {mrenclave}
-REQUIRED_MRSIGNER = {mrsigner}
-SKIP_MRENCLAVE_CHECK = {skip_mrenclave_check}
-"""
+    settings_content = render_settings(maa_url, maa_api_version, client_id, minimum_isvsvn, required_isv_prod_id,
+                                       mrenclave, mrsigner, skip_mrenclave_check)
     
     # Check if file already exists
     if SETTINGS_FILE.exists():
@@ -161,8 +256,101 @@ SKIP_MRENCLAVE_CHECK = {skip_mrenclave_check}
         return 1
 
 
+def settings_path_for(enclave_path, enclaves_dir, out_dir):
+    """Output path of the settings file of an enclave: <out>/<subdirectory>[/<name>]/settings_client.ini"""
+    relative = enclave_path.relative_to(enclaves_dir)
+    directory = Path(out_dir) / relative.parent
+    if relative.name != ENCLAVE_FILE.name:
+        directory = directory / relative.name[:-len(SIGNED_ENCLAVE_SUFFIX)]
+    return directory / SETTINGS_FILE.name
+
+
+def find_duplicate_settings(enclave_paths, enclaves_dir, out_dir):
+    """Find the settings files that more than one enclave would be written to"""
+    seen = {}
+    duplicates = []
+    for enclave_path in enclave_paths:
+        settings_path = settings_path_for(enclave_path, enclaves_dir, out_dir).resolve()
+        if settings_path in seen:
+            duplicates.append(f"{settings_path} is the settings file of {seen[settings_path]} and {enclave_path}")
+        else:
+            seen[settings_path] = enclave_path
+    return duplicates
+
+
+def generate_batch(enclaves_dir, out_dir, args):
+    """Generate settings_client.ini for every signed enclave (*.signed.so) under a directory"""
+    enclaves_dir = Path(enclaves_dir)
+    enclave_paths = sorted(enclaves_dir.rglob("*" + SIGNED_ENCLAVE_SUFFIX))
+    if not enclave_paths:
+        print(f"ERROR: No *{SIGNED_ENCLAVE_SUFFIX} found in {enclaves_dir}", file=sys.stderr)
+        return 1
+    # Two enclaves sharing a settings file would overwrite each other's measurements
+    duplicates = find_duplicate_settings(enclave_paths, enclaves_dir, out_dir)
+    if duplicates:
+        for duplicate in duplicates:
+            print(f"ERROR: {duplicate}", file=sys.stderr)
+        print("No settings files were written.", file=sys.stderr)
+        return 1
+
+    def generate(enclave_path):
+        measurements = read_sigstruct(enclave_path)
+        settings_path = settings_path_for(enclave_path, enclaves_dir, out_dir)
+        settings_path.parent.mkdir(parents=True, exist_ok=True)
+        content = render_settings(
+            args.maa_url, args.maa_api_version, args.client_id,
+            measurements['isv_svn'] if args.minimum_isvsvn is None else args.minimum_isvsvn,
+            measurements['isv_prod_id'] if args.isv_prod_id is None else args.isv_prod_id,
+            measurements['mrenclave'], measurements['mrsigner'], args.skip_mrenclave_check,
+        )
+        tmp_path = settings_path.with_name(settings_path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, settings_path)
+        return settings_path, measurements
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [(path, executor.submit(generate, path)) for path in enclave_paths]
+        for enclave_path, future in futures:
+            try:
+                settings_path, measurements = future.result()
+                print(f"✓ {enclave_path} -> {settings_path} (MRENCLAVE {measurements['mrenclave'][:16]}...)")
+            except Exception as e:
+                failures += 1
+                print(f"ERROR: {enclave_path}: {e}", file=sys.stderr)
+
+    print(f"\nGenerated {len(enclave_paths) - failures} of {len(enclave_paths)} settings files in {out_dir}")
+    return 0 if failures == 0 else 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate settings_client.ini (interactive unless --batch is given)")
+    parser.add_argument("--batch", metavar="DIR", help="Directory of signed enclaves (*.signed.so, searched recursively)")
+    parser.add_argument("--out-dir", default="settings", help="Output directory of the batch mode")
+    parser.add_argument("--maa-url", help="MAA_URL (required with --batch)")
+    parser.add_argument("--maa-api-version", default=DEFAULT_MAA_API_VERSION, help="MAA_API_VERSION")
+    parser.add_argument("--client-id", default="0", help="CLIENT_ID")
+    parser.add_argument("--minimum-isvsvn", help="MINIMUM_ISVSVN (default: ISVSVN of each enclave)")
+    parser.add_argument("--isv-prod-id", help="REQUIRED_ISV_PROD_ID (default: ISVPRODID of each enclave)")
+    parser.add_argument("--skip-mrenclave-check", default="0", help="SKIP_MRENCLAVE_CHECK")
+    parser.add_argument("--workers", type=int, default=None, help="Number of parallel workers")
+    parser.add_argument("--show", metavar="ENCLAVE", help="Print the measurements of a signed enclave and exit")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     try:
+        if args.show:
+            for name, value in read_sigstruct(args.show).items():
+                print(f"{name.upper()}: {value}")
+            return 0
+        if args.batch:
+            if not args.maa_url:
+                print("ERROR: --maa-url is required with --batch", file=sys.stderr)
+                return 1
+            return generate_batch(args.batch, args.out_dir, args)
         return generate_settings_file()
     except KeyboardInterrupt:
         print("\n\nCancelled by user.")
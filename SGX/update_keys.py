@@ -1,198 +1,294 @@
 #!/usr/bin/env python3
 """
-Generate Client's ECDSA key pair and automatically hardcode the public and private keys
+Generate Client's ECDSA key pair and automatically hardcode the public and private keys,
+for one Humane-RAFW-MAA tree or for many client/server tree pairs at once
 """
 
-import subprocess
+import argparse
+import datetime
+import hashlib
+import json
+import os
 import re
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from cryptography.hazmat.primitives.asymmetric import ec
+
 # Get the project root
 PROJECT_ROOT = Path(__file__).parent
-KEYGEN_PATH = PROJECT_ROOT / "subtools" / "client-ecdsa-keygen" / "keygen"
-PUBKEY_FILE = PROJECT_ROOT / "Server_Enclave" / "client_pubkey.hpp"
-PRIVKEY_FILE = PROJECT_ROOT / "Client_App" / "client_app.cpp"
-
-# Line numbers (1-based) for key insertion
-PUBKEY_GX_LINES = [12, 13, 14, 15]  # Lines 12-15 for gx
-PUBKEY_GY_LINES = [18, 19, 20, 21]  # Lines 18-21 for gy
-PRIVKEY_LINES = [30, 31, 32, 33]    # Lines 30-33 for private key
-
-
-def run_keygen():
-    """Generate Client's ECDSA key pair with keygen"""
-    if not KEYGEN_PATH.exists():
-        print(f"ERROR: {KEYGEN_PATH} not found", file=sys.stderr)
-        sys.exit(1)
-    
-    print("Generating Client's ECDSA key pair with keygen...")
-    result = subprocess.run(
-        [str(KEYGEN_PATH)],
-        capture_output=True,
-        text=True,
-        cwd=PROJECT_ROOT
-    )
-    
-    if result.returncode != 0:
-        print("ERROR: Failed to execute keygen", file=sys.stderr)
-        print(result.stderr, file=sys.stderr)
-        sys.exit(1)
-    
-    return result.stdout
-
-
-def extract_public_key(output):
-    """Extract the public key (g_x, g_y) from the output"""
-    pattern = r'Copy the following public keys.*?\n\n\t\{' \
-              r'((?:\s*0x[0-9a-f]{2},.*?\n)*?)\s*\},' \
-              r'\s*\{' \
-              r'((?:\s*0x[0-9a-f]{2},.*?\n)*?)\s*\}'
-    
-    match = re.search(pattern, output, re.DOTALL)
-    if not match:
-        print("ERROR: Failed to extract the public key", file=sys.stderr)
-        sys.exit(1)
-    
-    gx_block = match.group(1).strip()
-    gy_block = match.group(2).strip()
-    
-    # Extract all hex bytes and format as 4 lines of 8 bytes each
-    gx_bytes = re.findall(r'0x[0-9a-f]{2}', gx_block)
-    gy_bytes = re.findall(r'0x[0-9a-f]{2}', gy_block)
-    
-    if len(gx_bytes) != 32 or len(gy_bytes) != 32:
-        print(f"ERROR: Expected 32 bytes for each key, got gx={len(gx_bytes)}, gy={len(gy_bytes)}", file=sys.stderr)
-        sys.exit(1)
-    
-    # Format as 4 lines of 8 bytes each
-    gx_lines = []
-    for i in range(0, 32, 8):
-        line_bytes = gx_bytes[i:i+8]
-        line = ', '.join(line_bytes)
-        if i + 8 < 32:
-            line += ','
-        gx_lines.append('            ' + line)
-    
-    gy_lines = []
-    for i in range(0, 32, 8):
-        line_bytes = gy_bytes[i:i+8]
-        line = ', '.join(line_bytes)
-        if i + 8 < 32:
-            line += ','
-        gy_lines.append('            ' + line)
-    
-    return gx_lines, gy_lines
-
-
-def extract_private_key(output):
-    """Extract the private key from the output"""
-    key_start = output.find("Copy the following private key")
-    if key_start < 0:
-        print("ERROR: Could not find 'Copy the following private key' in output", file=sys.stderr)
-        sys.exit(1)
-    
-    section = output[key_start:]
-    blank_line_pos = section.find('\n\n\t')
-    if blank_line_pos < 0:
-        print("ERROR: Could not find private key data section", file=sys.stderr)
-        sys.exit(1)
-    
-    privkey_section = section[blank_line_pos + 3:]
-    end_pos = privkey_section.find('\n\n')
-    if end_pos >= 0:
-        privkey_text = privkey_section[:end_pos]
-    else:
-        privkey_text = privkey_section.rstrip('\n')
-    
-    bytes_list = re.findall(r'0x[0-9a-f]{2}', privkey_text)
-    
-    if len(bytes_list) != 32:
-        print(f"ERROR: Expected 32 bytes, got {len(bytes_list)}", file=sys.stderr)
-        sys.exit(1)
-    
-    # Format as 4 lines of 8 bytes each
-    lines = []
-    for i in range(0, 32, 8):
-        line_bytes = bytes_list[i:i+8]
-        line = ', '.join(line_bytes)
-        if i + 8 < 32:
-            line += ','
-        lines.append('        ' + line)
-    
-    return lines
-
-
-def update_public_key_file(gx_lines, gy_lines):
-    """Update the public key in Server_Enclave/client_pubkey.hpp at lines 12-15 and 18-21"""
-    if not PUBKEY_FILE.exists():
-        print(f"ERROR: {PUBKEY_FILE} not found", file=sys.stderr)
-        sys.exit(1)
-    
-    with open(PUBKEY_FILE, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    if len(lines) < max(PUBKEY_GY_LINES):
-        print(f"ERROR: File has only {len(lines)} lines, need at least {max(PUBKEY_GY_LINES)}", file=sys.stderr)
-        sys.exit(1)
-    
-    # Update gx lines (12-15, 0-indexed: 11-14)
-    for i, line_num in enumerate(PUBKEY_GX_LINES):
-        lines[line_num - 1] = gx_lines[i] + '\n'
-    
-    # Update gy lines (18-21, 0-indexed: 17-20)
-    for i, line_num in enumerate(PUBKEY_GY_LINES):
-        lines[line_num - 1] = gy_lines[i] + '\n'
-    
-    with open(PUBKEY_FILE, 'w', encoding='utf-8') as f:
-        f.writelines(lines)
-    
-    print(f"✓ Updated {PUBKEY_FILE} (lines {PUBKEY_GX_LINES[0]}-{PUBKEY_GX_LINES[-1]} and {PUBKEY_GY_LINES[0]}-{PUBKEY_GY_LINES[-1]})")
-    return True
-
-
-def update_private_key_file(privkey_lines):
-    """Update the private key in Client_App/client_app.cpp at lines 30-33"""
-    if not PRIVKEY_FILE.exists():
-        print(f"ERROR: {PRIVKEY_FILE} not found", file=sys.stderr)
-        sys.exit(1)
-    
-    with open(PRIVKEY_FILE, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    if len(lines) < max(PRIVKEY_LINES):
-        print(f"ERROR: File has only {len(lines)} lines, need at least {max(PRIVKEY_LINES)}", file=sys.stderr)
-        sys.exit(1)
-    
-    # Update private key lines (30-33, 0-indexed: 29-32)
-    for i, line_num in enumerate(PRIVKEY_LINES):
-        lines[line_num - 1] = privkey_lines[i] + '\n'
-    
-    with open(PRIVKEY_FILE, 'w', encoding='utf-8') as f:
-        f.writelines(lines)
-    
-    print(f"✓ Updated {PRIVKEY_FILE} (lines {PRIVKEY_LINES[0]}-{PRIVKEY_LINES[-1]})")
-    return True
+PUBKEY_FILE = Path("Server_Enclave") / "client_pubkey.hpp"
+PRIVKEY_FILE = Path("Client_App") / "client_app.cpp"
+MANIFEST_FILE = "key-rotation-manifest.json"
+
+# The key arrays are found by name, so the files may be reformatted freely
+PUBKEY_MARKER = "client_signature_public_key"
+PRIVKEY_MARKER = "g_client_signature_private_key"
+KEY_SIZE = 32  # bytes per coordinate / scalar (P-256)
+HEX_BYTE = re.compile(r'0x[0-9a-fA-F]{2}')
+BACKUP_SUFFIX = ".keyrot.bak"
+TMP_SUFFIX = ".keyrot.tmp"
+
+
+def generate_key_pair():
+    """Generate a P-256 key pair in the SGX SDK layout (little-endian gx, gy and private key)"""
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    numbers = private_key.private_numbers()
+    return {
+        'gx': numbers.public_numbers.x.to_bytes(KEY_SIZE, 'little'),
+        'gy': numbers.public_numbers.y.to_bytes(KEY_SIZE, 'little'),
+        'private': numbers.private_value.to_bytes(KEY_SIZE, 'little'),
+    }
+
+
+def public_key_from_private(private_bytes):
+    """Derive (gx, gy) in the SGX SDK layout from a little-endian private key"""
+    private_key = ec.derive_private_key(int.from_bytes(private_bytes, 'little'), ec.SECP256R1())
+    numbers = private_key.public_key().public_numbers()
+    return numbers.x.to_bytes(KEY_SIZE, 'little'), numbers.y.to_bytes(KEY_SIZE, 'little')
+
+
+def fingerprint(gx, gy):
+    """SHA-256 fingerprint of a public key (uncompressed point, big-endian coordinates)"""
+    return hashlib.sha256(b"\x04" + gx[::-1] + gy[::-1]).hexdigest()
+
+
+def key_byte_spans(text, marker, skip, count):
+    """Find the spans of `count` hex bytes in the initializer of `marker`, after skipping `skip` bytes"""
+    marker_pos = re.search(r'\b' + re.escape(marker) + r'\b', text)
+    if not marker_pos:
+        raise ValueError(f"'{marker}' not found")
+    start = text.find('=', marker_pos.end())
+    end = text.find(';', start)
+    if start < 0 or end < 0:
+        raise ValueError(f"Initializer of '{marker}' not found")
+    spans = [m.span() for m in HEX_BYTE.finditer(text, start, end)]
+    if len(spans) < skip + count:
+        raise ValueError(f"'{marker}' has {len(spans)} bytes, need at least {skip + count}")
+    return spans[skip:skip + count]
+
+
+def read_key_bytes(text, marker, skip, count):
+    """Read `count` key bytes from the initializer of `marker`"""
+    return bytes(int(text[a + 2:b], 16) for a, b in key_byte_spans(text, marker, skip, count))
+
+
+def patch_key_bytes(text, marker, skip, new_bytes):
+    """Replace key bytes in the initializer of `marker`, keeping the surrounding formatting"""
+    parts = []
+    last = 0
+    for (a, b), value in zip(key_byte_spans(text, marker, skip, len(new_bytes)), new_bytes):
+        parts.append(text[last:a])
+        parts.append(f"0x{value:02x}")
+        last = b
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def parse_tree_pair(spec):
+    """Parse a tree pair: ROOT (both files in one tree) or CLIENT_ROOT:SERVER_ROOT"""
+    client_root, _, server_root = spec.partition(":")
+    return Path(client_root), Path(server_root or client_root)
+
+
+def prepare_rotation(client_root, server_root, client_id):
+    """Generate a key for a tree pair and write the patched files next to the originals"""
+    pubkey_path = server_root / PUBKEY_FILE
+    privkey_path = client_root / PRIVKEY_FILE
+    pubkey_text = pubkey_path.read_text(encoding='utf-8')
+    privkey_text = privkey_path.read_text(encoding='utf-8')
+
+    # Client i's public key is element i of the array: gx then gy
+    skip = client_id * 2 * KEY_SIZE
+    old_key = read_key_bytes(pubkey_text, PUBKEY_MARKER, skip, 2 * KEY_SIZE)
+    key = generate_key_pair()
+    new_pubkey_text = patch_key_bytes(pubkey_text, PUBKEY_MARKER, skip, key['gx'] + key['gy'])
+    new_privkey_text = patch_key_bytes(privkey_text, PRIVKEY_MARKER, 0, key['private'])
+
+    # Read the patched key back, so a file the markers do not describe is never written
+    if read_key_bytes(new_pubkey_text, PUBKEY_MARKER, skip, 2 * KEY_SIZE) != key['gx'] + key['gy'] or \
+            read_key_bytes(new_privkey_text, PRIVKEY_MARKER, 0, KEY_SIZE) != key['private']:
+        raise ValueError("Patched key does not read back")
+
+    writes = []
+    try:
+        for path, text in ((pubkey_path, new_pubkey_text), (privkey_path, new_privkey_text)):
+            # A unique name per run, next to the original so the final replace stays on one filesystem
+            fd, tmp_name = tempfile.mkstemp(prefix=path.name + ".", suffix=TMP_SUFFIX, dir=path.parent)
+            tmp_path = Path(tmp_name)
+            writes.append((tmp_path, path))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            shutil.copymode(path, tmp_path)
+    except Exception:
+        for tmp_path, _ in writes:
+            tmp_path.unlink(missing_ok=True)
+        raise
+
+    return {
+        'client_tree': str(client_root),
+        'server_tree': str(server_root),
+        'client_id': client_id,
+        'old_fingerprint': fingerprint(old_key[:KEY_SIZE], old_key[KEY_SIZE:]),
+        'fingerprint': fingerprint(key['gx'], key['gy']),
+    }, writes
+
+
+def apply_writes(writes):
+    """Move the patched files into place; if any move fails, restore every file from its backup"""
+    backups = []
+    try:
+        # Back up every original before replacing any of them
+        for _, path in writes:
+            fd, backup_name = tempfile.mkstemp(prefix=path.name + ".", suffix=BACKUP_SUFFIX, dir=path.parent)
+            os.close(fd)
+            shutil.copy2(path, backup_name)
+            backups.append((Path(backup_name), path))
+        for tmp_path, path in writes:
+            os.replace(tmp_path, path)
+    except Exception:
+        for backup_path, path in backups:
+            os.replace(backup_path, path)
+        for tmp_path, _ in writes:
+            tmp_path.unlink(missing_ok=True)
+        raise
+    for backup_path, _ in backups:
+        backup_path.unlink()
+
+
+def find_duplicate_files(tree_pairs):
+    """Find the key files targeted by more than one tree pair (after resolving the paths)"""
+    seen = {}
+    duplicates = []
+    for client_root, server_root in tree_pairs:
+        for path in ((server_root / PUBKEY_FILE).resolve(), (client_root / PRIVKEY_FILE).resolve()):
+            if path in seen:
+                duplicates.append(f"{path} is targeted by {seen[path]} and {client_root}:{server_root}")
+            else:
+                seen[path] = f"{client_root}:{server_root}"
+    return duplicates
+
+
+def rotate_keys(tree_pairs, client_id=0, workers=None, manifest_path=MANIFEST_FILE):
+    """Rotate the client key of many tree pairs: prepare all in parallel, then apply all or none"""
+    # Two pairs patching the same file would overwrite each other's key
+    duplicates = find_duplicate_files(tree_pairs)
+    if duplicates:
+        for duplicate in duplicates:
+            print(f"ERROR: {duplicate}", file=sys.stderr)
+        print("No files were modified.", file=sys.stderr)
+        return None
+
+    entries = []
+    writes = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [(pair, executor.submit(prepare_rotation, pair[0], pair[1], client_id)) for pair in tree_pairs]
+        for (client_root, server_root), future in futures:
+            try:
+                entry, pair_writes = future.result()
+                entries.append(entry)
+                writes.extend(pair_writes)
+            except Exception as e:
+                errors.append(f"{client_root}:{server_root}: {e}")
+
+    if errors:
+        for tmp_path, _ in writes:
+            tmp_path.unlink(missing_ok=True)
+        for error in errors:
+            print(f"ERROR: {error}", file=sys.stderr)
+        print("No files were modified.", file=sys.stderr)
+        return None
+
+    try:
+        apply_writes(writes)
+    except Exception as e:
+        print(f"ERROR: Failed to write the patched files: {e}", file=sys.stderr)
+        print("All files were restored.", file=sys.stderr)
+        return None
+    manifest = {
+        'rotated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'pairs': entries,
+    }
+    tmp_manifest = f"{manifest_path}{TMP_SUFFIX}"
+    with open(tmp_manifest, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, manifest_path)
+    return manifest
+
+
+def check_pair(client_root, server_root, client_id):
+    """Check that the server's public key matches the client's private key; return its fingerprint"""
+    pubkey_text = (server_root / PUBKEY_FILE).read_text(encoding='utf-8')
+    privkey_text = (client_root / PRIVKEY_FILE).read_text(encoding='utf-8')
+    public = read_key_bytes(pubkey_text, PUBKEY_MARKER, client_id * 2 * KEY_SIZE, 2 * KEY_SIZE)
+    gx, gy = public_key_from_private(read_key_bytes(privkey_text, PRIVKEY_MARKER, 0, KEY_SIZE))
+    if public != gx + gy:
+        raise ValueError("Server public key does not match the client private key")
+    return fingerprint(gx, gy)
+
+
+def verify_manifest(manifest_path):
+    """Check every tree pair of a manifest against its recorded fingerprint"""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    failures = 0
+    for entry in manifest['pairs']:
+        name = f"{entry['client_tree']}:{entry['server_tree']}"
+        try:
+            if check_pair(Path(entry['client_tree']), Path(entry['server_tree']), entry['client_id']) != entry['fingerprint']:
+                raise ValueError("fingerprint differs from the manifest")
+            print(f"✓ {name}")
+        except Exception as e:
+            failures += 1
+            print(f"ERROR: {name}: {e}", file=sys.stderr)
+    return 0 if failures == 0 else 1
+
+
+def non_negative_int(value):
+    """argparse type of an index: an integer >= 0"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not an integer")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is negative")
+    return number
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate Client's ECDSA key pair and hardcode it into client/server trees")
+    parser.add_argument("trees", nargs="*",
+                        help="Tree pairs: ROOT (Client_App and Server_Enclave in one tree) or CLIENT_ROOT:SERVER_ROOT "
+                             "(default: the directory of this script)")
+    parser.add_argument("--client-id", type=non_negative_int, default=0, help="Index of the key in client_signature_public_key (CLIENT_ID)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of parallel workers")
+    parser.add_argument("--manifest", default=MANIFEST_FILE, help="Manifest of the key fingerprints (JSON)")
+    parser.add_argument("--verify", action="store_true", help="Check the trees of the manifest instead of rotating")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    if args.verify:
+        return verify_manifest(args.manifest)
+
     print("ECDSA key pair generation and automatic hardcode script")
     print("=" * 50)
-    
-    # Execute keygen
-    output = run_keygen()
-    
-    # Extract the public and private keys
-    print("Extracting key information...")
-    gx_lines, gy_lines = extract_public_key(output)
-    privkey_lines = extract_private_key(output)
-    
-    # Update the files
-    print("\nUpdating files...")
-    update_public_key_file(gx_lines, gy_lines)
-    update_private_key_file(privkey_lines)
-    
-    print("\n✓ All updates completed successfully!")
+    tree_pairs = [parse_tree_pair(spec) for spec in args.trees] or [(PROJECT_ROOT, PROJECT_ROOT)]
+    print(f"Rotating the client key of {len(tree_pairs)} tree pair(s)...")
+    manifest = rotate_keys(tree_pairs, args.client_id, args.workers, args.manifest)
+    if manifest is None:
+        return 1
+
+    for entry in manifest['pairs']:
+        print(f"✓ {entry['client_tree']}:{entry['server_tree']} -> {entry['fingerprint'][:16]}...")
+    print(f"\n✓ All updates completed successfully! Manifest saved to: {args.manifest}")
     return 0
 
 
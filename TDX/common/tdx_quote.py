@@ -0,0 +1,426 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from collections import Counter
+from pathlib import Path
+
+# Quote layout (Intel TDX DCAP Quoting Library API, Appendix A "Quote Format")
+HEADER_FORMAT = struct.Struct("<HHIHH16s20s")  # version, att_key_type, tee_type, qe_svn, pce_svn, qe_vendor_id, user_data
+HEADER_SIZE = HEADER_FORMAT.size  # 48
+BODY_DESCRIPTOR_FORMAT = struct.Struct("<HI")  # Version 5: body type, body size
+SIGNATURE_DATA_LENGTH_FORMAT = struct.Struct("<I")
+CERT_DATA_HEADER_FORMAT = struct.Struct("<HI")  # Certification data type, size
+
+TEE_TYPE_SGX = 0x00
+TEE_TYPE_TDX = 0x81
+ATT_KEY_TYPE_ECDSA_P256 = 2
+
+# Version 5 body types
+BODY_TYPE_SGX = 1
+BODY_TYPE_TD10 = 2
+BODY_TYPE_TD15 = 3
+TD10_BODY_SIZE = 584
+TD15_BODY_SIZE = 648
+BODY_SIZES = {BODY_TYPE_TD10: TD10_BODY_SIZE, BODY_TYPE_TD15: TD15_BODY_SIZE}
+
+# TD report body fields: (offset within the body, size)
+TEE_TCB_SVN = (0, 16)
+MR_SEAM = (16, 48)
+MR_SIGNER_SEAM = (64, 48)
+SEAM_ATTRIBUTES_OFFSET = 112
+TD_ATTRIBUTES_OFFSET = 120
+XFAM_OFFSET = 128
+MR_TD = (136, 48)
+MR_CONFIG_ID = (184, 48)
+MR_OWNER = (232, 48)
+MR_OWNER_CONFIG = (280, 48)
+RTMR_OFFSET = 328
+RTMR_SIZE = 48
+RTMR_COUNT = 4
+REPORT_DATA = (520, 64)
+TEE_TCB_SVN2 = (584, 16)  # TD report 1.5 only
+MR_SERVICETD = (600, 48)  # TD report 1.5 only
+
+# Signature data (ECDSA 256-bit quote signature data)
+ECDSA_SIGNATURE_SIZE = 64  # r || s, big-endian
+ATTESTATION_KEY_SIZE = 64  # Raw P-256 public key, x || y
+CERT_TYPE_PCK_CHAIN = 5
+CERT_TYPE_QE_REPORT = 6
+QE_REPORT_SIZE = 384
+
+"""
+Intel TDX quote (version 4 or 5). Sections are located once, then fields are read on access
+from a memoryview over the quote bytes; byte fields are returned as memoryview slices, so
+nothing is copied (use bytes() to keep a field beyond the lifetime of the buffer).
+@param data: Quote in bytes (quote.bin), or a buffer holding it at offset
+@param offset: Offset of the quote in data
+"""
+class TdxQuote:
+    def __init__(self, data, offset=0):
+        view = memoryview(data)
+        (self.version, self.att_key_type, self.tee_type, self.qe_svn, self.pce_svn,
+         self.qe_vendor_id, self.user_data) = HEADER_FORMAT.unpack_from(view, offset)
+        self.body_type, body_offset, self.body_size = _locate_body(view, offset, self.version)
+        if self.tee_type != TEE_TYPE_TDX or self.body_type not in BODY_SIZES:
+            raise Exception(f"Not a TD quote (TEE type {self.tee_type:#x}, body type {self.body_type})")
+
+        signature_offset = body_offset + self.body_size
+        (signature_size,) = SIGNATURE_DATA_LENGTH_FORMAT.unpack_from(view, signature_offset)
+        signature_offset += SIGNATURE_DATA_LENGTH_FORMAT.size
+        self.size = signature_offset + signature_size - offset
+        if offset + self.size > len(view):
+            raise Exception(f"TD quote is truncated ({len(view) - offset} bytes, expected {self.size})")
+
+        self.view = view[offset:offset + self.size]
+        self.body = view[body_offset:body_offset + self.body_size]
+        self.signature_data = view[signature_offset:signature_offset + signature_size]
+        self.signed_bytes = view[offset:body_offset + self.body_size]
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def _field(self, field):
+        offset, size = field
+        return self.body[offset:offset + size]
+
+    def _u64(self, offset):
+        return struct.unpack_from("<Q", self.body, offset)[0]
+
+    @property
+    def tee_tcb_svn(self):
+        return self._field(TEE_TCB_SVN)
+
+    @property
+    def mr_seam(self):
+        return self._field(MR_SEAM)
+
+    @property
+    def mr_signer_seam(self):
+        return self._field(MR_SIGNER_SEAM)
+
+    @property
+    def seam_attributes(self):
+        return self._u64(SEAM_ATTRIBUTES_OFFSET)
+
+    @property
+    def td_attributes(self):
+        return self._u64(TD_ATTRIBUTES_OFFSET)
+
+    @property
+    def xfam(self):
+        return self._u64(XFAM_OFFSET)
+
+    @property
+    def mr_td(self):
+        return self._field(MR_TD)
+
+    @property
+    def mr_config_id(self):
+        return self._field(MR_CONFIG_ID)
+
+    @property
+    def mr_owner(self):
+        return self._field(MR_OWNER)
+
+    @property
+    def mr_owner_config(self):
+        return self._field(MR_OWNER_CONFIG)
+
+    @property
+    def rtmrs(self):
+        return [self.rtmr(i) for i in range(RTMR_COUNT)]
+
+    @property
+    def report_data(self):
+        return self._field(REPORT_DATA)
+
+    @property
+    def tee_tcb_svn2(self):
+        if self.body_type != BODY_TYPE_TD15:
+            return None
+        return self._field(TEE_TCB_SVN2)
+
+    @property
+    def mr_servicetd(self):
+        if self.body_type != BODY_TYPE_TD15:
+            return None
+        return self._field(MR_SERVICETD)
+
+    @property
+    def debug(self):
+        return bool(self.td_attributes & 0x1)
+
+    """
+    Get a runtime measurement register
+    @param index: Register index (0-3)
+    @return: RTMR in bytes (memoryview)
+    """
+    def rtmr(self, index):
+        if not 0 <= index < RTMR_COUNT:
+            raise Exception(f"RTMR index {index} is out of range")
+        offset = RTMR_OFFSET + index * RTMR_SIZE
+        return self.body[offset:offset + RTMR_SIZE]
+
+    """
+    Get the quote signature as (r, s) integers
+    @return: (r, s)
+    """
+    def signature(self):
+        half = ECDSA_SIGNATURE_SIZE // 2
+        return (int.from_bytes(self.signature_data[:half], 'big'),
+                int.from_bytes(self.signature_data[half:ECDSA_SIGNATURE_SIZE], 'big'))
+
+    @property
+    def attestation_key(self):
+        return self.signature_data[ECDSA_SIGNATURE_SIZE:ECDSA_SIGNATURE_SIZE + ATTESTATION_KEY_SIZE]
+
+    """
+    Get the certification data of the signature data
+    @return: (certification data type, data in bytes)
+    """
+    def certification_data(self):
+        return _cert_data(self.signature_data, ECDSA_SIGNATURE_SIZE + ATTESTATION_KEY_SIZE)
+
+    """
+    Get the QE report certification data (type 6): the QE report, its signature by the PCK,
+    the QE authentication data and the PCK certificate chain
+    @return: Dictionary of section name to bytes (memoryview), or None if the quote has no QE report
+    """
+    def qe_report_data(self):
+        cert_type, data = self.certification_data()
+        if cert_type != CERT_TYPE_QE_REPORT:
+            return None
+        offset = QE_REPORT_SIZE + ECDSA_SIGNATURE_SIZE
+        (auth_size,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        sections = {
+            'qe_report': data[:QE_REPORT_SIZE],
+            'qe_report_signature': data[QE_REPORT_SIZE:QE_REPORT_SIZE + ECDSA_SIGNATURE_SIZE],
+            'qe_auth_data': data[offset:offset + auth_size],
+            'pck_cert_chain': None,
+        }
+        inner_type, inner_data = _cert_data(data, offset + auth_size)
+        if inner_type == CERT_TYPE_PCK_CHAIN:
+            sections['pck_cert_chain'] = inner_data
+        return sections
+
+    """
+    Get the main fields in a printable form
+    @return: Dictionary of field name to value (hex strings for byte fields)
+    """
+    def summary(self):
+        summary = {
+            'version': self.version,
+            'body_type': self.body_type,
+            'qe_svn': self.qe_svn,
+            'pce_svn': self.pce_svn,
+            'tee_tcb_svn': self.tee_tcb_svn.hex(),
+            'mr_seam': self.mr_seam.hex(),
+            'td_attributes': f"{self.td_attributes:016x}",
+            'xfam': f"{self.xfam:016x}",
+            'mr_td': self.mr_td.hex(),
+            'mr_config_id': self.mr_config_id.hex(),
+            'mr_owner': self.mr_owner.hex(),
+            'mr_owner_config': self.mr_owner_config.hex(),
+        }
+        for i, rtmr in enumerate(self.rtmrs):
+            summary[f'rtmr{i}'] = rtmr.hex()
+        summary['report_data'] = self.report_data.hex()
+        if self.body_type == BODY_TYPE_TD15:
+            summary['tee_tcb_svn2'] = self.tee_tcb_svn2.hex()
+            summary['mr_servicetd'] = self.mr_servicetd.hex()
+        return summary
+
+"""
+Locate the report body of a quote
+@param view: Buffer holding the quote
+@param offset: Offset of the quote
+@param version: Quote version
+@return: (body type, body offset, body size)
+"""
+def _locate_body(view, offset, version):
+    if version == 4:
+        return BODY_TYPE_TD10, offset + HEADER_SIZE, TD10_BODY_SIZE
+    if version == 5:
+        body_type, body_size = BODY_DESCRIPTOR_FORMAT.unpack_from(view, offset + HEADER_SIZE)
+        return body_type, offset + HEADER_SIZE + BODY_DESCRIPTOR_FORMAT.size, body_size
+    raise Exception(f"Unsupported quote version {version} (expected 4 or 5)")
+
+def _cert_data(view, offset):
+    cert_type, size = CERT_DATA_HEADER_FORMAT.unpack_from(view, offset)
+    offset += CERT_DATA_HEADER_FORMAT.size
+    return cert_type, view[offset:offset + size]
+
+"""
+Find the quotes in a buffer of concatenated quotes (e.g. `cat quotes/*.bin > archive.bin`).
+Only the length fields are read.
+@param buffer: Buffer of concatenated quotes
+@return: List of (quote offset, body type, body offset)
+"""
+def index_quotes(buffer):
+    view = memoryview(buffer)
+    index = []
+    offset = 0
+    while offset < len(view):
+        number = len(index)
+        if len(view) - offset < HEADER_SIZE + BODY_DESCRIPTOR_FORMAT.size:
+            raise ValueError(f"Trailing {len(view) - offset} bytes at offset {offset} are not a quote (quote {number})")
+        (version,) = struct.unpack_from("<H", view, offset)
+        try:
+            body_type, body_offset, body_size = _locate_body(view, offset, version)
+        except Exception as e:
+            raise ValueError(f"Quote {number} at offset {offset}: {e}") from e
+        if body_type not in BODY_SIZES or body_size != BODY_SIZES[body_type]:
+            raise ValueError(f"Quote {number} at offset {offset} is not a TD quote (body type {body_type})")
+        signature_offset = body_offset + body_size
+        if signature_offset + SIGNATURE_DATA_LENGTH_FORMAT.size > len(view):
+            raise ValueError(f"Quote {number} at offset {offset} is truncated")
+        (signature_size,) = SIGNATURE_DATA_LENGTH_FORMAT.unpack_from(view, signature_offset)
+        index.append((offset, body_type, body_offset))
+        offset = signature_offset + SIGNATURE_DATA_LENGTH_FORMAT.size + signature_size
+    if offset > len(view):
+        raise ValueError(f"Quote {len(index) - 1} at offset {index[-1][0]} is truncated")
+    return index
+
+"""
+Get the NumPy structured dtype of a TD report body
+@param body_type: BODY_TYPE_TD10 or BODY_TYPE_TD15
+@return: numpy.dtype
+"""
+def body_dtype(body_type=BODY_TYPE_TD10):
+    import numpy as np
+
+    fields = [
+        ('tee_tcb_svn', 'u1', (16,)),
+        ('mr_seam', 'u1', (48,)),
+        ('mr_signer_seam', 'u1', (48,)),
+        ('seam_attributes', '<u8'),
+        ('td_attributes', '<u8'),
+        ('xfam', '<u8'),
+        ('mr_td', 'u1', (48,)),
+        ('mr_config_id', 'u1', (48,)),
+        ('mr_owner', 'u1', (48,)),
+        ('mr_owner_config', 'u1', (48,)),
+        ('rtmr', 'u1', (RTMR_COUNT, RTMR_SIZE)),
+        ('report_data', 'u1', (64,)),
+    ]
+    if body_type == BODY_TYPE_TD15:
+        fields += [('tee_tcb_svn2', 'u1', (16,)), ('mr_servicetd', 'u1', (48,))]
+    return np.dtype(fields)
+
+"""
+Read the TD report bodies of many concatenated quotes into one NumPy structured array. When the
+quotes are evenly spaced (same signature data size), the array is a strided view over the buffer
+and nothing is copied; otherwise the bodies are gathered in one vectorized copy. Requires NumPy.
+@param buffer: Buffer of concatenated quotes (e.g. an mmap of the archive)
+@param index: Result of index_quotes, or None to index the buffer
+@param body_type: Body type to read; quotes with the other body type are skipped
+@return: Structured array with one record per quote (see body_dtype)
+"""
+def batch_bodies(buffer, index=None, body_type=BODY_TYPE_TD10):
+    import numpy as np
+
+    if index is None:
+        index = index_quotes(buffer)
+    dtype = body_dtype(body_type)
+    offsets = np.fromiter((body_offset for _, kind, body_offset in index if kind == body_type), dtype=np.int64)
+    if len(offsets) == 0:
+        return np.empty(0, dtype=dtype)
+
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    strides = np.diff(offsets)
+    if len(offsets) == 1 or (strides == strides[0]).all():
+        stride = int(strides[0]) if len(strides) else dtype.itemsize
+        return np.ndarray(shape=(len(offsets),), dtype=dtype, buffer=data, offset=int(offsets[0]), strides=(stride,))
+    gathered = data[offsets[:, None] + np.arange(dtype.itemsize)]
+    return gathered.view(dtype).reshape(len(offsets))
+
+"""
+Group quotes by their measurements (MRTD and RTMR0-3), using NumPy when it is installed
+@param buffer: Buffer of concatenated quotes
+@param index: Result of index_quotes, or None to index the buffer
+@return: List of dictionaries of measurement (hex) and quote count, most common first
+"""
+def measurement_groups(buffer, index=None):
+    if index is None:
+        index = index_quotes(buffer)
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    counts = Counter()
+    if np is not None:
+        for body_type in BODY_SIZES:
+            bodies = batch_bodies(buffer, index, body_type)
+            if len(bodies) == 0:
+                continue
+            keys = np.concatenate([bodies['mr_td'], bodies['rtmr'].reshape(len(bodies), -1)], axis=1)
+            # One opaque value per row: sorting those is much faster than np.unique(axis=0)
+            keys = keys.view(np.dtype((np.void, keys.shape[1]))).ravel()
+            unique, group_counts = np.unique(keys, return_counts=True)
+            for key, count in zip(unique, group_counts):
+                counts[key.tobytes()] += int(count)
+    else:
+        view = memoryview(buffer)
+        for offset, _, body_offset in index:
+            key = view[body_offset + MR_TD[0]:body_offset + MR_TD[0] + MR_TD[1]].tobytes() + \
+                  view[body_offset + RTMR_OFFSET:body_offset + RTMR_OFFSET + RTMR_COUNT * RTMR_SIZE].tobytes()
+            counts[key] += 1
+
+    groups = []
+    for key, count in counts.most_common():
+        group = {'mr_td': key[:MR_TD[1]].hex()}
+        for i in range(RTMR_COUNT):
+            start = MR_TD[1] + i * RTMR_SIZE
+            group[f'rtmr{i}'] = key[start:start + RTMR_SIZE].hex()
+        group['count'] = count
+        groups.append(group)
+    return groups
+
+"""
+Open an archive of quotes: a file of concatenated quotes (memory-mapped), or a directory of
+quote files (read into one buffer)
+@param path: Archive path
+@return: Buffer of concatenated quotes
+"""
+def open_archive(path):
+    if os.path.isdir(path):
+        return b"".join(quote_path.read_bytes() for quote_path in sorted(Path(path).glob("*.bin")))
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse Intel TDX quotes (version 4 and 5)")
+    parser.add_argument("quote", help="Quote (quote.bin), or with --batch an archive of concatenated quotes or a directory of quotes")
+    parser.add_argument("--batch", action="store_true", help="Group the quotes of an archive by MRTD and RTMR0-3")
+    parser.add_argument("--out", help="With --batch, write the groups to this file (JSON)")
+    args = parser.parse_args()
+
+    if not args.batch:
+        quote = TdxQuote.from_file(args.quote)
+        for name, value in quote.summary().items():
+            print(f"{name}: {value}")
+        return 0
+
+    buffer = open_archive(args.quote)
+    index = index_quotes(buffer)
+    groups = measurement_groups(buffer, index)
+    print(f"{len(index)} quotes, {len(groups)} distinct measurements")
+    for group in groups:
+        print(f"   {group['count']:>8}  MRTD {group['mr_td'][:16]}...  RTMR0 {group['rtmr0'][:16]}...")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(groups, f, indent=2)
+        print(f"Measurement groups saved to: {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())